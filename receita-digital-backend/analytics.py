@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Consolidação incremental das estatísticas de receitas
+
+Conta as receitas emitidas por dia em cada dimensão (médico, especialidade,
+medicamento e diagnóstico) na tabela ReceitaDiaria e soma os dias de cada
+mês em ReceitaMensal. A rota /api/analytics/receitas responde só a partir
+dessas tabelas: meses inteiros do período vêm de ReceitaMensal e os dias
+soltos das pontas de ReceitaDiaria, então mesmo períodos de vários anos leem
+poucas linhas.
+
+Cada execução processa apenas os dias posteriores ao último dia completo já
+consolidado (o dia atual é sempre recalculado), um mês por transação.
+Receitas inseridas com data de emissão antiga (importações, dados mock) só
+entram com --reconstruir. Quando existe o banco de arquivo (veja
+arquivamento.py), as receitas arquivadas são lidas junto com as do banco
+principal, então --reconstruir refaz também os meses já arquivados.
+
+Exemplos:
+    python analytics.py
+    python analytics.py --reconstruir --db outro.db
+"""
+
+import argparse
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+import arquivamento
+
+TAREFA = 'receitas'
+
+DIMENSOES = ('medico', 'especialidade', 'medicamento', 'diagnostico')
+
+# Contagem de um intervalo [inicio, fim) de dias, por dimensão; esquema é ''
+# para o banco principal e 'arquivo.' para o arquivo
+_CONTAR_DIAS = {
+    'medico': '''SELECT date(r.data_emissao) AS dia, r.id_medico AS chave,
+                        COUNT(*) AS receitas, NULL AS quantidade
+                 FROM {esquema}Receita r
+                 WHERE r.data_emissao >= ? AND r.data_emissao < ?{restricao}
+                 GROUP BY date(r.data_emissao), r.id_medico''',
+    'especialidade': '''SELECT date(r.data_emissao) AS dia,
+                        COALESCE(m.especialidade, 'Não informada') AS chave,
+                        COUNT(*) AS receitas, NULL AS quantidade
+                 FROM {esquema}Receita r
+                 JOIN Medico m ON m.id_medico = r.id_medico
+                 WHERE r.data_emissao >= ? AND r.data_emissao < ?{restricao}
+                 GROUP BY date(r.data_emissao), COALESCE(m.especialidade, 'Não informada')''',
+    # receitas conta as receitas distintas que prescrevem o medicamento, não
+    # as linhas de ReceitaMedicamento
+    'medicamento': '''SELECT date(r.data_emissao) AS dia, rm.id_medicamento AS chave,
+                        COUNT(DISTINCT r.id_receita) AS receitas, SUM(rm.quantidade) AS quantidade
+                 FROM {esquema}Receita r
+                 JOIN {esquema}ReceitaMedicamento rm ON rm.id_receita = r.id_receita
+                 WHERE r.data_emissao >= ? AND r.data_emissao < ?{restricao}
+                 GROUP BY date(r.data_emissao), rm.id_medicamento''',
+    'diagnostico': '''SELECT date(r.data_emissao) AS dia, r.diagnostico AS chave,
+                        COUNT(*) AS receitas, NULL AS quantidade
+                 FROM {esquema}Receita r
+                 WHERE r.data_emissao >= ? AND r.data_emissao < ?{restricao}
+                 GROUP BY date(r.data_emissao), r.diagnostico''',
+}
+
+# Receita nos dois bancos (arquivamento interrompido): vale a do principal
+_FORA_DO_PRINCIPAL = '''
+                   AND NOT EXISTS (SELECT 1 FROM main.Receita p WHERE p.id_receita = r.id_receita)'''
+
+
+def _consolidar_dias(dimensao, arquivo):
+    partes = [_CONTAR_DIAS[dimensao].format(esquema='', restricao='')]
+    if arquivo:
+        partes.append(_CONTAR_DIAS[dimensao].format(esquema='arquivo.', restricao=_FORA_DO_PRINCIPAL))
+    return f'''INSERT INTO ReceitaDiaria (dimensao, dia, chave, receitas, quantidade)
+               SELECT '{dimensao}', dia, chave, SUM(receitas), SUM(quantidade)
+               FROM ({' UNION ALL '.join(partes)})
+               GROUP BY dia, chave'''
+
+
+_CONSOLIDAR_DIAS = {dimensao: _consolidar_dias(dimensao, False) for dimensao in DIMENSOES}
+_CONSOLIDAR_DIAS_COM_ARQUIVO = {dimensao: _consolidar_dias(dimensao, True) for dimensao in DIMENSOES}
+
+_APAGAR_DIAS = 'DELETE FROM ReceitaDiaria WHERE dimensao = ? AND dia >= ? AND dia < ?'
+
+_APAGAR_MES = 'DELETE FROM ReceitaMensal WHERE dimensao = ? AND mes = ?'
+
+_CONSOLIDAR_MES = '''INSERT INTO ReceitaMensal (dimensao, mes, chave, receitas, quantidade)
+                     SELECT dimensao, substr(dia, 1, 7), chave, SUM(receitas), SUM(quantidade)
+                     FROM ReceitaDiaria
+                     WHERE dimensao = ? AND dia >= ? AND dia < ?
+                     GROUP BY substr(dia, 1, 7), chave'''
+
+_PRIMEIRA = 'SELECT MIN(data_emissao) FROM Receita'
+
+_PRIMEIRA_COM_ARQUIVO = '''SELECT MIN(data_emissao) FROM (
+                              SELECT MIN(data_emissao) AS data_emissao FROM main.Receita
+                              UNION ALL
+                              SELECT MIN(data_emissao) FROM arquivo.Receita
+                          )'''
+
+_PROGRESSO = 'SELECT ultimo_dia FROM AnalyticsProgresso WHERE tarefa = ?'
+
+_GRAVAR_PROGRESSO = '''INSERT INTO AnalyticsProgresso (tarefa, ultimo_dia, atualizado_em)
+                       VALUES (?, ?, ?)
+                       ON CONFLICT(tarefa) DO UPDATE SET
+                           ultimo_dia = excluded.ultimo_dia,
+                           atualizado_em = excluded.atualizado_em'''
+
+
+def _inicio_proximo_mes(dia):
+    return (dia.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def intervalos(de, ate):
+    """
+    Divide o período [de, ate] em meses inteiros e nos dias soltos do início
+    e do fim, como pares (início, fim) inclusivos em texto. Partes vazias
+    saem com o início depois do fim, e a consulta não encontra linhas.
+    """
+    primeiro_mes = de if de.day == 1 else _inicio_proximo_mes(de)
+    fim_do_mes = _inicio_proximo_mes(ate) - timedelta(days=1)
+    if ate == fim_do_mes:
+        ultimo_mes = ate.replace(day=1)
+    else:
+        ultimo_mes = (ate.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+    if primeiro_mes > ultimo_mes:
+        # Nenhum mês inteiro no período: tudo vem dos dias
+        return ('9999-12', '0000-01'), (de.isoformat(), ate.isoformat()), ('9999-12-31', '0000-01-01')
+
+    meses = (primeiro_mes.strftime('%Y-%m'), ultimo_mes.strftime('%Y-%m'))
+    dias_inicio = (de.isoformat(), (primeiro_mes - timedelta(days=1)).isoformat())
+    dias_fim = (_inicio_proximo_mes(ultimo_mes).isoformat(), ate.isoformat())
+    return meses, dias_inicio, dias_fim
+
+
+def _consolidar(conn, inicio, fim, hoje, arquivo=False):
+    """Recalcula os dias [inicio, fim) e o mês que os contém em uma transação"""
+    mes_inicio = inicio.replace(day=1)
+    consultas = _CONSOLIDAR_DIAS_COM_ARQUIVO if arquivo else _CONSOLIDAR_DIAS
+    # Um par (início, fim) por banco lido
+    periodo = (inicio.isoformat(), fim.isoformat()) * (2 if arquivo else 1)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for dimensao in DIMENSOES:
+            conn.execute(_APAGAR_DIAS, (dimensao, inicio.isoformat(), fim.isoformat()))
+            conn.execute(consultas[dimensao], periodo)
+            conn.execute(_APAGAR_MES, (dimensao, mes_inicio.strftime('%Y-%m')))
+            conn.execute(_CONSOLIDAR_MES, (dimensao, mes_inicio.isoformat(),
+                                           _inicio_proximo_mes(mes_inicio).isoformat()))
+        # O dia atual ainda recebe receitas e é refeito na próxima execução
+        ultimo_completo = min(fim, hoje) - timedelta(days=1)
+        conn.execute(_GRAVAR_PROGRESSO, (TAREFA, ultimo_completo.isoformat(),
+                                         datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def atualizar(database, reconstruir=False, hoje=None, arquivo=None):
+    """
+    Consolida os dias pendentes até hoje e retorna quantos dias foram
+    processados. As receitas do banco de arquivo (se existir) também contam.
+    """
+    hoje = hoje or date.today()
+    # isolation_level=None: as transações são controladas explicitamente
+    conn = sqlite3.connect(database, isolation_level=None, timeout=30)
+    try:
+        com_arquivo = arquivamento.anexar(conn, arquivo)
+        if reconstruir:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM ReceitaDiaria')
+            conn.execute('DELETE FROM ReceitaMensal')
+            conn.execute('DELETE FROM AnalyticsProgresso WHERE tarefa = ?', (TAREFA,))
+            conn.execute('COMMIT')
+
+        linha = conn.execute(_PROGRESSO, (TAREFA,)).fetchone()
+        if linha and linha[0]:
+            inicio = date.fromisoformat(linha[0]) + timedelta(days=1)
+        else:
+            primeira = conn.execute(_PRIMEIRA_COM_ARQUIVO if com_arquivo else _PRIMEIRA).fetchone()[0]
+            if primeira is None:
+                return 0
+            inicio = date.fromisoformat(primeira[:10])
+
+        dias = 0
+        while inicio <= hoje:
+            fim = min(_inicio_proximo_mes(inicio), hoje + timedelta(days=1))
+            _consolidar(conn, inicio, fim, hoje, com_arquivo)
+            dias += (fim - inicio).days
+            inicio = fim
+        return dias
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consolidação das estatísticas de receitas')
+    parser.add_argument('--db', default='database.db', help='arquivo do banco de dados')
+    parser.add_argument('--reconstruir', action='store_true',
+                        help='apagar as tabelas consolidadas e refazer desde a primeira receita')
+    parser.add_argument('--arquivo', default=None,
+                        help=f'banco de arquivo (padrão: {arquivamento.ARQUIVO_DB})')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    dias = atualizar(args.db, reconstruir=args.reconstruir, arquivo=args.arquivo)
+    print(f'{dias} dia(s) consolidado(s) em {time.perf_counter() - inicio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
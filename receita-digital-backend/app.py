@@ -1,34 +1,113 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
+import heapq
+import json
 import jwt
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from functools import wraps
 import os
+import re
 from notifications import NotificationManager
+import analytics
+import arquivamento
+import cache
+import cadastro
+import codigos
+import db_monitor
+import documentos
+import estoque
+import exportacao
+import hashing
+import metrics
+import migrate
+import profiler
+import queries
+import singleflight
+import tracing
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'sua-chave-secreta-aqui'  # Mude para uma chave mais segura em produção
 CORS(app)
+db_monitor.init_app(app)
+metrics.init_app(app)
+tracing.init_app(app)
 
 # Configuração do banco de dados
 DATABASE = 'database.db'
 
+# Máximo de receitas por requisição em /api/receitas/lote
+LOTE_MAX_IDS = int(os.getenv('LOTE_MAX_IDS', '100'))
+
+# Máximo de códigos por requisição em /api/receitas/verificar
+VERIFICAR_MAX_CODIGOS = int(os.getenv('VERIFICAR_MAX_CODIGOS', '1000'))
+
+# Máximo de usuários por requisição em /api/usuarios/lote
+USUARIOS_LOTE_MAX = int(os.getenv('USUARIOS_LOTE_MAX', '1000'))
+
+# Tamanho padrão e máximo das páginas de /api/usuarios
+USUARIOS_PAGINA = 50
+USUARIOS_PAGINA_MAX = 500
+
+# Resultados padrão e máximos da busca de pacientes pelo nome
+BUSCA_PACIENTES_LIMITE = 20
+BUSCA_PACIENTES_LIMITE_MAX = 50
+
+# Tamanho padrão e máximo das páginas de /api/farmacias/<id>/estoque-baixo
+ESTOQUE_BAIXO_PAGINA = 50
+ESTOQUE_BAIXO_PAGINA_MAX = 500
+
+# Linhas padrão e máximas de /api/analytics/receitas
+ANALYTICS_LIMITE = 50
+ANALYTICS_LIMITE_MAX = 1000
+
+NOMES_ANALYTICS = {
+    'medico': queries.NOMES_MEDICOS,
+    'medicamento': queries.NOMES_MEDICAMENTOS,
+}
+
 notification_manager = NotificationManager()
 
+metrics.register_collector(db_monitor.connection_metrics)
+metrics.register_collector(notification_manager.metricas)
+metrics.register_collector(cache.metricas)
+metrics.register_collector(singleflight.metricas)
+metrics.register_collector(hashing.metricas)
+metrics.register_collector(codigos.metricas)
+
+# Invalidação do cache entre processos acompanha o banco em uso
+cache.bind_database(lambda: DATABASE)
+codigos.bind_database(lambda: DATABASE)
+codigos.configurar()
+cache.configure('usuarios', max_entries=10000)
+cache.configure('medicamentos', max_entries=16)
+cache.configure('farmacias', max_entries=16)
+
 def init_db():
     """Inicializa o banco de dados com as tabelas necessárias"""
     with sqlite3.connect(DATABASE) as conn:
         with open('sqlite_backend_script.sql', 'r', encoding='utf-8') as f:
             conn.executescript(f.read())
+    migrate.apply_migrations(DATABASE)
 
 def get_db():
     """Conecta ao banco de dados"""
-    conn = sqlite3.connect(DATABASE)
+    conn = sqlite3.connect(DATABASE, factory=db_monitor.InstrumentedConnection)
     conn.row_factory = sqlite3.Row
+    # Receitas antigas arquivadas, somente leitura (veja arquivamento.py)
+    conn.arquivo = arquivamento.anexar(conn)
     return conn
 
+def get_user(user_id):
+    """Dados do usuário (inclusive o tipo), do cache quando possível"""
+    def carregar():
+        conn = get_db()
+        user = conn.execute(queries.USUARIO_POR_ID, (user_id,)).fetchone()
+        conn.close()
+        return dict(user) if user else None
+    
+    return cache.get_or_load('usuarios', ('usuario', user_id), carregar)
+
 # Decorator para verificar token JWT
 def token_required(f):
     @wraps(f)
@@ -39,19 +118,15 @@ def token_required(f):
             return jsonify({'message': 'Token é obrigatório'}), 401
         
         try:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = data['user_id']
-            
-            # Verificar se o usuário ainda existe
-            conn = get_db()
-            user = conn.execute(
-                'SELECT * FROM Usuario WHERE id_usuario = ?', 
-                (current_user_id,)
-            ).fetchone()
-            conn.close()
+            with tracing.span('auth.token_required'):
+                if token.startswith('Bearer '):
+                    token = token[7:]
+                
+                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+                current_user_id = data['user_id']
+                
+                # Verificar se o usuário ainda existe
+                user = get_user(current_user_id)
             
             if not user:
                 return jsonify({'message': 'Token inválido'}), 401
@@ -60,6 +135,10 @@ def token_required(f):
             return jsonify({'message': 'Token expirado'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'message': 'Token inválido'}), 401
+        
+        # Perfilamento sob demanda (apenas admins)
+        if profiler.PROFILE_HEADER in request.headers and user['tipo'] == 'admin':
+            return profiler.profile_request(f, current_user_id, *args, **kwargs)
             
         return f(current_user_id, *args, **kwargs)
     
@@ -87,7 +166,7 @@ def register():
         
         # Verificar se email já existe
         existing_user = conn.execute(
-            'SELECT id_usuario FROM Usuario WHERE email = ?', 
+            queries.USUARIO_ID_POR_EMAIL, 
             (data['email'],)
         ).fetchone()
         
@@ -95,12 +174,12 @@ def register():
             conn.close()
             return jsonify({'message': 'Email já cadastrado'}), 409
         
-        # Hash da senha
-        hashed_password = generate_password_hash(data['senha'])
+        # Hash da senha, calculado fora da thread da requisição
+        hashed_password = hashing.gerar_hashes([data['senha']])[0]
         
         # Inserir usuário
         cursor = conn.execute(
-            'INSERT INTO Usuario (nome, email, senha, tipo) VALUES (?, ?, ?, ?)',
+            queries.INSERIR_USUARIO,
             (data['nome'], data['email'], hashed_password, data['tipo'])
         )
         user_id = cursor.lastrowid
@@ -108,7 +187,7 @@ def register():
         # Inserir dados específicos baseado no tipo
         if data['tipo'] == 'paciente':
             conn.execute(
-                'INSERT INTO Paciente (id_paciente, cpf, telefone, endereco) VALUES (?, ?, ?, ?)',
+                queries.INSERIR_PACIENTE,
                 (user_id, data.get('cpf'), data.get('telefone'), data.get('endereco'))
             )
         elif data['tipo'] == 'medico':
@@ -117,7 +196,7 @@ def register():
                 return jsonify({'message': 'CRM e especialidade são obrigatórios para médicos'}), 400
             
             conn.execute(
-                'INSERT INTO Medico (id_medico, crm, especialidade) VALUES (?, ?, ?)',
+                queries.INSERIR_MEDICO,
                 (user_id, data['crm'], data['especialidade'])
             )
         
@@ -143,14 +222,32 @@ def login():
         
         conn = get_db()
         user = conn.execute(
-            'SELECT * FROM Usuario WHERE email = ?', 
+            queries.USUARIO_POR_EMAIL, 
             (data['email'],)
         ).fetchone()
         conn.close()
         
-        if not user or not check_password_hash(user['senha'], data['senha']):
+        if not user:
             return jsonify({'message': 'Credenciais inválidas'}), 401
         
+        try:
+            confere, novo_hash = hashing.verificar_senha(user['senha'], data['senha'])
+        except hashing.PoolOcupado:
+            resposta = jsonify({'message': 'Muitos logins simultâneos, tente novamente em instantes'})
+            resposta.headers['Retry-After'] = '1'
+            return resposta, 503
+        
+        if not confere:
+            return jsonify({'message': 'Credenciais inválidas'}), 401
+        
+        if novo_hash:
+            # SENHA_METODO mudou: grava o hash novo, a menos que a senha tenha
+            # sido trocada enquanto ele era calculado
+            conn = get_db()
+            conn.execute(queries.ATUALIZAR_SENHA, (novo_hash, user['id_usuario'], user['senha']))
+            conn.commit()
+            conn.close()
+        
         # Gerar token JWT
         token = jwt.encode({
             'user_id': user['id_usuario'],
@@ -173,43 +270,55 @@ def login():
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
+def carregar_perfil(user_id):
+    """Dados do usuário junto com os dados específicos do seu tipo"""
+    conn = get_db()
+    
+    # Buscar dados do usuário
+    user = conn.execute(
+        queries.PERFIL_USUARIO,
+        (user_id,)
+    ).fetchone()
+    
+    if not user:
+        conn.close()
+        return None
+    
+    profile_data = dict(user)
+    
+    # Buscar dados específicos baseado no tipo
+    if user['tipo'] == 'paciente':
+        paciente = conn.execute(
+            queries.PERFIL_PACIENTE,
+            (user_id,)
+        ).fetchone()
+        if paciente:
+            profile_data.update(dict(paciente))
+    
+    elif user['tipo'] == 'medico':
+        medico = conn.execute(
+            queries.PERFIL_MEDICO,
+            (user_id,)
+        ).fetchone()
+        if medico:
+            profile_data.update(dict(medico))
+    
+    conn.close()
+    return profile_data
+
 @app.route('/api/profile', methods=['GET'])
 @token_required
 def get_profile(current_user_id):
     """Obter perfil do usuário logado"""
     try:
-        conn = get_db()
-        
-        # Buscar dados do usuário
-        user = conn.execute(
-            'SELECT id_usuario, nome, email, tipo FROM Usuario WHERE id_usuario = ?',
-            (current_user_id,)
-        ).fetchone()
+        profile_data = cache.get_or_load(
+            'usuarios', ('perfil', current_user_id),
+            lambda: carregar_perfil(current_user_id)
+        )
         
-        if not user:
-            conn.close()
+        if not profile_data:
             return jsonify({'message': 'Usuário não encontrado'}), 404
         
-        profile_data = dict(user)
-        
-        # Buscar dados específicos baseado no tipo
-        if user['tipo'] == 'paciente':
-            paciente = conn.execute(
-                'SELECT cpf, telefone, endereco FROM Paciente WHERE id_paciente = ?',
-                (current_user_id,)
-            ).fetchone()
-            if paciente:
-                profile_data.update(dict(paciente))
-        
-        elif user['tipo'] == 'medico':
-            medico = conn.execute(
-                'SELECT crm, especialidade FROM Medico WHERE id_medico = ?',
-                (current_user_id,)
-            ).fetchone()
-            if medico:
-                profile_data.update(dict(medico))
-        
-        conn.close()
         return jsonify(profile_data), 200
         
     except Exception as e:
@@ -220,27 +329,155 @@ def get_profile(current_user_id):
 @app.route('/api/usuarios', methods=['GET'])
 @token_required
 def get_usuarios(current_user_id):
-    """Listar todos os usuários (apenas admins)"""
+    """Listar usuários por nome, paginados, com filtro de tipo e busca (apenas admins)"""
     try:
+        # Verificar se é admin
+        current_user = get_user(current_user_id)
+        
+        if current_user['tipo'] != 'admin':
+            return jsonify({'message': 'Acesso negado'}), 403
+        
+        # Paginação por chave: ?apos_nome=&apos_id= do último usuário da página anterior
+        try:
+            limite = int(request.args.get('limite', USUARIOS_PAGINA))
+            apos_id = int(request.args.get('apos_id', 0))
+        except ValueError:
+            return jsonify({'message': 'limite e apos_id devem ser números inteiros'}), 400
+        if not 1 <= limite <= USUARIOS_PAGINA_MAX:
+            return jsonify({'message': f'limite deve estar entre 1 e {USUARIOS_PAGINA_MAX}'}), 400
+        apos_nome = request.args.get('apos_nome', '')
+        
+        tipo = request.args.get('tipo')
+        if tipo and tipo not in cadastro.TIPOS:
+            return jsonify({'message': 'Tipo de usuário inválido'}), 400
+        busca = consulta_por_prefixo(request.args.get('busca', ''))
+        
+        if busca and tipo:
+            sql, parametros = queries.USUARIOS_DO_TIPO_BUSCA_PAGINA, (busca, tipo)
+        elif busca:
+            sql, parametros = queries.USUARIOS_BUSCA_PAGINA, (busca,)
+        elif tipo:
+            sql, parametros = queries.USUARIOS_DO_TIPO_PAGINA, (tipo,)
+        else:
+            sql, parametros = queries.USUARIOS_PAGINA, ()
+        
         conn = get_db()
+        usuarios = conn.execute(sql, (*parametros, apos_nome, apos_id, limite)).fetchall()
+        totais = {linha['tipo']: linha['total'] for linha in conn.execute(queries.CONTAGEM_USUARIOS)}
+        conn.close()
         
-        # Verificar se é admin
-        current_user = conn.execute(
-            'SELECT tipo FROM Usuario WHERE id_usuario = ?',
-            (current_user_id,)
-        ).fetchone()
+        usuarios = [dict(user) for user in usuarios]
+        ultimo = usuarios[-1] if len(usuarios) == limite else None
+        return jsonify({
+            'usuarios': usuarios,
+            'proximo': {'apos_nome': ultimo['nome'], 'apos_id': ultimo['id_usuario']} if ultimo else None,
+            'totais': {**{t: totais.get(t, 0) for t in cadastro.TIPOS}, 'todos': sum(totais.values())}
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+@app.route('/api/usuarios/lote', methods=['POST'])
+@token_required
+def create_usuarios_lote(current_user_id):
+    """Cadastrar vários usuários de uma vez, com um resultado por linha (apenas admins)"""
+    try:
+        current_user = get_user(current_user_id)
         
         if current_user['tipo'] != 'admin':
+            return jsonify({'message': 'Acesso negado'}), 403
+        
+        data = request.get_json(silent=True)
+        itens = data.get('usuarios') if isinstance(data, dict) else data
+        if not isinstance(itens, list) or not itens:
+            return jsonify({'message': 'Informe a lista de usuários'}), 400
+        if len(itens) > USUARIOS_LOTE_MAX:
+            return jsonify({'message': f'Máximo de {USUARIOS_LOTE_MAX} usuários por requisição'}), 400
+        
+        conn = get_db()
+        try:
+            resultados = cadastro.cadastrar(conn, itens)
+        finally:
             conn.close()
+        
+        criados = sum(1 for r in resultados if r['resultado'] == 'criado')
+        return jsonify({
+            'total': len(resultados),
+            'criados': criados,
+            'rejeitados': len(resultados) - criados,
+            'resultados': resultados
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+def listar_medicamentos():
+    """Catálogo de medicamentos ordenado por nome"""
+    conn = get_db()
+    medicamentos = conn.execute(
+        queries.LISTAR_MEDICAMENTOS
+    ).fetchall()
+    conn.close()
+    return [dict(med) for med in medicamentos]
+
+def consulta_por_prefixo(texto):
+    """Consulta FTS5 em que cada palavra do texto é prefixo de uma palavra do nome"""
+    palavras = re.findall(r'\w+', texto)[:8]
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+def formatar_cpf(digitos, mascarar=False):
+    """CPF no formato 000.000.000-00; mascarado, só com os dígitos do meio"""
+    if not digitos or len(digitos) != 11:
+        return digitos
+    if mascarar:
+        return f'***.{digitos[3:6]}.{digitos[6:9]}-**'
+    return f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+
+@app.route('/api/pacientes/busca', methods=['GET'])
+@token_required
+def buscar_pacientes(current_user_id):
+    """Buscar pacientes pelo CPF ou pelo nome (médicos e admins)"""
+    try:
+        current_user = get_user(current_user_id)
+        
+        if current_user['tipo'] not in ('medico', 'admin'):
             return jsonify({'message': 'Acesso negado'}), 403
         
-        usuarios = conn.execute(
-            'SELECT id_usuario, nome, email, tipo FROM Usuario ORDER BY nome'
-        ).fetchall()
+        cpf = request.args.get('cpf', '').strip()
+        nome = request.args.get('nome', '').strip()
         
-        conn.close()
+        if cpf:
+            digitos = cadastro.cpf_digitos(cpf)
+            if not re.fullmatch(r'\d{11}', digitos):
+                return jsonify({'message': 'CPF deve ter 11 dígitos'}), 400
+            conn = get_db()
+            pacientes = conn.execute(queries.PACIENTES_POR_CPF, (digitos,)).fetchall()
+            conn.close()
+        elif nome:
+            try:
+                limite = int(request.args.get('limite', BUSCA_PACIENTES_LIMITE))
+            except ValueError:
+                return jsonify({'message': 'limite deve ser um número inteiro'}), 400
+            if not 1 <= limite <= BUSCA_PACIENTES_LIMITE_MAX:
+                return jsonify({'message': f'limite deve estar entre 1 e {BUSCA_PACIENTES_LIMITE_MAX}'}), 400
+            if len(''.join(re.findall(r'\w+', nome))) < 2:
+                return jsonify({'message': 'Informe ao menos 2 letras do nome'}), 400
+            conn = get_db()
+            pacientes = conn.execute(
+                queries.PACIENTES_POR_NOME,
+                (consulta_por_prefixo(nome), limite)
+            ).fetchall()
+            conn.close()
+        else:
+            return jsonify({'message': 'Informe cpf ou nome'}), 400
         
-        return jsonify([dict(user) for user in usuarios]), 200
+        # Na busca pelo nome o CPF vai mascarado: serve para distinguir homônimos
+        return jsonify([{
+            'id_paciente': paciente['id_paciente'],
+            'nome': paciente['nome'],
+            'email': paciente['email'],
+            'cpf': formatar_cpf(paciente['cpf_digitos'], mascarar=not cpf)
+        } for paciente in pacientes]), 200
         
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -250,13 +487,8 @@ def get_usuarios(current_user_id):
 def get_medicamentos(current_user_id):
     """Listar medicamentos"""
     try:
-        conn = get_db()
-        medicamentos = conn.execute(
-            'SELECT * FROM Medicamento ORDER BY nome'
-        ).fetchall()
-        conn.close()
-        
-        return jsonify([dict(med) for med in medicamentos]), 200
+        medicamentos = cache.get_or_load('medicamentos', 'lista', listar_medicamentos)
+        return jsonify(medicamentos), 200
         
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -275,9 +507,7 @@ def create_medicamento(current_user_id):
         
         conn = get_db()
         cursor = conn.execute(
-            '''INSERT INTO Medicamento 
-               (nome, principio_ativo, fabricante, codigo_barras, prescricao_obrigatoria) 
-               VALUES (?, ?, ?, ?, ?)''',
+            queries.INSERIR_MEDICAMENTO,
             (data['nome'], data['principio_ativo'], data['fabricante'], 
              data.get('codigo_barras'), data.get('prescricao_obrigatoria', 0))
         )
@@ -294,18 +524,22 @@ def create_medicamento(current_user_id):
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
+def listar_farmacias():
+    """Catálogo de farmácias ordenado por nome fantasia"""
+    conn = get_db()
+    farmacias = conn.execute(
+        queries.LISTAR_FARMACIAS
+    ).fetchall()
+    conn.close()
+    return [dict(farm) for farm in farmacias]
+
 @app.route('/api/farmacias', methods=['GET'])
 @token_required
 def get_farmacias(current_user_id):
     """Listar farmácias"""
     try:
-        conn = get_db()
-        farmacias = conn.execute(
-            'SELECT * FROM Farmacia ORDER BY nome_fantasia'
-        ).fetchall()
-        conn.close()
-        
-        return jsonify([dict(farm) for farm in farmacias]), 200
+        farmacias = cache.get_or_load('farmacias', 'lista', listar_farmacias)
+        return jsonify(farmacias), 200
         
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -349,9 +583,7 @@ def create_farmacia(current_user_id):
         
         conn = get_db()
         cursor = conn.execute(
-            '''INSERT INTO Farmacia 
-               (cnpj, nome_fantasia, endereco, telefone, responsavel_tecnico, latitude, longitude) 
-               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            queries.INSERIR_FARMACIA,
             (data['cnpj'], data['nome_fantasia'], data['endereco'],
              data.get('telefone'), data.get('responsavel_tecnico'), 
              latitude, longitude)
@@ -378,6 +610,95 @@ def create_farmacia(current_user_id):
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
+@app.route('/api/farmacias/<int:farmacia_id>/estoque', methods=['PUT'])
+@token_required
+def sync_estoque_farmacia(current_user_id, farmacia_id):
+    """Sincronizar o estoque da farmácia com um snapshot do ERP (apenas admins)"""
+    corpo = None
+    try:
+        current_user = get_user(current_user_id)
+        
+        if current_user['tipo'] != 'admin':
+            return jsonify({'message': 'Apenas administradores podem atualizar o estoque'}), 403
+        
+        # ?completo=1: itens com saldo que não vieram no snapshot são zerados
+        completo = request.args.get('completo', '').lower() in ('1', 'true', 'sim')
+        
+        if request.mimetype == 'application/x-ndjson':
+            # Snapshots grandes: o corpo vai para um arquivo temporário e é lido
+            # linha a linha, sem prender o lock de escrita esperando o cliente
+            corpo = estoque.copiar_corpo(request.stream)
+            itens = estoque.ler_ndjson(corpo)
+        else:
+            data = request.get_json(silent=True)
+            itens = data.get('itens') if isinstance(data, dict) else data
+            if not isinstance(itens, list):
+                return jsonify({'message': 'Envie a lista de itens (ou o snapshot em NDJSON)'}), 400
+        
+        conn = get_db()
+        
+        if not conn.execute(queries.FARMACIA_EXISTE, (farmacia_id,)).fetchone():
+            conn.close()
+            return jsonify({'message': 'Farmácia não encontrada'}), 404
+        
+        try:
+            contagem = estoque.sincronizar(conn, farmacia_id, itens, completo)
+        except estoque.SnapshotInvalido as e:
+            conn.close()
+            return jsonify({'message': str(e)}), 400
+        
+        # Notificações dos itens que caíram para o estoque mínimo, fora da
+        # transação do snapshot
+        estoque.distribuir_alertas(conn)
+        conn.close()
+        return jsonify({'message': 'Estoque sincronizado com sucesso', **contagem}), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+    finally:
+        if corpo is not None:
+            corpo.close()
+
+@app.route('/api/farmacias/<int:farmacia_id>/estoque-baixo', methods=['GET'])
+@token_required
+def get_estoque_baixo(current_user_id, farmacia_id):
+    """Itens da farmácia no estoque mínimo ou abaixo dele, paginados (apenas admins)"""
+    try:
+        current_user = get_user(current_user_id)
+        
+        if current_user['tipo'] != 'admin':
+            return jsonify({'message': 'Acesso negado'}), 403
+        
+        # Paginação por chave: ?apos=<id_medicamento do último item da página anterior>
+        try:
+            limite = int(request.args.get('limite', ESTOQUE_BAIXO_PAGINA))
+            apos = int(request.args.get('apos', 0))
+        except ValueError:
+            return jsonify({'message': 'limite e apos devem ser números inteiros'}), 400
+        if not 1 <= limite <= ESTOQUE_BAIXO_PAGINA_MAX:
+            return jsonify({'message': f'limite deve estar entre 1 e {ESTOQUE_BAIXO_PAGINA_MAX}'}), 400
+        
+        conn = get_db()
+        
+        if not conn.execute(queries.FARMACIA_EXISTE, (farmacia_id,)).fetchone():
+            conn.close()
+            return jsonify({'message': 'Farmácia não encontrada'}), 404
+        
+        itens = conn.execute(
+            queries.ESTOQUE_BAIXO_DA_FARMACIA,
+            (farmacia_id, apos, limite)
+        ).fetchall()
+        conn.close()
+        
+        itens = [dict(item) for item in itens]
+        return jsonify({
+            'itens': itens,
+            'proximo': itens[-1]['id_medicamento'] if len(itens) == limite else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
 @app.route('/api/receitas', methods=['POST'])
 @token_required
 def create_receita(current_user_id):
@@ -388,10 +709,7 @@ def create_receita(current_user_id):
         conn = get_db()
         
         # Verificar se o usuário atual é médico
-        current_user = conn.execute(
-            'SELECT tipo FROM Usuario WHERE id_usuario = ?',
-            (current_user_id,)
-        ).fetchone()
+        current_user = get_user(current_user_id)
         
         if current_user['tipo'] != 'medico':
             conn.close()
@@ -405,7 +723,7 @@ def create_receita(current_user_id):
         
         # Validar se paciente existe
         paciente = conn.execute(
-            'SELECT id_paciente FROM Paciente WHERE id_paciente = ?',
+            queries.PACIENTE_EXISTE,
             (data['id_paciente'],)
         ).fetchone()
         
@@ -429,7 +747,7 @@ def create_receita(current_user_id):
             
             # Verificar se medicamento existe
             medicamento_exists = conn.execute(
-                'SELECT id_medicamento FROM Medicamento WHERE id_medicamento = ?',
+                queries.MEDICAMENTO_EXISTE,
                 (med['id_medicamento'],)
             ).fetchone()
             
@@ -443,9 +761,7 @@ def create_receita(current_user_id):
         data_validade = (datetime.now() + timedelta(days=validade_dias)).strftime('%Y-%m-%d')
         
         cursor = conn.execute(
-            '''INSERT INTO Receita 
-               (id_medico, id_paciente, data_emissao, data_validade, diagnostico, observacoes, status) 
-               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            queries.INSERIR_RECEITA,
             (current_user_id, data['id_paciente'], data_emissao, data_validade, 
              data['diagnostico'], data.get('observacoes_gerais'), 'ativa')
         )
@@ -455,9 +771,7 @@ def create_receita(current_user_id):
         # Inserir medicamentos da receita
         for medicamento in medicamentos:
             conn.execute(
-                '''INSERT INTO ReceitaMedicamento 
-                   (id_receita, id_medicamento, dosagem, quantidade, posologia, observacoes) 
-                   VALUES (?, ?, ?, ?, ?, ?)''',
+                queries.INSERIR_RECEITA_MEDICAMENTO,
                 (receita_id, medicamento['id_medicamento'], medicamento['dosagem'],
                  medicamento['quantidade'], medicamento['posologia'], 
                  medicamento.get('observacoes'))
@@ -481,70 +795,191 @@ def create_receita(current_user_id):
 @app.route('/api/receitas/<int:receita_id>', methods=['GET'])
 @token_required
 def get_receita_detalhes(current_user_id, receita_id):
-    """Obter detalhes de uma receita específica"""
+    """Obter detalhes de uma receita específica com número formatado"""
     try:
         conn = get_db()
         
         # Verificar tipo do usuário
-        user = conn.execute(
-            'SELECT tipo FROM Usuario WHERE id_usuario = ?',
-            (current_user_id,)
+        user = get_user(current_user_id)
+        
+        # Dono e versão atual do documento
+        acesso = conn.execute(
+            queries.RECEITA_ACESSO,
+            (receita_id,)
         ).fetchone()
         
-        # Montar query baseada no tipo de usuário
-        if user['tipo'] == 'paciente':
-            # Paciente só vê suas próprias receitas
-            receita = conn.execute(
-                '''SELECT r.*, um.nome as nome_medico, m.especialidade, m.crm
-                   FROM Receita r 
-                   JOIN Medico m ON r.id_medico = m.id_medico
-                   JOIN Usuario um ON m.id_medico = um.id_usuario
-                   WHERE r.id_receita = ? AND r.id_paciente = ?''',
-                (receita_id, current_user_id)
-            ).fetchone()
-        elif user['tipo'] == 'medico':
-            # Médico só vê receitas que prescreveu
-            receita = conn.execute(
-                '''SELECT r.*, up.nome as nome_paciente
-                   FROM Receita r 
-                   JOIN Paciente p ON r.id_paciente = p.id_paciente
-                   JOIN Usuario up ON p.id_paciente = up.id_usuario
-                   WHERE r.id_receita = ? AND r.id_medico = ?''',
-                (receita_id, current_user_id)
-            ).fetchone()
-        else:  # admin
-            # Admin vê todas as receitas
-            receita = conn.execute(
-                '''SELECT r.*, up.nome as nome_paciente, um.nome as nome_medico, m.especialidade, m.crm
-                   FROM Receita r 
-                   JOIN Paciente p ON r.id_paciente = p.id_paciente
-                   JOIN Usuario up ON p.id_paciente = up.id_usuario
-                   JOIN Medico m ON r.id_medico = m.id_medico
-                   JOIN Usuario um ON m.id_medico = um.id_usuario
-                   WHERE r.id_receita = ?''',
-                (receita_id,)
-            ).fetchone()
+        # Fora do banco principal, a receita pode estar no arquivo
+        arquivada = False
+        if not acesso and conn.arquivo:
+            acesso = conn.execute(queries.RECEITA_ACESSO_ARQUIVADA, (receita_id,)).fetchone()
+            arquivada = acesso is not None
         
-        if not receita:
+        # Paciente só vê suas próprias receitas e médico só as que prescreveu
+        if (not acesso
+                or (user['tipo'] == 'paciente' and acesso['id_paciente'] != current_user_id)
+                or (user['tipo'] == 'medico' and acesso['id_medico'] != current_user_id)):
             conn.close()
             return jsonify({'message': 'Receita não encontrada'}), 404
         
-        # Buscar medicamentos da receita
-        medicamentos = conn.execute(
-            '''SELECT rm.*, med.nome, med.principio_ativo, med.fabricante
-               FROM ReceitaMedicamento rm
-               JOIN Medicamento med ON rm.id_medicamento = med.id_medicamento
-               WHERE rm.id_receita = ?''',
-            (receita_id,)
-        ).fetchall()
+        # O join pesado só roda quando esta versão ainda não está em cache
+        documento = documentos.get_document(conn, receita_id, acesso['versao'], arquivada)
+        conn.close()
+        
+        if not documento:
+            return jsonify({'message': 'Receita não encontrada'}), 404
+        
+        response = jsonify(documentos.for_role(documento, user['tipo']))
+        response.set_etag(f"{receita_id}-{acesso['versao']}-{user['tipo']}")
+        return response.make_conditional(request)
+        
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+@app.route('/api/receitas/<int:receita_id>/codigo', methods=['GET'])
+@token_required
+def get_receita_codigo(current_user_id, receita_id):
+    """Código assinado da receita ativa, para o QR code"""
+    try:
+        # Sem chave configurada a receita nem é marcada como tendo código
+        codigos.exigir_chaves()
+        
+        conn = get_db()
+        
+        user = get_user(current_user_id)
         
+        # A versão lida é marcada como tendo código; se ela mudar no meio do
+        # caminho a marca não pega e a receita é lida de novo
+        for _ in range(3):
+            receita = conn.execute(queries.RECEITA_CODIGO, (receita_id,)).fetchone()
+            
+            # Paciente só vê suas próprias receitas e médico só as que prescreveu
+            if (not receita
+                    or (user['tipo'] == 'paciente' and receita['id_paciente'] != current_user_id)
+                    or (user['tipo'] == 'medico' and receita['id_medico'] != current_user_id)):
+                conn.close()
+                return jsonify({'message': 'Receita não encontrada'}), 404
+            
+            if receita['status'] != 'ativa':
+                conn.close()
+                return jsonify({'message': f"Receita {receita['status']} não tem código"}), 409
+            
+            if receita['com_codigo']:
+                break
+            marcada = conn.execute(queries.MARCAR_CODIGO_EMITIDO, (receita_id, receita['versao'])).rowcount
+            if not marcada and receita['versao'] == 0:
+                marcada = conn.execute(queries.CRIAR_VERSAO_COM_CODIGO, (receita_id,)).rowcount
+            conn.commit()
+            if marcada:
+                break
+        else:
+            conn.close()
+            return jsonify({'message': 'Receita sendo alterada, tente novamente'}), 409
         conn.close()
         
-        # Montar resposta
-        receita_dict = dict(receita)
-        receita_dict['medicamentos'] = [dict(med) for med in medicamentos]
+        codigo = codigos.gerar(
+            receita_id, receita['id_paciente'], receita['versao'],
+            receita['data_validade'], json.loads(receita['itens'])
+        )
+        return jsonify({'id_receita': receita_id, 'versao': receita['versao'], 'codigo': codigo}), 200
+        
+    except codigos.CodigoError as e:
+        return jsonify({'message': str(e)}), 503
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+@app.route('/api/receitas/verificar', methods=['POST'])
+@token_required
+def verificar_codigos(current_user_id):
+    """Conferir códigos de receita sem consultar o banco (codigo ou lista em codigos)"""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Campo codigo ou codigos é obrigatório'}), 400
+        
+        if isinstance(data.get('codigos'), list):
+            if len(data['codigos']) > VERIFICAR_MAX_CODIGOS:
+                return jsonify({'message': f'Máximo de {VERIFICAR_MAX_CODIGOS} códigos por requisição'}), 400
+            return jsonify({'resultados': codigos.verificar(data['codigos'])}), 200
         
-        return jsonify(receita_dict), 200
+        if isinstance(data.get('codigo'), str):
+            return jsonify(codigos.verificar([data['codigo']])[0]), 200
+        
+        return jsonify({'message': 'Campo codigo ou codigos é obrigatório'}), 400
+        
+    except codigos.CodigoError as e:
+        return jsonify({'message': str(e)}), 503
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+@app.route('/api/receitas/lote', methods=['GET', 'POST'])
+@token_required
+def get_receitas_lote(current_user_id):
+    """Obter várias receitas de uma vez (ids na query string ou no corpo)"""
+    try:
+        if request.method == 'POST':
+            ids = (request.get_json(silent=True) or {}).get('ids')
+        else:
+            ids = [i for i in request.args.get('ids', '').split(',') if i.strip()]
+        
+        if not isinstance(ids, list) or not ids:
+            return jsonify({'message': 'Informe os ids das receitas'}), 400
+        
+        try:
+            # Remove repetidos mantendo a ordem pedida
+            ids = list(dict.fromkeys(int(i) for i in ids))
+        except (TypeError, ValueError):
+            return jsonify({'message': 'Os ids devem ser números inteiros'}), 400
+        
+        if len(ids) > LOTE_MAX_IDS:
+            return jsonify({'message': f'Máximo de {LOTE_MAX_IDS} receitas por requisição'}), 400
+        
+        user = get_user(current_user_id)
+        
+        conn = get_db()
+        
+        # Duas consultas para o lote inteiro: receitas e linhas de medicamento
+        ids_json = json.dumps(ids)
+        receitas = {
+            receita['id_receita']: dict(receita)
+            for receita in conn.execute(queries.RECEITAS_LOTE, (ids_json,)).fetchall()
+        }
+        for receita in receitas.values():
+            receita['medicamentos'] = []
+        
+        for med in conn.execute(queries.MEDICAMENTOS_DAS_RECEITAS, (ids_json,)).fetchall():
+            receitas[med['id_receita']]['medicamentos'].append(dict(med))
+        
+        # Ids que não estão no banco principal são procurados no arquivo
+        faltantes = [receita_id for receita_id in ids if receita_id not in receitas]
+        if faltantes and conn.arquivo:
+            faltantes_json = json.dumps(faltantes)
+            for receita in conn.execute(queries.RECEITAS_LOTE_ARQUIVADAS, (faltantes_json,)).fetchall():
+                receitas[receita['id_receita']] = dict(receita, medicamentos=[])
+            for med in conn.execute(queries.MEDICAMENTOS_DAS_RECEITAS_ARQUIVADAS, (faltantes_json,)).fetchall():
+                receitas[med['id_receita']]['medicamentos'].append(dict(med))
+        
+        conn.close()
+        
+        # Mesmas regras de visibilidade da rota de detalhes
+        resultados = []
+        for receita_id in ids:
+            receita = receitas.get(receita_id)
+            if not receita:
+                resultados.append({'id_receita': receita_id, 'resultado': 'nao_encontrada'})
+            elif ((user['tipo'] == 'paciente' and receita['id_paciente'] != current_user_id)
+                    or (user['tipo'] == 'medico' and receita['id_medico'] != current_user_id)):
+                resultados.append({'id_receita': receita_id, 'resultado': 'acesso_negado'})
+            else:
+                resultados.append({
+                    'id_receita': receita_id,
+                    'resultado': 'ok',
+                    'receita': documentos.for_role(receita, user['tipo'])
+                })
+        
+        return jsonify({'total': len(resultados), 'resultados': resultados}), 200
         
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -567,21 +1002,18 @@ def update_receita_status(current_user_id, receita_id):
         conn = get_db()
         
         # Verificar se a receita existe e se o usuário tem permissão
-        user = conn.execute(
-            'SELECT tipo FROM Usuario WHERE id_usuario = ?',
-            (current_user_id,)
-        ).fetchone()
+        user = get_user(current_user_id)
         
         if user['tipo'] == 'medico':
             # Médico só pode alterar suas próprias receitas
             receita = conn.execute(
-                'SELECT id_receita FROM Receita WHERE id_receita = ? AND id_medico = ?',
+                queries.RECEITA_DO_MEDICO,
                 (receita_id, current_user_id)
             ).fetchone()
         elif user['tipo'] == 'admin':
             # Admin pode alterar qualquer receita
             receita = conn.execute(
-                'SELECT id_receita FROM Receita WHERE id_receita = ?',
+                queries.RECEITA_EXISTE,
                 (receita_id,)
             ).fetchone()
         else:
@@ -595,7 +1027,7 @@ def update_receita_status(current_user_id, receita_id):
         
         # Atualizar status
         conn.execute(
-            'UPDATE Receita SET status = ? WHERE id_receita = ?',
+            queries.ATUALIZAR_STATUS_RECEITA,
             (data['status'], receita_id)
         )
         
@@ -612,95 +1044,152 @@ def update_receita_status(current_user_id, receita_id):
 
 # Adicione estas rotas ao seu arquivo app.py
 
+# Representações das listas de receitas aceitas em ?view=
+VIEWS_LISTA = {
+    'completa': None,
+    'resumo': queries.CAMPOS_RESUMO,
+}
+
+LISTAS_COMPLETAS = {
+    'paciente': queries.RECEITAS_DO_PACIENTE,
+    'medico': queries.RECEITAS_DO_MEDICO,
+    None: queries.RECEITAS_TODAS,
+}
+
+LISTAS_COMPLETAS_ARQUIVADAS = {
+    'paciente': queries.RECEITAS_ARQUIVADAS_DO_PACIENTE,
+    'medico': queries.RECEITAS_ARQUIVADAS_DO_MEDICO,
+    None: queries.RECEITAS_ARQUIVADAS_TODAS,
+}
+
+
+def campos_da_lista():
+    """
+    Campos pedidos em ?fields= (ou pela ?view=) como (campos, erro);
+    campos None significa a representação completa
+    """
+    fields = request.args.get('fields')
+    if fields:
+        campos = list(dict.fromkeys(c.strip() for c in fields.split(',') if c.strip()))
+        validos = list(queries.CAMPOS_LISTA_RECEITAS) + ['medicamentos']
+        invalidos = [c for c in campos if c not in validos]
+        if invalidos or not campos:
+            return None, f'Campos inválidos: {", ".join(invalidos)}. Use: {", ".join(validos)}'
+        return campos, None
+    
+    view = request.args.get('view', 'completa')
+    if view not in VIEWS_LISTA:
+        return None, f'view deve ser uma de: {", ".join(VIEWS_LISTA)}'
+    return VIEWS_LISTA[view], None
+
+
+def periodo_da_lista():
+    """
+    Período [de, ate) pedido em ?de=&ate= (datas inclusivas, AAAA-MM-DD)
+    como ((de, ate), erro); sem os parâmetros, todo o histórico
+    """
+    try:
+        de = date.fromisoformat(request.args['de']).isoformat() if request.args.get('de') else '0000-01-01'
+        ate = ((date.fromisoformat(request.args['ate']) + timedelta(days=1)).isoformat()
+               if request.args.get('ate') else '9999-12-31')
+    except ValueError:
+        return None, 'de e ate devem estar no formato AAAA-MM-DD'
+    return (de, ate), None
+
+
+def consultar_arquivo(conn, de):
+    """Se o período que começa em de alcança as receitas arquivadas"""
+    if not conn.arquivo:
+        return False
+    limite = conn.execute(queries.LIMITE_ARQUIVO).fetchone()[0]
+    return limite is not None and de <= limite
+
+
+def listar_receitas(conn, campos, filtro=None, parametros=(), periodo=('0000-01-01', '9999-12-31')):
+    """
+    Receitas da lista com os campos pedidos; medicamentos em uma única
+    consulta por banco. Quando o período alcança o arquivo, as receitas
+    arquivadas são intercaladas por data de emissão
+    """
+    arquivo = consultar_arquivo(conn, periodo[0])
+    parametros = tuple(parametros) + tuple(periodo)
+    
+    if campos is None:
+        sql = LISTAS_COMPLETAS[filtro]
+        sql_arquivo = LISTAS_COMPLETAS_ARQUIVADAS[filtro]
+        com_medicamentos = True
+    else:
+        colunas = queries.colunas_lista_receitas(campos, arquivo)
+        sql = queries.lista_receitas(colunas, filtro)
+        sql_arquivo = queries.lista_receitas(colunas, filtro, 'arquivo.')
+        com_medicamentos = 'medicamentos' in campos
+    
+    receitas = [dict(receita) for receita in conn.execute(sql, parametros).fetchall()]
+    arquivadas = []
+    if arquivo:
+        # Receita nos dois bancos (arquivamento interrompido): vale a do principal
+        principais = {receita['id_receita'] for receita in receitas}
+        arquivadas = [
+            dict(receita) for receita in conn.execute(sql_arquivo, parametros).fetchall()
+            if receita['id_receita'] not in principais
+        ]
+    
+    if com_medicamentos:
+        for lista, sql_medicamentos in ((receitas, queries.MEDICAMENTOS_DAS_RECEITAS),
+                                        (arquivadas, queries.MEDICAMENTOS_DAS_RECEITAS_ARQUIVADAS)):
+            if not lista:
+                continue
+            por_receita = {}
+            for receita in lista:
+                por_receita[receita['id_receita']] = receita['medicamentos'] = []
+            medicamentos = conn.execute(sql_medicamentos, (json.dumps(list(por_receita)),)).fetchall()
+            for med in medicamentos:
+                por_receita[med['id_receita']].append(dict(med))
+    
+    if not arquivadas:
+        return receitas
+    
+    receitas = list(heapq.merge(receitas, arquivadas, key=lambda r: r['data_emissao'], reverse=True))
+    if campos is not None and 'data_emissao' not in campos:
+        for receita in receitas:
+            del receita['data_emissao']
+    return receitas
+
+
 @app.route('/api/receitas', methods=['GET'])
 @token_required
 def get_receitas_usuario(current_user_id):
     """Listar receitas baseado no tipo de usuário"""
     try:
-        conn = get_db()
+        campos, erro = campos_da_lista()
+        if not erro:
+            periodo, erro = periodo_da_lista()
+        if erro:
+            return jsonify({'message': erro}), 400
         
         # Verificar tipo do usuário
-        user = conn.execute(
-            'SELECT tipo FROM Usuario WHERE id_usuario = ?',
-            (current_user_id,)
-        ).fetchone()
+        user = get_user(current_user_id)
         
         if not user:
-            conn.close()
             return jsonify({'message': 'Usuário não encontrado'}), 404
         
+        conn = get_db()
+        
         # Buscar receitas baseado no tipo de usuário
         if user['tipo'] == 'paciente':
             # Paciente vê apenas suas receitas
-            receitas = conn.execute(
-                '''SELECT r.*, 
-                          um.nome as nome_medico, 
-                          m.especialidade, 
-                          m.crm,
-                          up.nome as nome_paciente
-                   FROM Receita r 
-                   JOIN Medico m ON r.id_medico = m.id_medico
-                   JOIN Usuario um ON m.id_medico = um.id_usuario
-                   JOIN Paciente p ON r.id_paciente = p.id_paciente
-                   JOIN Usuario up ON p.id_paciente = up.id_usuario
-                   WHERE r.id_paciente = ?
-                   ORDER BY r.data_emissao DESC''',
-                (current_user_id,)
-            ).fetchall()
+            receitas = listar_receitas(conn, campos, 'paciente', (current_user_id,), periodo)
             
         elif user['tipo'] == 'medico':
             # Médico vê receitas que prescreveu
-            receitas = conn.execute(
-                '''SELECT r.*, 
-                          um.nome as nome_medico, 
-                          m.especialidade, 
-                          m.crm,
-                          up.nome as nome_paciente
-                   FROM Receita r 
-                   JOIN Medico m ON r.id_medico = m.id_medico
-                   JOIN Usuario um ON m.id_medico = um.id_usuario
-                   JOIN Paciente p ON r.id_paciente = p.id_paciente
-                   JOIN Usuario up ON p.id_paciente = up.id_usuario
-                   WHERE r.id_medico = ?
-                   ORDER BY r.data_emissao DESC''',
-                (current_user_id,)
-            ).fetchall()
+            receitas = listar_receitas(conn, campos, 'medico', (current_user_id,), periodo)
             
         else:  # admin
             # Admin vê todas as receitas
-            receitas = conn.execute(
-                '''SELECT r.*, 
-                          um.nome as nome_medico, 
-                          m.especialidade, 
-                          m.crm,
-                          up.nome as nome_paciente
-                   FROM Receita r 
-                   JOIN Medico m ON r.id_medico = m.id_medico
-                   JOIN Usuario um ON m.id_medico = um.id_usuario
-                   JOIN Paciente p ON r.id_paciente = p.id_paciente
-                   JOIN Usuario up ON p.id_paciente = up.id_usuario
-                   ORDER BY r.data_emissao DESC'''
-            ).fetchall()
-        
-        # Para cada receita, buscar os medicamentos
-        receitas_completas = []
-        for receita in receitas:
-            receita_dict = dict(receita)
-            
-            # Buscar medicamentos da receita
-            medicamentos = conn.execute(
-                '''SELECT rm.*, med.nome, med.principio_ativo, med.fabricante
-                   FROM ReceitaMedicamento rm
-                   JOIN Medicamento med ON rm.id_medicamento = med.id_medicamento
-                   WHERE rm.id_receita = ?''',
-                (receita['id_receita'],)
-            ).fetchall()
-            
-            receita_dict['medicamentos'] = [dict(med) for med in medicamentos]
-            receitas_completas.append(receita_dict)
+            receitas = listar_receitas(conn, campos, periodo=periodo)
         
         conn.close()
-        return jsonify(receitas_completas), 200
+        return jsonify(receitas), 200
         
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -711,54 +1200,24 @@ def get_receitas_usuario(current_user_id):
 def get_receitas_paciente(current_user_id, paciente_id):
     """Buscar receitas de um paciente específico (apenas médicos e admins)"""
     try:
-        conn = get_db()
+        campos, erro = campos_da_lista()
+        if not erro:
+            periodo, erro = periodo_da_lista()
+        if erro:
+            return jsonify({'message': erro}), 400
         
         # Verificar permissões
-        current_user = conn.execute(
-            'SELECT tipo FROM Usuario WHERE id_usuario = ?',
-            (current_user_id,)
-        ).fetchone()
+        current_user = get_user(current_user_id)
         
         if current_user['tipo'] not in ['medico', 'admin']:
-            conn.close()
             return jsonify({'message': 'Acesso negado'}), 403
         
         # Buscar receitas do paciente
-        receitas = conn.execute(
-            '''SELECT r.*, 
-                      um.nome as nome_medico, 
-                      m.especialidade, 
-                      m.crm,
-                      up.nome as nome_paciente
-               FROM Receita r 
-               JOIN Medico m ON r.id_medico = m.id_medico
-               JOIN Usuario um ON m.id_medico = um.id_usuario
-               JOIN Paciente p ON r.id_paciente = p.id_paciente
-               JOIN Usuario up ON p.id_paciente = up.id_usuario
-               WHERE r.id_paciente = ?
-               ORDER BY r.data_emissao DESC''',
-            (paciente_id,)
-        ).fetchall()
-        
-        # Para cada receita, buscar os medicamentos
-        receitas_completas = []
-        for receita in receitas:
-            receita_dict = dict(receita)
-            
-            # Buscar medicamentos da receita
-            medicamentos = conn.execute(
-                '''SELECT rm.*, med.nome, med.principio_ativo, med.fabricante
-                   FROM ReceitaMedicamento rm
-                   JOIN Medicamento med ON rm.id_medicamento = med.id_medicamento
-                   WHERE rm.id_receita = ?''',
-                (receita['id_receita'],)
-            ).fetchall()
-            
-            receita_dict['medicamentos'] = [dict(med) for med in medicamentos]
-            receitas_completas.append(receita_dict)
-        
+        conn = get_db()
+        receitas = listar_receitas(conn, campos, 'paciente', (paciente_id,), periodo)
         conn.close()
-        return jsonify(receitas_completas), 200
+        
+        return jsonify(receitas), 200
         
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -769,215 +1228,385 @@ def get_receitas_paciente(current_user_id, paciente_id):
 def get_receitas_medico(current_user_id, medico_id):
     """Buscar receitas de um médico específico (apenas admins)"""
     try:
-        conn = get_db()
+        campos, erro = campos_da_lista()
+        if not erro:
+            periodo, erro = periodo_da_lista()
+        if erro:
+            return jsonify({'message': erro}), 400
         
         # Verificar se é admin
-        current_user = conn.execute(
-            'SELECT tipo FROM Usuario WHERE id_usuario = ?',
-            (current_user_id,)
-        ).fetchone()
+        current_user = get_user(current_user_id)
         
         if current_user['tipo'] != 'admin':
-            conn.close()
             return jsonify({'message': 'Acesso negado'}), 403
         
         # Buscar receitas do médico
-        receitas = conn.execute(
-            '''SELECT r.*, 
-                      um.nome as nome_medico, 
-                      m.especialidade, 
-                      m.crm,
-                      up.nome as nome_paciente
-               FROM Receita r 
-               JOIN Medico m ON r.id_medico = m.id_medico
-               JOIN Usuario um ON m.id_medico = um.id_usuario
-               JOIN Paciente p ON r.id_paciente = p.id_paciente
-               JOIN Usuario up ON p.id_paciente = up.id_usuario
-               WHERE r.id_medico = ?
-               ORDER BY r.data_emissao DESC''',
-            (medico_id,)
-        ).fetchall()
-        
-        # Para cada receita, buscar os medicamentos
-        receitas_completas = []
-        for receita in receitas:
-            receita_dict = dict(receita)
-            
-            # Buscar medicamentos da receita
-            medicamentos = conn.execute(
-                '''SELECT rm.*, med.nome, med.principio_ativo, med.fabricante
-                   FROM ReceitaMedicamento rm
-                   JOIN Medicamento med ON rm.id_medicamento = med.id_medicamento
-                   WHERE rm.id_receita = ?''',
-                (receita['id_receita'],)
-            ).fetchall()
-            
-            receita_dict['medicamentos'] = [dict(med) for med in medicamentos]
-            receitas_completas.append(receita_dict)
-        
+        conn = get_db()
+        receitas = listar_receitas(conn, campos, 'medico', (medico_id,), periodo)
         conn.close()
-        return jsonify(receitas_completas), 200
+        
+        return jsonify(receitas), 200
         
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
 
-@app.route('/api/receitas/stats', methods=['GET'])
+@app.route('/api/vendas', methods=['POST'])
 @token_required
-def get_receitas_stats(current_user_id):
-    """Estatísticas de receitas baseado no tipo de usuário"""
+def create_venda(current_user_id):
+    """Registrar a dispensação de uma receita em uma farmácia (apenas admins)"""
     try:
+        data = request.get_json(silent=True) or {}
+        
+        # Não existe perfil de farmácia; os terminais usam um usuário admin
+        current_user = get_user(current_user_id)
+        
+        if current_user['tipo'] != 'admin':
+            return jsonify({'message': 'Apenas administradores podem registrar vendas'}), 403
+        
+        for field in ['id_receita', 'id_farmacia']:
+            if not isinstance(data.get(field), int):
+                return jsonify({'message': f'Campo {field} é obrigatório'}), 400
+        
         conn = get_db()
         
-        # Verificar tipo do usuário
-        user = conn.execute(
-            'SELECT tipo FROM Usuario WHERE id_usuario = ?',
-            (current_user_id,)
-        ).fetchone()
+        # Validações de leitura ficam fora da transação de escrita
+        if not conn.execute(queries.FARMACIA_EXISTE, (data['id_farmacia'],)).fetchone():
+            conn.close()
+            return jsonify({'message': 'Farmácia não encontrada'}), 404
         
-        stats = {}
+        receita = conn.execute(queries.RECEITA_PARA_VENDA, (data['id_receita'],)).fetchone()
+        if not receita:
+            conn.close()
+            return jsonify({'message': 'Receita não encontrada'}), 404
+        if receita['status'] != 'ativa':
+            conn.close()
+            return jsonify({'message': 'Receita não está ativa'}), 409
         
-        if user['tipo'] == 'paciente':
-            # Estatísticas do paciente
-            total = conn.execute(
-                'SELECT COUNT(*) as total FROM Receita WHERE id_paciente = ?',
-                (current_user_id,)
-            ).fetchone()
-            
-            ativas = conn.execute(
-                'SELECT COUNT(*) as ativas FROM Receita WHERE id_paciente = ? AND status = ?',
-                (current_user_id, 'ativa')
-            ).fetchone()
-            
-            utilizadas = conn.execute(
-                'SELECT COUNT(*) as utilizadas FROM Receita WHERE id_paciente = ? AND status = ?',
-                (current_user_id, 'utilizada')
-            ).fetchone()
-            
-            stats = {
-                'total_receitas': total['total'],
-                'receitas_ativas': ativas['ativas'],
-                'receitas_utilizadas': utilizadas['utilizadas']
-            }
+        itens = conn.execute(queries.ITENS_DA_RECEITA, (data['id_receita'],)).fetchall()
+        
+        # Transação curta com o lock de escrita pego no BEGIN: cada baixa só
+        # acontece se o estoque cobrir a quantidade, e o trigger da venda
+        # revalida a receita, então dois terminais não dispensam a mesma
+        # receita nem vendem além do estoque
+        conn.isolation_level = 'IMMEDIATE'
+        try:
+            valor_total = 0
+            vendidos, indisponiveis = [], []
+            for item in itens:
+                baixa = conn.execute(
+                    queries.BAIXAR_ESTOQUE,
+                    (item['quantidade'], data['id_farmacia'], item['id_medicamento'], item['quantidade'])
+                ).fetchall()
+                if not baixa:
+                    indisponiveis.append(item['id_medicamento'])
+                    continue
+                valor_total += baixa[0]['preco_unitario'] * item['quantidade']
+                vendidos.append({
+                    'id_medicamento': item['id_medicamento'],
+                    'quantidade': item['quantidade'],
+                    'preco_unitario': baixa[0]['preco_unitario']
+                })
             
-        elif user['tipo'] == 'medico':
-            # Estatísticas do médico
-            total = conn.execute(
-                'SELECT COUNT(*) as total FROM Receita WHERE id_medico = ?',
-                (current_user_id,)
-            ).fetchone()
+            if indisponiveis:
+                conn.rollback()
+                conn.close()
+                return jsonify({
+                    'message': 'Estoque insuficiente',
+                    'medicamentos_indisponiveis': indisponiveis
+                }), 409
             
-            ativas = conn.execute(
-                'SELECT COUNT(*) as ativas FROM Receita WHERE id_medico = ? AND status = ?',
-                (current_user_id, 'ativa')
+            cursor = conn.execute(
+                queries.INSERIR_VENDA,
+                (data['id_farmacia'], receita['id_paciente'], data['id_receita'], round(valor_total, 2))
+            )
+            conn.commit()
+        except sqlite3.IntegrityError as e:
+            # Receita expirada ou já utilizada por outra venda concorrente
+            conn.rollback()
+            conn.close()
+            return jsonify({'message': str(e)}), 409
+        
+        estoque.distribuir_alertas(conn)
+        conn.close()
+        
+        return jsonify({
+            'message': 'Venda registrada com sucesso',
+            'id_venda': cursor.lastrowid,
+            'valor_total': round(valor_total, 2),
+            'itens': vendidos
+        }), 201
+        
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+def calcular_stats(tipo, user_id):
+    """Estatísticas de receitas para o tipo de usuário"""
+    conn = get_db()
+    
+    def contar(sql, sql_arquivo, parametros=()):
+        # Receitas arquivadas continuam contando nos totais
+        total = conn.execute(sql, parametros).fetchone()['total']
+        if conn.arquivo:
+            total += conn.execute(sql_arquivo, parametros).fetchone()['total']
+        return total
+    
+    stats = {}
+    
+    if tipo == 'paciente':
+        # Estatísticas do paciente
+        total = contar(
+            queries.STATS_PACIENTE_TOTAL,
+            queries.STATS_ARQUIVADAS_PACIENTE_TOTAL,
+            (user_id,)
+        )
+        
+        # Receitas ativas nunca são arquivadas
+        ativas = conn.execute(
+            queries.STATS_PACIENTE_POR_STATUS,
+            (user_id, 'ativa')
+        ).fetchone()
+        
+        utilizadas = contar(
+            queries.STATS_PACIENTE_POR_STATUS,
+            queries.STATS_ARQUIVADAS_PACIENTE_POR_STATUS,
+            (user_id, 'utilizada')
+        )
+        
+        stats = {
+            'total_receitas': total,
+            'receitas_ativas': ativas['total'],
+            'receitas_utilizadas': utilizadas
+        }
+        
+    elif tipo == 'medico':
+        # Estatísticas do médico
+        total = contar(
+            queries.STATS_MEDICO_TOTAL,
+            queries.STATS_ARQUIVADAS_MEDICO_TOTAL,
+            (user_id,)
+        )
+        
+        ativas = conn.execute(
+            queries.STATS_MEDICO_POR_STATUS,
+            (user_id, 'ativa')
+        ).fetchone()
+        
+        # Paciente com receitas nos dois bancos conta uma vez só
+        if conn.arquivo:
+            pacientes_atendidos = conn.execute(
+                queries.STATS_MEDICO_PACIENTES_COM_ARQUIVO,
+                (user_id, user_id)
             ).fetchone()
-            
+        else:
             pacientes_atendidos = conn.execute(
-                'SELECT COUNT(DISTINCT id_paciente) as pacientes FROM Receita WHERE id_medico = ?',
-                (current_user_id,)
+                queries.STATS_MEDICO_PACIENTES,
+                (user_id,)
             ).fetchone()
-            
-            stats = {
-                'total_receitas_prescritas': total['total'],
-                'receitas_ativas': ativas['ativas'],
-                'pacientes_atendidos': pacientes_atendidos['pacientes']
-            }
-            
-        else:  # admin
-            # Estatísticas gerais
-            total_receitas = conn.execute('SELECT COUNT(*) as total FROM Receita').fetchone()
-            total_usuarios = conn.execute('SELECT COUNT(*) as total FROM Usuario').fetchone()
-            total_medicamentos = conn.execute('SELECT COUNT(*) as total FROM Medicamento').fetchone()
-            total_farmacias = conn.execute('SELECT COUNT(*) as total FROM Farmacia').fetchone()
-            
-            stats = {
-                'total_receitas': total_receitas['total'],
-                'total_usuarios': total_usuarios['total'],
-                'total_medicamentos': total_medicamentos['total'],
-                'total_farmacias': total_farmacias['total']
-            }
         
-        conn.close()
+        stats = {
+            'total_receitas_prescritas': total,
+            'receitas_ativas': ativas['total'],
+            'pacientes_atendidos': pacientes_atendidos['pacientes']
+        }
+        
+    else:  # admin
+        # Estatísticas gerais
+        total_receitas = contar(queries.STATS_TOTAL_RECEITAS, queries.STATS_ARQUIVADAS_TOTAL)
+        total_usuarios = conn.execute(queries.STATS_TOTAL_USUARIOS).fetchone()
+        total_medicamentos = conn.execute(queries.STATS_TOTAL_MEDICAMENTOS).fetchone()
+        total_farmacias = conn.execute(queries.STATS_TOTAL_FARMACIAS).fetchone()
+        
+        stats = {
+            'total_receitas': total_receitas,
+            'total_usuarios': total_usuarios['total'],
+            'total_medicamentos': total_medicamentos['total'],
+            'total_farmacias': total_farmacias['total']
+        }
+    
+    conn.close()
+    return stats
+
+@app.route('/api/receitas/stats', methods=['GET'])
+@token_required
+def get_receitas_stats(current_user_id):
+    """Estatísticas de receitas baseado no tipo de usuário"""
+    try:
+        # Verificar tipo do usuário
+        user = get_user(current_user_id)
+        
+        # Requisições simultâneas com a mesma chave compartilham uma única
+        # execução; as estatísticas de admin são as mesmas para todos
+        chave = (user['tipo'], None if user['tipo'] == 'admin' else current_user_id)
+        stats = singleflight.do(
+            'receitas_stats', chave,
+            lambda: calcular_stats(user['tipo'], current_user_id)
+        )
+        
         return jsonify(stats), 200
         
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
 
-# Atualizar a rota existente de detalhes da receita para incluir número da receita
-@app.route('/api/receitas/<int:receita_id>', methods=['GET'])
+# ROTAS DE RELATÓRIOS
+
+@app.route('/api/analytics/receitas', methods=['GET'])
 @token_required
-def get_receita_detalhes_updated(current_user_id, receita_id):
-    """Obter detalhes de uma receita específica com número formatado"""
+def get_analytics_receitas(current_user_id):
+    """Receitas emitidas por dimensão em um período, das tabelas consolidadas (apenas admins)"""
     try:
-        conn = get_db()
+        current_user = get_user(current_user_id)
         
-        # Verificar tipo do usuário
-        user = conn.execute(
-            'SELECT tipo FROM Usuario WHERE id_usuario = ?',
-            (current_user_id,)
-        ).fetchone()
+        if current_user['tipo'] != 'admin':
+            return jsonify({'message': 'Acesso negado'}), 403
         
-        # Montar query baseada no tipo de usuário
-        if user['tipo'] == 'paciente':
-            # Paciente só vê suas próprias receitas
-            receita = conn.execute(
-                '''SELECT r.*, um.nome as nome_medico, m.especialidade, m.crm
-                   FROM Receita r 
-                   JOIN Medico m ON r.id_medico = m.id_medico
-                   JOIN Usuario um ON m.id_medico = um.id_usuario
-                   WHERE r.id_receita = ? AND r.id_paciente = ?''',
-                (receita_id, current_user_id)
-            ).fetchone()
-        elif user['tipo'] == 'medico':
-            # Médico só vê receitas que prescreveu
-            receita = conn.execute(
-                '''SELECT r.*, up.nome as nome_paciente
-                   FROM Receita r 
-                   JOIN Paciente p ON r.id_paciente = p.id_paciente
-                   JOIN Usuario up ON p.id_paciente = up.id_usuario
-                   WHERE r.id_receita = ? AND r.id_medico = ?''',
-                (receita_id, current_user_id)
-            ).fetchone()
-        else:  # admin
-            # Admin vê todas as receitas
-            receita = conn.execute(
-                '''SELECT r.*, up.nome as nome_paciente, um.nome as nome_medico, m.especialidade, m.crm
-                   FROM Receita r 
-                   JOIN Paciente p ON r.id_paciente = p.id_paciente
-                   JOIN Usuario up ON p.id_paciente = up.id_usuario
-                   JOIN Medico m ON r.id_medico = m.id_medico
-                   JOIN Usuario um ON m.id_medico = um.id_usuario
-                   WHERE r.id_receita = ?''',
-                (receita_id,)
-            ).fetchone()
+        dimensao = request.args.get('dim', 'medico')
+        if dimensao not in analytics.DIMENSOES:
+            return jsonify({'message': f'dim deve ser uma de: {", ".join(analytics.DIMENSOES)}'}), 400
         
-        if not receita:
-            conn.close()
-            return jsonify({'message': 'Receita não encontrada'}), 404
+        agrupar = request.args.get('agrupar', 'total')
+        if agrupar not in ('total', 'mes'):
+            return jsonify({'message': 'agrupar deve ser total ou mes'}), 400
         
-        # Buscar medicamentos da receita
-        medicamentos = conn.execute(
-            '''SELECT rm.*, med.nome, med.principio_ativo, med.fabricante
-               FROM ReceitaMedicamento rm
-               JOIN Medicamento med ON rm.id_medicamento = med.id_medicamento
-               WHERE rm.id_receita = ?''',
-            (receita_id,)
+        try:
+            ate = date.fromisoformat(request.args['ate']) if request.args.get('ate') else date.today()
+            de = date.fromisoformat(request.args['de']) if request.args.get('de') else ate - timedelta(days=29)
+            limite = int(request.args.get('limite', ANALYTICS_LIMITE))
+        except ValueError:
+            return jsonify({'message': 'de e ate devem estar no formato AAAA-MM-DD e limite ser um inteiro'}), 400
+        if de > ate:
+            return jsonify({'message': 'de deve ser anterior ou igual a ate'}), 400
+        if not 1 <= limite <= ANALYTICS_LIMITE_MAX:
+            return jsonify({'message': f'limite deve estar entre 1 e {ANALYTICS_LIMITE_MAX}'}), 400
+        
+        meses, dias_inicio, dias_fim = analytics.intervalos(de, ate)
+        
+        conn = get_db()
+        linhas = conn.execute(
+            queries.ANALYTICS_TOTAL if agrupar == 'total' else queries.ANALYTICS_POR_MES,
+            (dimensao, *meses, dimensao, *dias_inicio, dimensao, *dias_fim, limite)
         ).fetchall()
         
+        # Médicos e medicamentos são guardados pelo id; o nome vem do cadastro atual
+        nomes = {}
+        if dimensao in NOMES_ANALYTICS and linhas:
+            ids = json.dumps(sorted({int(linha['chave']) for linha in linhas}))
+            nomes = {
+                linha['id']: linha['nome']
+                for linha in conn.execute(NOMES_ANALYTICS[dimensao], (ids,)).fetchall()
+            }
+        progresso = conn.execute(queries.PROGRESSO_ANALYTICS, (analytics.TAREFA,)).fetchone()
         conn.close()
         
-        # Montar resposta
-        receita_dict = dict(receita)
-        receita_dict['medicamentos'] = [dict(med) for med in medicamentos]
+        resultados = []
+        for linha in linhas:
+            item = dict(linha)
+            if dimensao in NOMES_ANALYTICS:
+                item['chave'] = int(item['chave'])
+                item['nome'] = nomes.get(item['chave'])
+            if dimensao != 'medicamento':
+                item.pop('quantidade')
+            resultados.append(item)
+        
+        return jsonify({
+            'dimensao': dimensao,
+            'de': de.isoformat(),
+            'ate': ate.isoformat(),
+            'atualizado_em': progresso['atualizado_em'] if progresso else None,
+            'resultados': resultados
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+@app.route('/api/export/receitas', methods=['GET'])
+@token_required
+def export_receitas(current_user_id):
+    """Exportar receitas com os medicamentos em CSV ou NDJSON, em streaming (apenas admins)"""
+    try:
+        current_user = get_user(current_user_id)
+        
+        if current_user['tipo'] != 'admin':
+            return jsonify({'message': 'Acesso negado'}), 403
         
-        # Adicionar número formatado da receita
-        receita_dict['numero'] = f"#{receita_dict['id_receita']:08d}"
+        formato = request.args.get('formato', 'csv')
+        if formato not in exportacao.FORMATOS:
+            return jsonify({'message': f'formato deve ser um de: {", ".join(exportacao.FORMATOS)}'}), 400
+        
+        try:
+            # apos_id: retomar depois da última receita recebida por completo
+            apos_id = int(request.args.get('apos_id', 0))
+            de = date.fromisoformat(request.args['de']).isoformat() if request.args.get('de') else '0000-01-01'
+            ate = ((date.fromisoformat(request.args['ate']) + timedelta(days=1)).isoformat()
+                   if request.args.get('ate') else '9999-12-31')
+        except ValueError:
+            return jsonify({'message': 'apos_id deve ser inteiro e de/ate estar no formato AAAA-MM-DD'}), 400
         
-        return jsonify(receita_dict), 200
+        comprimir = 'gzip' in request.accept_encodings
+        
+        # A conexão é fechada pelo gerador quando a exportação termina
+        conn = get_db()
+        response = Response(
+            stream_with_context(exportacao.exportar(conn, formato, apos_id, de, ate, comprimir)),
+            mimetype=exportacao.FORMATOS[formato]
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename=receitas.{formato}'
+        response.headers['Vary'] = 'Accept-Encoding'
+        if comprimir:
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
         
     except Exception as e:
-        return jsonify({'message': f'Erro interno: {str(e)}'}), 500        
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+# ROTAS DE PERFILAMENTO
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@token_required
+def list_profiles(current_user_id):
+    """Listar perfis de requisições gravados (apenas admins)"""
+    try:
+        current_user = get_user(current_user_id)
+        
+        if current_user['tipo'] != 'admin':
+            return jsonify({'message': 'Acesso negado'}), 403
+        
+        return jsonify(profiler.list_profiles()), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@token_required
+def get_profile_resultado(current_user_id, profile_id):
+    """Obter um perfil gravado como texto ou arquivo pstats (apenas admins)"""
+    try:
+        current_user = get_user(current_user_id)
+        
+        if current_user['tipo'] != 'admin':
+            return jsonify({'message': 'Acesso negado'}), 403
+        
+        caminho = profiler.get_profile_path(profile_id)
+        if not caminho:
+            return jsonify({'message': 'Perfil não encontrado'}), 404
+        
+        if request.args.get('formato') == 'pstats':
+            return send_file(os.path.abspath(caminho), as_attachment=True,
+                             download_name=f'{profile_id}.pstats')
+        
+        ordenacao = request.args.get('ordenacao', 'cumulative')
+        if ordenacao not in ['cumulative', 'tottime', 'calls']:
+            return jsonify({'message': 'Ordenação deve ser cumulative, tottime ou calls'}), 400
+        
+        texto = profiler.format_profile(caminho, ordenacao)
+        return app.response_class(texto, mimetype='text/plain'), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
 # ROTA DE SAÚDE
 @app.route('/api/health', methods=['GET'])
@@ -1031,5 +1660,8 @@ if __name__ == '__main__':
     # Criar banco de dados se não existir
     if not os.path.exists(DATABASE):
         init_db()
+    else:
+        # Bancos existentes recebem as migrações criadas depois deles
+        migrate.apply_migrations(DATABASE, verbose=True)
     
     app.run(debug=True, host='0.0.0.0', port=5000)
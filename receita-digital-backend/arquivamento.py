@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Arquivamento das receitas antigas em um banco separado
+
+Receitas em status final (utilizada, cancelada, expirada) emitidas há mais
+de ARQUIVO_MESES meses são movidas, com as linhas de medicamento e a versão
+do documento, para o arquivo ARQUIVO_DB. Assim o banco principal e os seus
+índices ficam pequenos o bastante para caber no cache de páginas.
+
+A API anexa o arquivo somente leitura como "arquivo" (veja anexar): as rotas
+de histórico consultam também as tabelas arquivo.* quando o período pedido
+alcança as receitas arquivadas, e a receita aparece no mesmo lugar de antes.
+
+Com o banco principal em WAL uma transação entre os dois arquivos não é
+atômica, então cada lote é movido em dois passos: a cópia é gravada no
+arquivo e só depois as receitas são apagadas do banco principal. Se o job
+parar no meio, a receita fica nos dois bancos (as rotas preferem a do banco
+principal) e é movida de novo na próxima execução. Receitas alteradas entre
+os dois passos (versão diferente da copiada) ficam no banco principal.
+
+Dias ainda não consolidados pelo analytics.py não são arquivados, já que as
+estatísticas são calculadas a partir do banco principal.
+
+O job também apaga de CodigoRevogacao as revogações de receitas vencidas:
+os códigos delas já são recusados pela data (veja codigos.py).
+
+Exemplos:
+    python arquivamento.py
+    python arquivamento.py --meses 24 --db outro.db --arquivo outro_arquivo.db
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+from urllib.request import pathname2url
+
+import analytics
+import migrate
+
+ARQUIVO_DB = os.getenv('ARQUIVO_DB', 'arquivo.db')
+
+# Idade mínima (em meses) das receitas arquivadas
+ARQUIVO_MESES = int(os.getenv('ARQUIVO_MESES', '12'))
+
+ARQUIVO_LOTE = int(os.getenv('ARQUIVO_LOTE', '1000'))
+
+STATUS_FINAIS = ('utilizada', 'cancelada', 'expirada')
+
+# Mesmas colunas do banco principal, sem chaves estrangeiras nem CHECKs; os
+# índices cobrem as listas por paciente, por médico e geral
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS Receita (
+    id_receita INTEGER PRIMARY KEY,
+    id_paciente INTEGER NOT NULL,
+    id_medico INTEGER NOT NULL,
+    data_emissao DATETIME NOT NULL,
+    data_validade DATE,
+    diagnostico TEXT NOT NULL,
+    observacoes TEXT,
+    status TEXT
+);
+
+CREATE TABLE IF NOT EXISTS ReceitaMedicamento (
+    id_receita_medicamento INTEGER PRIMARY KEY,
+    id_receita INTEGER NOT NULL,
+    id_medicamento INTEGER NOT NULL,
+    dosagem TEXT NOT NULL,
+    quantidade INTEGER NOT NULL,
+    posologia TEXT NOT NULL,
+    observacoes TEXT
+);
+
+CREATE TABLE IF NOT EXISTS ReceitaVersao (
+    id_receita INTEGER PRIMARY KEY,
+    versao INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_receita_paciente_emissao ON Receita(id_paciente, data_emissao DESC);
+CREATE INDEX IF NOT EXISTS idx_receita_medico_emissao ON Receita(id_medico, data_emissao DESC);
+CREATE INDEX IF NOT EXISTS idx_receita_emissao ON Receita(data_emissao DESC);
+CREATE INDEX IF NOT EXISTS idx_receita_medicamento_receita ON ReceitaMedicamento(id_receita);
+'''
+
+_COLUNAS_RECEITA = ('id_receita, id_paciente, id_medico, data_emissao, data_validade, '
+                    'diagnostico, observacoes, status')
+
+_COLUNAS_ITEM = ('id_receita_medicamento, id_receita, id_medicamento, dosagem, '
+                 'quantidade, posologia, observacoes')
+
+_PROXIMO_LOTE = f'''SELECT id_receita FROM Receita
+                    WHERE id_receita > ? AND status IN ({', '.join('?' * len(STATUS_FINAIS))})
+                      AND +data_emissao < ?
+                    ORDER BY id_receita
+                    LIMIT ?'''
+
+_COPIAR_RECEITAS = f'''INSERT OR REPLACE INTO arquivo.Receita ({_COLUNAS_RECEITA})
+                       SELECT {', '.join('r.' + c.strip() for c in _COLUNAS_RECEITA.split(','))}
+                       FROM json_each(?) ids
+                       CROSS JOIN Receita r ON r.id_receita = ids.value'''
+
+_APAGAR_ITENS_COPIADOS = '''DELETE FROM arquivo.ReceitaMedicamento
+                            WHERE id_receita IN (SELECT value FROM json_each(?))'''
+
+_COPIAR_ITENS = f'''INSERT INTO arquivo.ReceitaMedicamento ({_COLUNAS_ITEM})
+                    SELECT {', '.join('rm.' + c.strip() for c in _COLUNAS_ITEM.split(','))}
+                    FROM json_each(?) ids
+                    CROSS JOIN ReceitaMedicamento rm ON rm.id_receita = ids.value'''
+
+_COPIAR_VERSOES = '''INSERT OR REPLACE INTO arquivo.ReceitaVersao (id_receita, versao)
+                     SELECT ids.value, COALESCE(v.versao, 0)
+                     FROM json_each(?) ids
+                     LEFT JOIN ReceitaVersao v ON v.id_receita = ids.value'''
+
+# Receitas do lote com a mesma versão da cópia, e as que mudaram depois dela
+_CONFERIR_VERSOES = '''SELECT ids.value, COALESCE(v.versao, 0) = av.versao
+                       FROM json_each(?) ids
+                       JOIN arquivo.ReceitaVersao av ON av.id_receita = ids.value
+                       LEFT JOIN ReceitaVersao v ON v.id_receita = ids.value'''
+
+_APAGAR = {
+    'main': ('DELETE FROM ReceitaMedicamento WHERE id_receita IN (SELECT value FROM json_each(?))',
+             'DELETE FROM Receita WHERE id_receita IN (SELECT value FROM json_each(?))'),
+    'arquivo': ('DELETE FROM arquivo.ReceitaMedicamento WHERE id_receita IN (SELECT value FROM json_each(?))',
+                'DELETE FROM arquivo.Receita WHERE id_receita IN (SELECT value FROM json_each(?))',
+                'DELETE FROM arquivo.ReceitaVersao WHERE id_receita IN (SELECT value FROM json_each(?))'),
+}
+
+
+# Revogações que não fazem mais diferença: o código vencido já é recusado
+_APAGAR_REVOGACOES_VENCIDAS = 'DELETE FROM CodigoRevogacao WHERE validade < ?'
+
+
+def criar_arquivo(caminho=None):
+    """Cria o banco de arquivo (ou as tabelas que faltarem)"""
+    conn = sqlite3.connect(caminho or ARQUIVO_DB)
+    try:
+        # Leitores abrem o arquivo somente leitura, o que o WAL não permite
+        # sem o arquivo -shm; o journal tradicional não tem essa restrição
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.executescript(_SCHEMA)
+    finally:
+        conn.close()
+
+
+def anexar(conn, caminho=None):
+    """Anexa o arquivo somente leitura como "arquivo"; False se ele não existir"""
+    caminho = caminho or ARQUIVO_DB
+    if not os.path.exists(caminho):
+        return False
+    uri = f'file:{pathname2url(os.path.abspath(caminho))}?mode=ro'
+    conn.execute('ATTACH DATABASE ? AS arquivo', (uri,))
+    return True
+
+
+def _data_de_corte(conn, meses, hoje):
+    """Primeiro dia do mês de meses atrás, sem passar do último dia consolidado"""
+    mes = hoje.year * 12 + hoje.month - 1 - meses
+    corte = date(mes // 12, mes % 12 + 1, 1)
+    progresso = conn.execute('SELECT ultimo_dia FROM AnalyticsProgresso WHERE tarefa = ?',
+                             (analytics.TAREFA,)).fetchone()
+    if progresso and progresso[0]:
+        corte = min(corte, date.fromisoformat(progresso[0]) + timedelta(days=1))
+    return corte
+
+
+def _mover_lote(conn, ids):
+    """Copia o lote para o arquivo e depois apaga do banco principal"""
+    lote = json.dumps(ids)
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(_COPIAR_RECEITAS, (lote,))
+        conn.execute(_APAGAR_ITENS_COPIADOS, (lote,))
+        conn.execute(_COPIAR_ITENS, (lote,))
+        conn.execute(_COPIAR_VERSOES, (lote,))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conferidas = conn.execute(_CONFERIR_VERSOES, (lote,)).fetchall()
+        iguais = json.dumps([id_receita for id_receita, igual in conferidas if igual])
+        alteradas = [id_receita for id_receita, igual in conferidas if not igual]
+        for comando in _APAGAR['main']:
+            conn.execute(comando, (iguais,))
+        # A cópia desatualizada sai do arquivo; a receita continua no principal
+        for comando in _APAGAR['arquivo']:
+            conn.execute(comando, (json.dumps(alteradas),))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return len(conferidas) - len(alteradas), len(alteradas)
+
+
+def arquivar(database, arquivo=None, meses=None, hoje=None):
+    """
+    Move as receitas antigas em status final para o arquivo, apaga as
+    revogações de códigos vencidos e retorna as contagens
+    """
+    arquivo = arquivo or ARQUIVO_DB
+    meses = ARQUIVO_MESES if meses is None else meses
+    criar_arquivo(arquivo)
+
+    hoje = hoje or date.today()
+    contagem = {'arquivadas': 0, 'alteradas': 0}
+    # isolation_level=None: as transações são controladas explicitamente
+    conn = sqlite3.connect(database, isolation_level=None, timeout=30)
+    try:
+        conn.execute('ATTACH DATABASE ? AS arquivo', (arquivo,))
+        corte = _data_de_corte(conn, meses, hoje)
+        contagem['corte'] = corte.isoformat()
+
+        ultimo = 0
+        while True:
+            ids = [linha[0] for linha in conn.execute(
+                _PROXIMO_LOTE, (ultimo, *STATUS_FINAIS, corte.isoformat(), ARQUIVO_LOTE)
+            )]
+            if not ids:
+                break
+            arquivadas, alteradas = _mover_lote(conn, ids)
+            contagem['arquivadas'] += arquivadas
+            contagem['alteradas'] += alteradas
+            ultimo = ids[-1]
+
+        contagem['revogacoes_apagadas'] = conn.execute(_APAGAR_REVOGACOES_VENCIDAS,
+                                                       (hoje.isoformat(),)).rowcount
+        if contagem['arquivadas']:
+            conn.execute(f'PRAGMA analysis_limit = {migrate.ANALYSIS_LIMIT}')
+            conn.execute('ANALYZE arquivo')
+        return contagem
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Arquivamento das receitas antigas')
+    parser.add_argument('--db', default='database.db', help='arquivo do banco de dados')
+    parser.add_argument('--arquivo', default=None, help=f'banco de arquivo (padrão: {ARQUIVO_DB})')
+    parser.add_argument('--meses', type=int, default=None,
+                        help=f'idade mínima das receitas arquivadas (padrão: {ARQUIVO_MESES})')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    contagem = arquivar(args.db, args.arquivo, args.meses)
+    print(f"{contagem['arquivadas']} receita(s) emitida(s) antes de {contagem['corte']} "
+          f"arquivada(s) em {time.perf_counter() - inicio:.1f}s")
+    if contagem['alteradas']:
+        print(f"{contagem['alteradas']} receita(s) alterada(s) durante a cópia ficaram no banco principal")
+    if contagem['revogacoes_apagadas']:
+        print(f"{contagem['revogacoes_apagadas']} revogação(ões) de códigos vencidos apagada(s)")
+
+
+if __name__ == '__main__':
+    main()
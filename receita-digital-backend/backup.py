@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backup online do banco, sem parar a API
+
+Copiar database.db com a aplicação rodando pode gerar um arquivo corrompido
+(páginas de transações diferentes, ou o WAL ainda não checkpointado). Este
+script usa a API de backup do SQLite, que copia o banco página a página em
+passos de BACKUP_PAGINAS páginas, com uma pausa de BACKUP_PAUSA_MS entre
+eles: cada passo segura o banco por pouco tempo e as requisições continuam
+sendo atendidas entre um passo e outro.
+
+Com o banco em WAL (o modo usado pela API) a cópia é feita dentro de uma
+transação de leitura: ela reflete um único instante do banco, as escritas
+das outras conexões seguem normalmente e não obrigam a cópia a recomeçar.
+O checkpoint do WAL só avança além desse instante quando a cópia termina.
+
+A cópia é gravada em um arquivo temporário, conferida com PRAGMA quick_check
+e só então renomeada; os BACKUP_MANTER backups mais recentes são mantidos.
+Para restaurar, pare a API e substitua o banco (e apague o -wal e o -shm
+antigos) pelo arquivo do backup.
+
+Exemplos:
+    python backup.py
+    python backup.py --db arquivo.db --dir /mnt/backups --manter 30
+"""
+
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+
+# Páginas copiadas por passo e pausa entre os passos
+BACKUP_PAGINAS = int(os.getenv('BACKUP_PAGINAS', '256'))
+BACKUP_PAUSA_MS = float(os.getenv('BACKUP_PAUSA_MS', '5'))
+
+# Quantidade de backups mantidos por banco no diretório
+BACKUP_MANTER = int(os.getenv('BACKUP_MANTER', '7'))
+
+
+class BackupError(Exception):
+    pass
+
+
+def copiar(database, destino, paginas=None, pausa_ms=None):
+    """Copia o banco para destino em passos e retorna as estatísticas da cópia"""
+    paginas = paginas or BACKUP_PAGINAS
+    pausa = (BACKUP_PAUSA_MS if pausa_ms is None else pausa_ms) / 1000
+    temporario = destino + '.tmp'
+    if os.path.exists(temporario):
+        os.remove(temporario)
+
+    estatisticas = {'arquivo': destino, 'passos': 0}
+    inicio = time.perf_counter()
+
+    def progresso(status, restantes, total):
+        estatisticas['passos'] += 1
+        estatisticas['paginas'] = total
+        if restantes and pausa:
+            time.sleep(pausa)
+
+    # isolation_level=None: a transação de leitura é controlada explicitamente
+    origem = sqlite3.connect(database, isolation_level=None, timeout=30)
+    copia = sqlite3.connect(temporario)
+    try:
+        wal = origem.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        if wal:
+            # Fixa o instante da cópia; fora do WAL a transação bloquearia os escritores
+            origem.execute('BEGIN')
+            origem.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        origem.backup(copia, pages=paginas, progress=progresso)
+        if wal:
+            origem.execute('COMMIT')
+        tamanho_pagina = origem.execute('PRAGMA page_size').fetchone()[0]
+
+        # O backup é um arquivo único, sem -wal; ao ser restaurado o migrate
+        # volta o banco para WAL
+        copia.execute('PRAGMA journal_mode = DELETE')
+        verificacao = copia.execute('PRAGMA quick_check').fetchone()[0]
+        if verificacao != 'ok':
+            raise BackupError(f'Cópia de {database} falhou na verificação: {verificacao}')
+    except Exception:
+        copia.close()
+        os.remove(temporario)
+        raise
+    finally:
+        origem.close()
+    copia.close()
+    os.replace(temporario, destino)
+
+    duracao = time.perf_counter() - inicio
+    estatisticas['paginas'] = estatisticas.get('paginas', 0)
+    estatisticas['bytes'] = estatisticas['paginas'] * tamanho_pagina
+    estatisticas['duracao_s'] = round(duracao, 3)
+    estatisticas['mb_por_segundo'] = round(estatisticas['bytes'] / 1024 / 1024 / duracao, 1) if duracao else None
+    return estatisticas
+
+
+def _backups(diretorio, base):
+    """Backups existentes do banco, do mais antigo para o mais recente"""
+    return sorted(glob.glob(os.path.join(diretorio, f'{base}-*.db')))
+
+
+def fazer_backup(database, diretorio=None, manter=None, paginas=None, pausa_ms=None):
+    """Novo backup datado em diretorio; apaga os mais antigos além de manter"""
+    diretorio = diretorio or BACKUP_DIR
+    manter = BACKUP_MANTER if manter is None else manter
+    if not os.path.exists(database):
+        raise BackupError(f'Banco {database} não encontrado')
+    os.makedirs(diretorio, exist_ok=True)
+
+    base = os.path.splitext(os.path.basename(database))[0]
+    destino = os.path.join(diretorio, f'{base}-{datetime.now():%Y%m%d-%H%M%S}.db')
+    estatisticas = copiar(database, destino, paginas, pausa_ms)
+
+    antigos = _backups(diretorio, base)[:-manter] if manter > 0 else []
+    for arquivo in antigos:
+        os.remove(arquivo)
+    estatisticas['removidos'] = len(antigos)
+    return estatisticas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backup online do banco de dados')
+    parser.add_argument('--db', default='database.db', help='arquivo do banco de dados')
+    parser.add_argument('--dir', default=None, help=f'diretório dos backups (padrão: {BACKUP_DIR})')
+    parser.add_argument('--manter', type=int, default=None,
+                        help=f'backups mantidos por banco (padrão: {BACKUP_MANTER})')
+    parser.add_argument('--paginas', type=int, default=None,
+                        help=f'páginas copiadas por passo (padrão: {BACKUP_PAGINAS})')
+    parser.add_argument('--pausa-ms', type=float, default=None,
+                        help=f'pausa entre os passos (padrão: {BACKUP_PAUSA_MS})')
+    args = parser.parse_args()
+
+    try:
+        estatisticas = fazer_backup(args.db, args.dir, args.manter, args.paginas, args.pausa_ms)
+    except (BackupError, sqlite3.Error) as e:
+        print(f'Erro: {e}')
+        sys.exit(1)
+    print(f"Backup em {estatisticas['arquivo']}: {estatisticas['bytes'] / 1024 / 1024:.1f} MB "
+          f"em {estatisticas['duracao_s']}s ({estatisticas['mb_por_segundo']} MB/s, "
+          f"{estatisticas['passos']} passos)")
+    if estatisticas['removidos']:
+        print(f"{estatisticas['removidos']} backup(s) antigo(s) removido(s)")
+
+
+if __name__ == '__main__':
+    main()
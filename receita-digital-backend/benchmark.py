@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark reprodutível da API de receitas
+
+Cria (ou reaproveita) um banco de benchmark na escala pedida, sobe a API em
+um servidor local (ou usa --url), faz login com os usuários gerados e mede
+cada cenário com concorrência fixa. O resultado é gravado em JSON para ser
+comparado entre commits com --comparar.
+
+Exemplos:
+    python benchmark.py --receitas 100000 --saida bench_atual.json
+    python benchmark.py --receitas 100000 --comparar bench_main.json
+    python benchmark.py --cenarios receitas_lista_paciente,receita_detalhe --tempestade-login 32
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+import backup
+import migrate
+import mock_data_generator
+
+# Usuários fixos criados pelo gerador de dados mock
+CREDENCIAIS = {
+    'admin': ('admin@sistema.com', 'admin123'),
+    'medico': ('joao.silva@clinica.com', 'medico123'),
+    'paciente': ('jose.silva@email.com', 'paciente123'),
+}
+
+CENARIOS = [
+    # (nome, método, perfil, caminho)
+    ('login', 'POST', None, '/api/login'),
+    ('receitas_lista_paciente', 'GET', 'paciente', '/api/receitas'),
+    ('receitas_lista_medico', 'GET', 'medico', '/api/receitas'),
+    ('receita_detalhe', 'GET', 'admin', '/api/receitas/{id_receita}'),
+    ('receitas_stats_medico', 'GET', 'medico', '/api/receitas/stats'),
+    ('receitas_stats_admin', 'GET', 'admin', '/api/receitas/stats'),
+    ('receita_criar', 'POST', 'medico', '/api/receitas'),
+    ('receita_verificar', 'POST', 'admin', '/api/receitas/verificar'),
+    ('venda', 'POST', 'admin', '/api/vendas'),
+]
+
+# Códigos conferidos por requisição no cenário receita_verificar
+CODIGOS_POR_VERIFICACAO = 100
+
+
+def semear_banco(caminho, receitas, pacientes, medicos, medicamentos, farmacias, seed):
+    """Cria o banco de benchmark com o schema da aplicação e o gerador de dados mock"""
+    if os.path.exists(caminho):
+        os.remove(caminho)
+
+    with sqlite3.connect(caminho) as conn:
+        with open('sqlite_backend_script.sql', 'r', encoding='utf-8') as f:
+            conn.executescript(f.read())
+    migrate.apply_migrations(caminho)
+
+    rng = random.Random(seed)
+    conn = mock_data_generator.connect(caminho)
+    _, medico_ids, paciente_ids = mock_data_generator.insert_mock_users(
+        conn, mock_data_generator.password_hashes(), medicos, pacientes, rng
+    )
+    medicamento_ids = mock_data_generator.insert_mock_medicamentos(conn, medicamentos, rng)
+    farmacia_ids = mock_data_generator.insert_mock_farmacias(conn, farmacias, rng)
+    mock_data_generator.insert_mock_estoque(conn, farmacia_ids, medicamento_ids, rng=rng)
+    mock_data_generator.insert_mock_receitas(
+        conn, medico_ids, paciente_ids, medicamento_ids, farmacia_ids,
+        receitas, dias_historico=365, seed=seed
+    )
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+
+
+def preparar_vendas(caminho, quantidade, farmacias, seed):
+    """
+    Cria receitas ativas para o cenário de venda, cada uma com medicamentos
+    do estoque de uma das farmácias sorteadas, e guarda o estoque inicial
+    dessas farmácias para a verificação de vendas além do estoque
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(caminho, timeout=30)
+    marcadores = ','.join('?' * len(farmacias))
+    estoque = {
+        (id_farmacia, id_medicamento): quantidade_disponivel
+        for id_farmacia, id_medicamento, quantidade_disponivel in conn.execute(
+            f'SELECT id_farmacia, id_medicamento, quantidade_disponivel FROM EstoqueFarmacia '
+            f'WHERE id_farmacia IN ({marcadores})', farmacias
+        )
+    }
+    catalogo = {}
+    for id_farmacia, id_medicamento in estoque:
+        catalogo.setdefault(id_farmacia, []).append(id_medicamento)
+    id_medico = conn.execute('SELECT id_medico FROM Medico LIMIT 1').fetchone()[0]
+    paciente_ids = [linha[0] for linha in conn.execute('SELECT id_paciente FROM Paciente')]
+    validade = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
+
+    pedidos = []
+    for _ in range(quantidade):
+        id_farmacia = rng.choice(list(catalogo))
+        cursor = conn.execute(
+            'INSERT INTO Receita (id_paciente, id_medico, data_validade, diagnostico, status) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (rng.choice(paciente_ids), id_medico, validade, 'Diagnóstico de benchmark', 'ativa')
+        )
+        medicamentos = rng.sample(catalogo[id_farmacia], min(len(catalogo[id_farmacia]), rng.randint(1, 3)))
+        conn.executemany(
+            'INSERT INTO ReceitaMedicamento (id_receita, id_medicamento, dosagem, quantidade, posologia) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(cursor.lastrowid, id_medicamento, '1 comprimido', rng.randint(1, 3), '1 vez ao dia')
+             for id_medicamento in medicamentos]
+        )
+        pedidos.append((cursor.lastrowid, id_farmacia))
+    ultima_venda = conn.execute('SELECT COALESCE(MAX(id_venda), 0) FROM Venda').fetchone()[0]
+    conn.commit()
+    conn.close()
+    return {'pedidos': pedidos, 'estoque': estoque, 'ultima_venda': ultima_venda}
+
+
+def preparar_codigos(url, caminho, token, quantidade):
+    """Códigos assinados de até quantidade receitas ativas, pedidos à API"""
+    conn = sqlite3.connect(caminho)
+    ids = [linha[0] for linha in conn.execute(
+        "SELECT id_receita FROM Receita WHERE status = 'ativa' LIMIT ?", (quantidade,)
+    )]
+    conn.close()
+    sessao = requests.Session()
+    headers = {'Authorization': f'Bearer {token}'}
+    codigos = []
+    for id_receita in ids:
+        resposta = sessao.get(f'{url}/api/receitas/{id_receita}/codigo', headers=headers)
+        resposta.raise_for_status()
+        codigos.append(resposta.json()['codigo'])
+    return codigos
+
+
+def verificar_vendas(caminho, preparo):
+    """Vendas registradas no cenário e itens de estoque vendidos além do disponível"""
+    conn = sqlite3.connect(caminho, timeout=30)
+    vendido = {}
+    vendas = conn.execute(
+        '''SELECT v.id_farmacia, rm.id_medicamento, rm.quantidade
+           FROM Venda v JOIN ReceitaMedicamento rm ON rm.id_receita = v.id_receita
+           WHERE v.id_venda > ?''', (preparo['ultima_venda'],)
+    ).fetchall()
+    for id_farmacia, id_medicamento, quantidade in vendas:
+        vendido[(id_farmacia, id_medicamento)] = vendido.get((id_farmacia, id_medicamento), 0) + quantidade
+    total_vendas = conn.execute('SELECT COUNT(*) FROM Venda WHERE id_venda > ?',
+                                (preparo['ultima_venda'],)).fetchone()[0]
+
+    # O estoque final tem que ser exatamente o inicial menos o vendido, sem ficar negativo
+    excedentes = 0
+    for (id_farmacia, id_medicamento), inicial in preparo['estoque'].items():
+        final = conn.execute(
+            'SELECT quantidade_disponivel FROM EstoqueFarmacia WHERE id_farmacia = ? AND id_medicamento = ?',
+            (id_farmacia, id_medicamento)
+        ).fetchone()[0]
+        saida = vendido.get((id_farmacia, id_medicamento), 0)
+        if saida > inicial or final != inicial - saida:
+            excedentes += 1
+    conn.close()
+    return total_vendas, excedentes
+
+
+def iniciar_servidor(caminho_banco):
+    """Sobe a API em uma thread usando o banco de benchmark"""
+    import logging
+    from werkzeug.serving import make_server
+    # Sem CODIGO_CHAVES o cenário receita_verificar receberia 503
+    os.environ.setdefault('CODIGO_CHAVES', '1:benchmark')
+    import app as api
+
+    # O log de acesso por requisição distorceria as medições
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    api.DATABASE = caminho_banco
+    servidor = make_server('127.0.0.1', 0, api.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{servidor.server_port}', servidor
+
+
+def login(url, email, senha):
+    resposta = requests.post(f'{url}/api/login', json={'email': email, 'senha': senha})
+    resposta.raise_for_status()
+    return resposta.json()['token']
+
+
+def percentil(valores, p):
+    """Percentil pelo método do posto mais próximo"""
+    if not valores:
+        return None
+    indice = max(0, min(len(valores) - 1, int(round(p / 100 * len(valores) + 0.5)) - 1))
+    return valores[indice]
+
+
+def executar_cenario(url, cenario, tokens, contexto, concorrencia, duracao, aquecimento):
+    nome, metodo, perfil, caminho = cenario
+    latencias, erros = [], 0
+    lock = threading.Lock()
+    inicio_medicao = time.perf_counter() + aquecimento
+    fim = inicio_medicao + duracao
+
+    def trabalhador(semente):
+        nonlocal erros
+        rng = random.Random(semente)
+        sessao = requests.Session()
+        headers = {'Authorization': f'Bearer {tokens[perfil]}'} if perfil else {}
+        while True:
+            agora = time.perf_counter()
+            if agora >= fim:
+                break
+
+            corpo = None
+            if nome == 'login':
+                email, senha = CREDENCIAIS['paciente']
+                corpo = {'email': email, 'senha': senha}
+            elif nome == 'venda':
+                try:
+                    id_receita, id_farmacia = next(contexto['fila_vendas'])
+                except StopIteration:
+                    # Receitas esgotadas: repete uma já dispensada (recusa rápida)
+                    id_receita, id_farmacia = rng.choice(contexto['pedidos'])
+                corpo = {'id_receita': id_receita, 'id_farmacia': id_farmacia}
+            elif nome == 'receita_verificar':
+                corpo = {'codigos': rng.sample(contexto['codigos'],
+                                               min(CODIGOS_POR_VERIFICACAO, len(contexto['codigos'])))}
+            elif nome == 'receita_criar':
+                corpo = {
+                    'id_paciente': rng.choice(contexto['paciente_ids']),
+                    'diagnostico': 'Diagnóstico de benchmark',
+                    'medicamentos': [{
+                        'id_medicamento': rng.randint(1, contexto['medicamentos']),
+                        'dosagem': '1 comprimido', 'quantidade': 1, 'posologia': '1 vez ao dia'
+                    }]
+                }
+            rota = caminho.format(id_receita=rng.randint(1, contexto['receitas']))
+
+            t0 = time.perf_counter()
+            try:
+                resposta = sessao.request(metodo, url + rota, json=corpo, headers=headers)
+                # Na venda, 409 é a recusa esperada (estoque ou receita já utilizada)
+                ok = resposta.status_code < 400 or (nome == 'venda' and resposta.status_code == 409)
+            except requests.RequestException:
+                ok = False
+            t1 = time.perf_counter()
+
+            if t0 >= inicio_medicao:
+                with lock:
+                    latencias.append(t1 - t0)
+                    if not ok:
+                        erros += 1
+
+    threads = [threading.Thread(target=trabalhador, args=(i,)) for i in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencias.sort()
+    total = len(latencias)
+    return {
+        'requisicoes': total,
+        'erros': erros,
+        'throughput_rps': round(total / duracao, 2),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 3) if total else None,
+        'p95_ms': round(percentil(latencias, 95) * 1000, 3) if total else None,
+        'p99_ms': round(percentil(latencias, 99) * 1000, 3) if total else None,
+    }
+
+
+def executar_durante_backup(url, cenario, tokens, contexto, caminho, base, concorrencia, duracao, aquecimento):
+    """Repete o cenário com backups online em sequência e compara com a medição normal"""
+    parar = threading.Event()
+    copias = []
+    diretorio = tempfile.mkdtemp()
+
+    def fazer_backups():
+        while not parar.is_set():
+            copias.append(backup.copiar(caminho, os.path.join(diretorio, 'bench_backup.db')))
+
+    thread = threading.Thread(target=fazer_backups)
+    thread.start()
+    try:
+        metricas = executar_cenario(url, cenario, tokens, contexto, concorrencia, duracao, aquecimento)
+    finally:
+        parar.set()
+        thread.join()
+        shutil.rmtree(diretorio)
+
+    metricas['backups'] = len(copias)
+    metricas['backup_duracao_s'] = round(sum(c['duracao_s'] for c in copias) / len(copias), 3)
+    metricas['backup_mb_por_segundo'] = round(sum(c['mb_por_segundo'] for c in copias) / len(copias), 1)
+    if base['throughput_rps']:
+        metricas['impacto_throughput'] = round(1 - metricas['throughput_rps'] / base['throughput_rps'], 3)
+    return metricas
+
+
+def executar_durante_tempestade_login(url, cenario, tokens, contexto, base, clientes,
+                                     concorrencia, duracao, aquecimento):
+    """Repete o cenário com clientes fazendo login sem parar e compara com a medição normal"""
+    parar = threading.Event()
+    respostas = {'aceitos': 0, 'recusados': 0, 'erros': 0}
+    lock = threading.Lock()
+
+    def fazer_logins():
+        sessao = requests.Session()
+        email, senha = CREDENCIAIS['paciente']
+        while not parar.is_set():
+            try:
+                resposta = sessao.post(f'{url}/api/login', json={'email': email, 'senha': senha})
+                status = resposta.status_code
+            except requests.RequestException:
+                status = None
+            chave = 'aceitos' if status == 200 else 'recusados' if status == 503 else 'erros'
+            with lock:
+                respostas[chave] += 1
+            if chave == 'recusados':
+                # Como um cliente bem comportado, espera o Retry-After
+                parar.wait(float(resposta.headers.get('Retry-After', 1)))
+
+    threads = [threading.Thread(target=fazer_logins) for _ in range(clientes)]
+    for thread in threads:
+        thread.start()
+    try:
+        metricas = executar_cenario(url, cenario, tokens, contexto, concorrencia, duracao, aquecimento)
+    finally:
+        parar.set()
+        for thread in threads:
+            thread.join()
+
+    total = duracao + aquecimento
+    metricas['logins_por_segundo'] = round(respostas['aceitos'] / total, 2)
+    metricas['logins_recusados_por_segundo'] = round(respostas['recusados'] / total, 2)
+    metricas['logins_com_erro'] = respostas['erros']
+    if base['throughput_rps']:
+        metricas['impacto_throughput'] = round(1 - metricas['throughput_rps'] / base['throughput_rps'], 3)
+    if base['p95_ms'] and metricas['p95_ms']:
+        metricas['impacto_p95'] = round(metricas['p95_ms'] / base['p95_ms'] - 1, 3)
+    return metricas
+
+
+def commit_atual():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, base, tolerancia):
+    """Lista os cenários em que p95 ou throughput pioraram além da tolerância"""
+    regressoes = []
+    for nome, resultado in atual['cenarios'].items():
+        anterior = base['cenarios'].get(nome)
+        if not anterior or not resultado['requisicoes'] or not anterior['requisicoes']:
+            continue
+        if resultado['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+            regressoes.append(f"{nome}: p95 {anterior['p95_ms']}ms -> {resultado['p95_ms']}ms")
+        if resultado['throughput_rps'] < anterior['throughput_rps'] * (1 - tolerancia):
+            regressoes.append(
+                f"{nome}: throughput {anterior['throughput_rps']} -> {resultado['throughput_rps']} req/s"
+            )
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da API de receitas')
+    parser.add_argument('--receitas', type=int, default=1000)
+    parser.add_argument('--pacientes', type=int, default=None, help='padrão: receitas / 10')
+    parser.add_argument('--medicos', type=int, default=None, help='padrão: receitas / 100')
+    parser.add_argument('--medicamentos', type=int, default=200)
+    parser.add_argument('--farmacias', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', default='bench.db', help='arquivo do banco de benchmark')
+    parser.add_argument('--reusar', action='store_true', help='não recriar o banco se ele existir')
+    parser.add_argument('--url', help='usar uma API já em execução (o banco deve ter sido semeado)')
+    parser.add_argument('--concorrencia', type=int, default=8)
+    parser.add_argument('--duracao', type=float, default=10.0, help='segundos medidos por cenário')
+    parser.add_argument('--aquecimento', type=float, default=2.0, help='segundos descartados por cenário')
+    parser.add_argument('--vendas', type=int, default=20000, help='receitas criadas para o cenário de venda')
+    parser.add_argument('--farmacias-venda', type=int, default=5,
+                        help='farmácias disputadas pelos terminais no cenário de venda')
+    parser.add_argument('--backup', action='store_true',
+                        help='repetir cada cenário com backups online rodando em paralelo')
+    parser.add_argument('--tempestade-login', type=int, default=0, metavar='CLIENTES',
+                        help='repetir cada cenário com CLIENTES clientes fazendo login sem parar')
+    parser.add_argument('--cenarios', help='lista separada por vírgula (padrão: todos)')
+    parser.add_argument('--saida', help='arquivo JSON de resultado')
+    parser.add_argument('--comparar', help='resultado JSON anterior para detectar regressões')
+    parser.add_argument('--tolerancia', type=float, default=0.10)
+    args = parser.parse_args()
+
+    pacientes = args.pacientes or max(1, args.receitas // 10)
+    medicos = args.medicos or max(1, args.receitas // 100)
+
+    if not (args.reusar and os.path.exists(args.db)):
+        print(f'Semeando {args.db}: {args.receitas} receitas, {pacientes} pacientes, {medicos} médicos...')
+        t0 = time.perf_counter()
+        semear_banco(args.db, args.receitas, pacientes, medicos, args.medicamentos,
+                     args.farmacias, args.seed)
+        print(f'Banco criado em {time.perf_counter() - t0:.1f}s')
+
+    url = args.url
+    if not url:
+        url, _ = iniciar_servidor(args.db)
+
+    contexto = {
+        'receitas': args.receitas,
+        'medicamentos': args.medicamentos,
+        # O gerador cria o admin com id 1, depois os médicos e os pacientes
+        'paciente_ids': range(2 + medicos, 2 + medicos + pacientes),
+    }
+    tokens = {perfil: login(url, email, senha) for perfil, (email, senha) in CREDENCIAIS.items()}
+
+    selecionados = CENARIOS
+    if args.cenarios:
+        nomes = args.cenarios.split(',')
+        selecionados = [c for c in CENARIOS if c[0] in nomes]
+
+    resultado = {
+        'commit': commit_atual(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'parametros': {
+            'receitas': args.receitas, 'pacientes': pacientes, 'medicos': medicos,
+            'medicamentos': args.medicamentos, 'farmacias': args.farmacias, 'seed': args.seed,
+            'concorrencia': args.concorrencia, 'duracao': args.duracao,
+        },
+        'cenarios': {}
+    }
+
+    for cenario in selecionados:
+        print(f'Executando {cenario[0]}...', flush=True)
+        if cenario[0] == 'venda':
+            farmacias = list(range(1, min(args.farmacias, args.farmacias_venda) + 1))
+            preparo = preparar_vendas(args.db, args.vendas, farmacias, args.seed)
+            contexto['pedidos'] = preparo['pedidos']
+            contexto['fila_vendas'] = iter(preparo['pedidos'])
+        if cenario[0] == 'receita_verificar' and 'codigos' not in contexto:
+            contexto['codigos'] = preparar_codigos(url, args.db, tokens['admin'], 1000)
+        metricas = executar_cenario(url, cenario, tokens, contexto,
+                                    args.concorrencia, args.duracao, args.aquecimento)
+        if cenario[0] == 'receita_verificar':
+            metricas['verificacoes_por_segundo'] = round(
+                metricas['throughput_rps'] * min(CODIGOS_POR_VERIFICACAO, len(contexto['codigos'])), 2
+            )
+            print(f'  {metricas["verificacoes_por_segundo"]} códigos conferidos/s')
+        if cenario[0] == 'venda':
+            vendas, excedentes = verificar_vendas(args.db, preparo)
+            metricas['vendas_por_segundo'] = round(vendas / (args.duracao + args.aquecimento), 2)
+            metricas['estoque_excedido'] = excedentes
+            print(f'  {metricas["vendas_por_segundo"]} vendas/s | itens vendidos além do estoque: {excedentes}')
+        resultado['cenarios'][cenario[0]] = metricas
+        print(f"  {metricas['throughput_rps']} req/s | p50 {metricas['p50_ms']}ms | "
+              f"p95 {metricas['p95_ms']}ms | p99 {metricas['p99_ms']}ms | erros {metricas['erros']}")
+
+        # A venda consome as receitas preparadas e não pode ser repetida
+        if args.backup and cenario[0] != 'venda':
+            durante = executar_durante_backup(url, cenario, tokens, contexto, args.db, metricas,
+                                              args.concorrencia, args.duracao, args.aquecimento)
+            metricas['durante_backup'] = durante
+            print(f"  durante backup: {durante['throughput_rps']} req/s | p95 {durante['p95_ms']}ms | "
+                  f"{durante['backups']} backup(s) de {durante['backup_duracao_s']}s | "
+                  f"impacto {durante.get('impacto_throughput', 0):.1%}")
+
+        if args.tempestade_login and cenario[0] not in ('login', 'venda'):
+            durante = executar_durante_tempestade_login(url, cenario, tokens, contexto, metricas,
+                                                        args.tempestade_login, args.concorrencia,
+                                                        args.duracao, args.aquecimento)
+            metricas['durante_tempestade_login'] = durante
+            print(f"  durante tempestade de login: {durante['throughput_rps']} req/s | "
+                  f"p95 {durante['p95_ms']}ms | {durante['logins_por_segundo']} logins/s "
+                  f"({durante['logins_recusados_por_segundo']}/s recusados) | "
+                  f"impacto p95 {durante.get('impacto_p95', 0):.1%}")
+
+    saida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(saida)
+    else:
+        print(saida)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        regressoes = comparar(resultado, base, args.tolerancia)
+        if regressoes:
+            print('\nRegressões encontradas:')
+            for regressao in regressoes:
+                print(f'  - {regressao}')
+            sys.exit(1)
+        print('\nNenhuma regressão acima da tolerância.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Cache em memória com LRU e TTL por namespace
+
+Cada namespace tem limite de entradas e TTL próprios, além de contadores de
+acertos e falhas exportados em /metrics. A invalidação funciona entre
+processos: triggers no banco incrementam a versão do namespace na tabela
+CacheVersao sempre que as tabelas de origem mudam. Cada processo mantém uma
+conexão de observação e consulta PRAGMA data_version (que só muda quando
+outra conexão grava no banco) antes de cada leitura; apenas quando ele muda a
+tabela CacheVersao é relida e os namespaces com versão nova são esvaziados.
+
+O TTL é uma rede de segurança para mudanças feitas sem passar pelos triggers.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import singleflight
+
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1000'))
+CACHE_TTL = float(os.getenv('CACHE_TTL', '300'))
+
+_namespaces = {}
+_namespaces_lock = threading.Lock()
+
+# Estado da conexão de observação (uma por processo)
+_sync_lock = threading.Lock()
+_obter_database = None
+_observador = None
+_observador_chave = None
+_versao_dados = None
+_versoes = {}
+
+
+class Namespace:
+    def __init__(self, nome, max_entries, ttl):
+        self.nome = nome
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entradas = OrderedDict()
+        self.lock = threading.Lock()
+        # Incrementada a cada invalidação; cargas iniciadas antes dela são descartadas
+        self.geracao = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.invalidacoes = 0
+
+    def buscar(self, chave):
+        with self.lock:
+            entrada = self.entradas.get(chave)
+            if entrada is not None:
+                valor, expira_em = entrada
+                if expira_em is None or expira_em > time.monotonic():
+                    self.entradas.move_to_end(chave)
+                    self.acertos += 1
+                    return True, valor, self.geracao
+                del self.entradas[chave]
+            self.falhas += 1
+            return False, None, self.geracao
+
+    def guardar(self, chave, valor, geracao):
+        expira_em = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            if geracao != self.geracao:
+                return
+            self.entradas[chave] = (valor, expira_em)
+            self.entradas.move_to_end(chave)
+            while len(self.entradas) > self.max_entries:
+                self.entradas.popitem(last=False)
+
+    def limpar(self):
+        with self.lock:
+            self.entradas.clear()
+            self.geracao += 1
+            self.invalidacoes += 1
+
+
+def configure(nome, max_entries=None, ttl=None):
+    """Cria (ou reconfigura) um namespace; ttl=0 desliga a expiração por tempo"""
+    with _namespaces_lock:
+        namespace = _namespaces.get(nome)
+        if namespace is None:
+            namespace = _namespaces[nome] = Namespace(
+                nome, max_entries or CACHE_MAX_ENTRIES, CACHE_TTL if ttl is None else ttl
+            )
+        else:
+            namespace.max_entries = max_entries or namespace.max_entries
+            namespace.ttl = namespace.ttl if ttl is None else ttl
+        return namespace
+
+
+def _namespace(nome):
+    return _namespaces.get(nome) or configure(nome)
+
+
+def _sincronizar():
+    """Esvazia os namespaces cuja versão mudou no banco desde a última leitura"""
+    global _observador, _observador_chave, _versao_dados, _versoes
+
+    database = _obter_database() if _obter_database else None
+    if not database:
+        return
+
+    with _sync_lock:
+        # A conexão não pode ser herdada por processos filhos (fork)
+        chave = (database, os.getpid())
+        if _observador is None or _observador_chave != chave:
+            _observador = sqlite3.connect(database, check_same_thread=False)
+            _observador_chave = chave
+            _versao_dados = None
+
+        versao_dados = _observador.execute('PRAGMA data_version').fetchone()[0]
+        if versao_dados == _versao_dados:
+            return
+        try:
+            versoes = dict(_observador.execute('SELECT namespace, versao FROM CacheVersao').fetchall())
+        except sqlite3.OperationalError:
+            # Banco ainda sem a migração da tabela de versões
+            return
+        for nome, versao in versoes.items():
+            namespace = _namespaces.get(nome)
+            if namespace is not None and _versoes.get(nome) != versao:
+                namespace.limpar()
+        _versao_dados, _versoes = versao_dados, versoes
+
+
+def get_or_load(nome, chave, carregar):
+    """
+    Valor da chave no namespace; em caso de falha chama carregar() e guarda
+    o resultado. Chamadas concorrentes para a mesma chave compartilham a carga.
+    """
+    _sincronizar()
+    namespace = _namespace(nome)
+    encontrado, valor, geracao = namespace.buscar(chave)
+    if encontrado:
+        return valor
+
+    def carregar_e_guardar():
+        valor = carregar()
+        if valor is not None:
+            namespace.guardar(chave, valor, geracao)
+        return valor
+
+    # Falhas simultâneas na mesma chave fazem uma única carga
+    return singleflight.do(nome, chave, carregar_e_guardar)
+
+
+def invalidate(nome=None):
+    """Esvazia um namespace deste processo (ou todos)"""
+    if nome is None:
+        alvos = list(_namespaces.values())
+    else:
+        alvos = [_namespaces[nome]] if nome in _namespaces else []
+    for namespace in alvos:
+        namespace.limpar()
+
+
+def stats():
+    """Tamanho e contadores de cada namespace"""
+    return {
+        nome: {
+            'entradas': len(namespace.entradas),
+            'max_entries': namespace.max_entries,
+            'ttl': namespace.ttl,
+            'acertos': namespace.acertos,
+            'falhas': namespace.falhas,
+            'invalidacoes': namespace.invalidacoes
+        }
+        for nome, namespace in list(_namespaces.items())
+    }
+
+
+def metricas():
+    """Séries dos caches para o endpoint /metrics"""
+    series = []
+    for nome, info in stats().items():
+        labels = {'namespace': nome}
+        series.append(('cache_entries', 'gauge', 'Entradas guardadas no cache', labels, info['entradas']))
+        series.append(('cache_requests_total', 'counter', 'Consultas ao cache',
+                       {**labels, 'resultado': 'acerto'}, info['acertos']))
+        series.append(('cache_requests_total', 'counter', 'Consultas ao cache',
+                       {**labels, 'resultado': 'falha'}, info['falhas']))
+        series.append(('cache_invalidations_total', 'counter', 'Invalidações de namespace do cache',
+                       labels, info['invalidacoes']))
+    return series
+
+
+def bind_database(obter_database):
+    """
+    Liga a invalidação entre processos ao banco retornado por
+    obter_database() (uma função, para acompanhar mudanças do caminho)
+    """
+    global _obter_database
+    _obter_database = obter_database
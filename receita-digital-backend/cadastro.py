@@ -0,0 +1,155 @@
+"""
+Cadastro de usuários em lote
+
+Recebe a lista de usuários (pacientes, médicos ou admins) e devolve um
+resultado por linha. A validação roda em etapas sobre o lote inteiro:
+campos de cada linha, repetidos dentro do próprio lote e, com uma consulta
+por campo, e-mails, CPFs e CRMs que já existem no banco. Os CPFs são
+comparados só pelos dígitos, porque o banco guarda formatos misturados.
+
+As senhas das linhas válidas são transformadas em hash no pool de processos
+(veja hashing.py) e os usuários são inseridos em transações de
+CADASTRO_LOTE linhas. Cada linha fica em um savepoint, então um conflito
+com um cadastro feito ao mesmo tempo por outra requisição desfaz só ela.
+"""
+
+import json
+import os
+import re
+import sqlite3
+
+import hashing
+import queries
+
+CADASTRO_LOTE = int(os.getenv('CADASTRO_LOTE', '500'))
+
+TIPOS = ('paciente', 'medico', 'admin')
+
+# Campos únicos de cada usuário e a chave normalizada usada na comparação
+CAMPOS_UNICOS = {'email': 'email', 'cpf': 'cpf_digitos', 'crm': 'crm'}
+
+# Coluna citada pelo SQLite em "UNIQUE constraint failed: ..." e o campo
+_COLUNAS_UNICAS = {
+    'Usuario.email': 'email',
+    'Paciente.cpf': 'cpf',
+    'Paciente.cpf_digitos': 'cpf',
+    'Medico.crm': 'crm',
+}
+
+
+def cpf_digitos(cpf):
+    """CPF só com os dígitos, como na coluna Paciente.cpf_digitos"""
+    return re.sub(r'[.\-\s]', '', cpf) if cpf else None
+
+
+def _texto(item, campo):
+    valor = item.get(campo)
+    return valor.strip() if isinstance(valor, str) and valor.strip() else None
+
+
+def _validar(item):
+    """Dados normalizados da linha, ou a mensagem de erro"""
+    if not isinstance(item, dict):
+        return None, 'Cada usuário deve ser um objeto'
+    dados = {campo: _texto(item, campo) for campo in
+             ('nome', 'email', 'tipo', 'cpf', 'telefone', 'endereco', 'crm', 'especialidade')}
+    # A senha é usada como veio (espaços fazem parte dela)
+    dados['senha'] = item.get('senha') if isinstance(item.get('senha'), str) else None
+    for campo in ('nome', 'email', 'senha', 'tipo'):
+        if not dados[campo]:
+            return None, f'Campo {campo} é obrigatório'
+    if dados['tipo'] not in TIPOS:
+        return None, 'Tipo de usuário inválido'
+    if dados['tipo'] == 'medico' and (not dados['crm'] or not dados['especialidade']):
+        return None, 'CRM e especialidade são obrigatórios para médicos'
+    if dados['tipo'] == 'paciente' and dados['cpf']:
+        dados['cpf_digitos'] = cpf_digitos(dados['cpf'])
+        if not re.fullmatch(r'\d{11}', dados['cpf_digitos']):
+            return None, 'CPF deve ter 11 dígitos'
+    return dados, None
+
+
+def _existentes(conn, sql, valores):
+    if not valores:
+        return set()
+    return {linha[0] for linha in conn.execute(sql, (json.dumps(sorted(valores)),))}
+
+
+def _campo_em_conflito(erro):
+    """Campo único violado segundo a mensagem do IntegrityError, ou None"""
+    mensagem = str(erro)
+    return next((campo for coluna, campo in _COLUNAS_UNICAS.items() if mensagem.endswith(coluna)), None)
+
+
+def _inserir(conn, dados, senha):
+    """Insere o usuário e o perfil; retorna o id"""
+    cursor = conn.execute(queries.INSERIR_USUARIO, (dados['nome'], dados['email'], senha, dados['tipo']))
+    user_id = cursor.lastrowid
+    if dados['tipo'] == 'paciente':
+        conn.execute(queries.INSERIR_PACIENTE, (user_id, dados['cpf'], dados['telefone'], dados['endereco']))
+    elif dados['tipo'] == 'medico':
+        conn.execute(queries.INSERIR_MEDICO, (user_id, dados['crm'], dados['especialidade']))
+    return user_id
+
+
+def cadastrar(conn, itens):
+    """Cadastra os usuários do lote e retorna um resultado por linha, na ordem recebida"""
+    resultados = [None] * len(itens)
+    validos = []
+
+    # Campos obrigatórios e valores repetidos dentro do lote (vale a primeira ocorrência)
+    vistos = {campo: set() for campo in CAMPOS_UNICOS}
+    for linha, item in enumerate(itens):
+        dados, erro = _validar(item)
+        if erro:
+            resultados[linha] = {'linha': linha, 'resultado': 'invalido', 'message': erro}
+            continue
+        repetido = next((campo for campo, chave in CAMPOS_UNICOS.items()
+                         if dados.get(chave) in vistos[campo]), None)
+        if repetido:
+            resultados[linha] = {'linha': linha, 'resultado': 'duplicado', 'campo': repetido}
+            continue
+        for campo, chave in CAMPOS_UNICOS.items():
+            if dados.get(chave):
+                vistos[campo].add(dados[chave])
+        validos.append((linha, dados))
+
+    # Uma consulta por campo para o lote inteiro
+    existentes = {
+        'email': _existentes(conn, queries.EMAILS_EXISTENTES, vistos['email']),
+        'cpf': _existentes(conn, queries.CPFS_EXISTENTES, vistos['cpf']),
+        'crm': _existentes(conn, queries.CRMS_EXISTENTES, vistos['crm']),
+    }
+    novos = []
+    for linha, dados in validos:
+        existente = next((campo for campo, chave in CAMPOS_UNICOS.items()
+                          if dados.get(chave) in existentes[campo]), None)
+        if existente:
+            resultados[linha] = {'linha': linha, 'resultado': 'ja_cadastrado', 'campo': existente}
+        else:
+            novos.append((linha, dados))
+
+    senhas = hashing.gerar_hashes([dados['senha'] for _, dados in novos])
+
+    for inicio in range(0, len(novos), CADASTRO_LOTE):
+        lote = list(zip(novos[inicio:inicio + CADASTRO_LOTE], senhas[inicio:inicio + CADASTRO_LOTE]))
+        conn.execute(queries.INICIAR_ESCRITA)
+        try:
+            for (linha, dados), senha in lote:
+                conn.execute(queries.SAVEPOINT_USUARIO)
+                try:
+                    user_id = _inserir(conn, dados, senha)
+                except sqlite3.IntegrityError as e:
+                    # Cadastrado por outra requisição depois da verificação
+                    conn.execute(queries.DESFAZER_USUARIO)
+                    resultados[linha] = {'linha': linha, 'resultado': 'ja_cadastrado',
+                                         'campo': _campo_em_conflito(e)}
+                else:
+                    resultados[linha] = {'linha': linha, 'resultado': 'criado', 'user_id': user_id}
+                conn.execute(queries.CONFIRMAR_USUARIO)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return resultados
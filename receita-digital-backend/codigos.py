@@ -0,0 +1,239 @@
+"""
+Códigos assinados das receitas, para conferência no balcão da farmácia
+
+O código (conteúdo do QR code) leva os dados mínimos da receita: id,
+paciente, versão do documento, validade e os pares (medicamento,
+quantidade), seguidos de uma assinatura HMAC-SHA256 truncada em 128 bits.
+Vai em base32 sem preenchimento, que cabe no modo alfanumérico do QR code
+(uma receita com 3 medicamentos dá 92 caracteres).
+
+Conferir um código não consulta o banco: bastam a assinatura, a validade e
+o conjunto em memória de receitas com códigos revogados. Esse conjunto vem
+da tabela CodigoRevogacao, preenchida por triggers quando uma receita com
+código emitido muda de versão (uso, cancelamento, alteração). Como em
+cache.py, cada processo tem uma conexão de observação e lê só as linhas
+novas, no máximo a cada CODIGO_SINCRONIZACAO_MS; a venda continua sendo
+garantida pelo banco em /api/vendas.
+
+As chaves vêm de CODIGO_CHAVES ('id:segredo,id:segredo'): a primeira assina
+e as demais continuam valendo na conferência, para a troca de chave. Sem
+ela os códigos ficam desativados (gerar e verificar levantam CodigoError),
+já que uma chave padrão conhecida deixaria qualquer um assinar. Um
+terminal com a chave confere códigos sem rede, mas o HMAC é simétrico: quem
+tem a chave também assina, então ela só deve ir para terminais confiáveis.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+from datetime import date
+
+import queries
+
+CODIGO_CHAVES = os.getenv('CODIGO_CHAVES', '')
+
+# Intervalo mínimo entre duas leituras de CodigoRevogacao por processo
+CODIGO_SINCRONIZACAO_MS = float(os.getenv('CODIGO_SINCRONIZACAO_MS', '500'))
+
+_FORMATO = 1
+
+# formato, chave, id_receita, id_paciente, versão, validade, quantidade de itens
+_CABECALHO = struct.Struct('>BBIIIHB')
+
+# id_medicamento, quantidade
+_ITEM = struct.Struct('>II')
+
+_ASSINATURA = 16
+
+# Validade em dias a partir de 2000-01-01 (dia 1); 0 é receita sem validade
+_EPOCA = date(1999, 12, 31).toordinal()
+
+_chaves = {}
+_chave_atual = None
+
+logger = logging.getLogger(__name__)
+
+# Estado da conexão de observação (uma por processo)
+_sync_lock = threading.Lock()
+_obter_database = None
+_observador = None
+_observador_chave = None
+_versao_dados = None
+_ultimo_seq = 0
+_dia = None
+_proxima_sincronizacao = 0.0
+
+# id_receita -> maior versão com códigos revogados
+_revogadas = {}
+
+_contadores_lock = threading.Lock()
+_contadores = {}
+
+
+class CodigoError(Exception):
+    pass
+
+
+def configurar(chaves=None):
+    """Carrega as chaves no formato de CODIGO_CHAVES; sem nenhuma, os códigos ficam desativados"""
+    global _chaves, _chave_atual
+    especificacao = CODIGO_CHAVES if chaves is None else chaves
+    novas, primeira = {}, None
+    for item in filter(None, (parte.strip() for parte in especificacao.split(','))):
+        identificador, _, segredo = item.partition(':')
+        if not identificador.isdigit() or not 0 < int(identificador) < 256 or not segredo:
+            raise CodigoError(f'Chave inválida em CODIGO_CHAVES: {identificador!r}')
+        novas[int(identificador)] = segredo.encode('utf-8')
+        primeira = primeira or int(identificador)
+    if not novas:
+        logger.warning('CODIGO_CHAVES não configurada: códigos de receita desativados')
+    _chaves, _chave_atual = novas, primeira
+
+
+def exigir_chaves():
+    """Levanta CodigoError se não houver chave de assinatura configurada"""
+    if _chave_atual is None:
+        raise CodigoError('Códigos de receita desativados: CODIGO_CHAVES não configurada')
+
+
+def _assinar(chave, corpo):
+    return hmac.digest(_chaves[chave], corpo, hashlib.sha256)[:_ASSINATURA]
+
+
+def gerar(id_receita, id_paciente, versao, validade, itens):
+    """Código assinado; validade em AAAA-MM-DD (ou None) e itens como (id_medicamento, quantidade)"""
+    exigir_chaves()
+    dias = date.fromisoformat(validade[:10]).toordinal() - _EPOCA if validade else 0
+    try:
+        corpo = (_CABECALHO.pack(_FORMATO, _chave_atual, id_receita, id_paciente, versao, dias, len(itens))
+                 + b''.join(_ITEM.pack(id_medicamento, quantidade) for id_medicamento, quantidade in itens))
+    except struct.error as e:
+        raise ValueError(f'Receita {id_receita} não cabe no código: {e}')
+    return base64.b32encode(corpo + _assinar(_chave_atual, corpo)).decode('ascii').rstrip('=')
+
+
+def _sincronizar():
+    """Traz para a memória as revogações gravadas desde a última leitura"""
+    global _observador, _observador_chave, _versao_dados, _ultimo_seq, _dia
+    global _proxima_sincronizacao, _revogadas
+
+    agora = time.monotonic()
+    if agora < _proxima_sincronizacao:
+        return
+    database = _obter_database() if _obter_database else None
+    if not database:
+        return
+
+    with _sync_lock:
+        if agora < _proxima_sincronizacao:
+            return
+        _proxima_sincronizacao = agora + CODIGO_SINCRONIZACAO_MS / 1000
+
+        # A conexão não pode ser herdada por processos filhos (fork)
+        chave = (database, os.getpid())
+        hoje = date.today().isoformat()
+        revogadas = _revogadas
+        if _observador is None or _observador_chave != chave:
+            _observador = sqlite3.connect(database, check_same_thread=False)
+            _observador_chave = chave
+            _dia = None
+        if _dia != hoje:
+            # Recomeça do zero a cada dia, esquecendo as receitas já vencidas
+            revogadas, _ultimo_seq, _versao_dados, _dia = {}, 0, None, hoje
+
+        versao_dados = _observador.execute('PRAGMA data_version').fetchone()[0]
+        if versao_dados == _versao_dados:
+            return
+        try:
+            linhas = _observador.execute(queries.REVOGACOES_DESDE, (_ultimo_seq, hoje)).fetchall()
+        except sqlite3.OperationalError:
+            # Banco ainda sem a migração da tabela de revogações
+            return
+        for seq, id_receita, versao in linhas:
+            if versao > revogadas.get(id_receita, -1):
+                revogadas[id_receita] = versao
+        if linhas:
+            _ultimo_seq = linhas[-1][0]
+        _versao_dados, _revogadas = versao_dados, revogadas
+
+
+def _conferir(codigo, hoje):
+    """Resultado da conferência de um código, sem consultar o banco"""
+    if not isinstance(codigo, str) or len(codigo) > 4096:
+        return {'valido': False, 'motivo': 'formato'}
+    texto = codigo.strip().upper()
+    try:
+        dados = base64.b32decode(texto + '=' * (-len(texto) % 8))
+    except (binascii.Error, ValueError):
+        return {'valido': False, 'motivo': 'formato'}
+    if len(dados) < _CABECALHO.size + _ASSINATURA:
+        return {'valido': False, 'motivo': 'formato'}
+
+    corpo, assinatura = dados[:-_ASSINATURA], dados[-_ASSINATURA:]
+    formato, chave, id_receita, id_paciente, versao, dias, quantidade = _CABECALHO.unpack_from(corpo)
+    if formato != _FORMATO or len(corpo) != _CABECALHO.size + quantidade * _ITEM.size:
+        return {'valido': False, 'motivo': 'formato'}
+    if chave not in _chaves or not hmac.compare_digest(_assinar(chave, corpo), assinatura):
+        return {'valido': False, 'motivo': 'assinatura'}
+
+    if versao <= _revogadas.get(id_receita, -1):
+        return {'valido': False, 'motivo': 'revogada', 'id_receita': id_receita}
+    if dias and dias < hoje:
+        return {'valido': False, 'motivo': 'vencida', 'id_receita': id_receita}
+    return {
+        'valido': True,
+        'receita': {
+            'id_receita': id_receita,
+            'id_paciente': id_paciente,
+            'versao': versao,
+            'data_validade': date.fromordinal(_EPOCA + dias).isoformat() if dias else None,
+            'medicamentos': [
+                {'id_medicamento': id_medicamento, 'quantidade': quantidade}
+                for id_medicamento, quantidade in _ITEM.iter_unpack(corpo[_CABECALHO.size:])
+            ],
+        },
+    }
+
+
+def verificar(codigos):
+    """Confere os códigos e retorna um resultado por código, na mesma ordem"""
+    exigir_chaves()
+    _sincronizar()
+    hoje = date.today().toordinal() - _EPOCA
+    resultados = [_conferir(codigo, hoje) for codigo in codigos]
+
+    contagem = {}
+    for resultado in resultados:
+        motivo = resultado.get('motivo', 'valido')
+        contagem[motivo] = contagem.get(motivo, 0) + 1
+    with _contadores_lock:
+        for motivo, quantidade in contagem.items():
+            _contadores[motivo] = _contadores.get(motivo, 0) + quantidade
+    return resultados
+
+
+def bind_database(obter_database):
+    """Liga o conjunto de revogados ao banco retornado por obter_database()"""
+    global _obter_database
+    _obter_database = obter_database
+
+
+def metricas():
+    """Séries da conferência de códigos para o endpoint /metrics"""
+    with _contadores_lock:
+        contadores = dict(_contadores)
+    series = [
+        ('receita_codigo_verificacoes_total', 'counter', 'Códigos de receita conferidos',
+         {'resultado': resultado}, quantidade)
+        for resultado, quantidade in sorted(contadores.items())
+    ]
+    series.append(('receita_codigo_revogadas', 'gauge', 'Receitas com códigos revogados em memória',
+                   {}, len(_revogadas)))
+    return series
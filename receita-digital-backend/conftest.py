@@ -0,0 +1,90 @@
+"""
+Fixtures compartilhadas pelos testes das rotas
+
+banco_api monta um banco pequeno com o schema, as migrações e um usuário de
+cada perfil, e aponta a aplicação para ele. Os tokens são emitidos direto
+com a SECRET_KEY, sem passar pelo login (e pelo pool de hashes).
+"""
+
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import jwt
+import pytest
+
+import migrate
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+
+ADMIN, MEDICO, PACIENTE = 1, 2, 3
+
+FARMACIA = 1
+
+_DADOS = '''
+INSERT INTO Usuario (id_usuario, nome, email, senha, tipo) VALUES
+    (1, 'Admin Teste', 'admin@teste.com', '-', 'admin'),
+    (2, 'Dra. Ana Teste', 'ana@teste.com', '-', 'medico'),
+    (3, 'Paulo Teste', 'paulo@teste.com', '-', 'paciente');
+INSERT INTO Medico (id_medico, crm, especialidade) VALUES (2, 'CRM-T1', 'Clínica Geral');
+INSERT INTO Paciente (id_paciente, cpf) VALUES (3, '123.456.789-01');
+INSERT INTO Farmacia (id_farmacia, cnpj, nome_fantasia, endereco) VALUES
+    (1, '00.000.000/0001-00', 'Farmácia Teste', 'Rua A, 1');
+INSERT INTO Medicamento (id_medicamento, nome, principio_ativo, fabricante) VALUES
+    (1, 'Dipirona 500mg', 'Dipirona Sódica', 'Lab A'),
+    (2, 'Amoxicilina 500mg', 'Amoxicilina', 'Lab B');
+INSERT INTO EstoqueFarmacia (id_farmacia, id_medicamento, preco_unitario, quantidade_disponivel) VALUES
+    (1, 1, 10.0, 100),
+    (1, 2, 25.0, 100);
+'''
+
+
+@pytest.fixture
+def banco_api(tmp_path, monkeypatch):
+    """Caminho do banco de teste, já em uso pela aplicação"""
+    import app as api
+
+    caminho = str(tmp_path / 'api.db')
+    with sqlite3.connect(caminho) as conn:
+        with open(os.path.join(AQUI, 'sqlite_backend_script.sql'), 'r', encoding='utf-8') as f:
+            conn.executescript(f.read())
+    migrate.apply_migrations(caminho, os.path.join(AQUI, 'migrations'))
+    with sqlite3.connect(caminho) as conn:
+        conn.executescript(_DADOS)
+
+    # Sem arquivo.db por perto: o arquivo é procurado no diretório atual
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(api, 'DATABASE', caminho)
+    return caminho
+
+
+@pytest.fixture
+def cliente(banco_api):
+    import app as api
+    return api.app.test_client()
+
+
+def autorizacao(id_usuario):
+    """Cabeçalho Authorization com um token válido para o usuário"""
+    import app as api
+    token = jwt.encode({'user_id': id_usuario, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       api.app.config['SECRET_KEY'], algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def criar_receita(caminho, itens=((1, 2), (2, 1)), validade=None, status='ativa', emissao=None):
+    """Insere uma receita do médico e do paciente de teste e retorna o id"""
+    validade = validade or (date.today() + timedelta(days=30)).isoformat()
+    emissao = emissao or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with sqlite3.connect(caminho) as conn:
+        id_receita = conn.execute(
+            '''INSERT INTO Receita (id_paciente, id_medico, data_emissao, data_validade, diagnostico, status)
+               VALUES (?, ?, ?, ?, 'Teste', ?)''',
+            (PACIENTE, MEDICO, emissao, validade, status)
+        ).lastrowid
+        conn.executemany(
+            '''INSERT INTO ReceitaMedicamento (id_receita, id_medicamento, dosagem, quantidade, posologia)
+               VALUES (?, ?, '500mg', ?, '8/8h')''',
+            [(id_receita, id_medicamento, quantidade) for id_medicamento, quantidade in itens]
+        )
+    return id_receita
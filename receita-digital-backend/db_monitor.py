@@ -0,0 +1,267 @@
+"""
+Instrumentação das consultas SQL por requisição
+
+Conta as instruções executadas, o tempo total gasto no banco e a instrução
+mais lenta de cada requisição. Instruções acima do limite configurado são
+gravadas no log de consultas lentas (JSON por linha) junto com o resultado
+de EXPLAIN QUERY PLAN, sinalizando varreduras completas nas tabelas quentes.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from flask import g, has_request_context, request
+import arquivamento
+import tracing
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'slow_queries.log')
+
+# Tabelas em que uma varredura completa é sempre um problema
+HOT_TABLES = ('Receita', 'ReceitaMedicamento')
+
+slow_query_logger = logging.getLogger('receita_digital.slow_query')
+
+_conexoes_lock = threading.Lock()
+_conexoes = {'abertas': 0, 'total': 0}
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que mede o tempo de execução e de leitura de cada instrução"""
+
+    _consulta = None
+
+    def _medir(self, metodo, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            _acumular(self._consulta, time.perf_counter() - inicio)
+
+    def execute(self, sql, parameters=()):
+        self._consulta = _nova_consulta(self.connection, sql, parameters)
+        with tracing.span('db.query', {'db.system': 'sqlite', 'db.statement': _normalizar_sql(sql)}):
+            return self._medir(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._consulta = _nova_consulta(self.connection, sql, None)
+        with tracing.span('db.query', {'db.system': 'sqlite', 'db.statement': _normalizar_sql(sql)}):
+            return self._medir(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return self._medir(super().fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._medir(super().fetchmany)
+        return self._medir(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._medir(super().fetchall)
+
+    def __next__(self):
+        return self._medir(super().__next__)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Conexão cujos cursores registram as instruções da requisição atual"""
+
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.database = database
+        self._aberta = True
+        with _conexoes_lock:
+            _conexoes['abertas'] += 1
+            _conexoes['total'] += 1
+
+    def close(self):
+        super().close()
+        self._liberar()
+
+    def __del__(self):
+        self._liberar()
+
+    def _liberar(self):
+        if getattr(self, '_aberta', False):
+            self._aberta = False
+            with _conexoes_lock:
+                _conexoes['abertas'] -= 1
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute do módulo sqlite3 cria o cursor internamente,
+    # sem passar por self.cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_metrics():
+    """Métricas de conexões para o endpoint /metrics"""
+    with _conexoes_lock:
+        abertas, total = _conexoes['abertas'], _conexoes['total']
+    return [
+        ('db_connections_open', 'gauge', 'Conexões SQLite abertas no momento', None, abertas),
+        ('db_connections_opened_total', 'counter', 'Conexões SQLite abertas', None, total),
+    ]
+
+
+def _nova_consulta(conn, sql, parameters):
+    """Registra uma nova instrução nas estatísticas da requisição"""
+    if not has_request_context() or 'db_stats' not in g:
+        return None
+
+    consulta = {
+        'sql': sql,
+        'params': parameters,
+        'database': conn.database,
+        # O plano das consultas lentas precisa do arquivo anexado como na conexão
+        'arquivo': getattr(conn, 'arquivo', False),
+        'tempo': 0.0
+    }
+    g.db_stats['consultas'].append(consulta)
+    return consulta
+
+
+def _acumular(consulta, duracao):
+    if consulta is not None:
+        consulta['tempo'] += duracao
+        g.db_stats['tempo_total'] += duracao
+
+
+def get_request_stats():
+    """Resumo das instruções SQL executadas na requisição atual"""
+    if not has_request_context() or 'db_stats' not in g:
+        return None
+
+    consultas = g.db_stats['consultas']
+    mais_lenta = max(consultas, key=lambda c: c['tempo'], default=None)
+    return {
+        'total': len(consultas),
+        'tempo_ms': g.db_stats['tempo_total'] * 1000,
+        'mais_lenta_ms': mais_lenta['tempo'] * 1000 if mais_lenta else 0.0,
+        'mais_lenta_sql': _normalizar_sql(mais_lenta['sql']) if mais_lenta else None
+    }
+
+
+def _normalizar_sql(sql):
+    return ' '.join(sql.split())
+
+
+def _aliases_tabelas_quentes(sql):
+    """Mapeia nomes e apelidos usados no SQL para as tabelas quentes"""
+    aliases = {}
+    for tabela in HOT_TABLES:
+        aliases[tabela.lower()] = tabela
+        padrao = rf'\b{tabela}\s+(?:AS\s+)?(\w+)'
+        for apelido in re.findall(padrao, sql, flags=re.IGNORECASE):
+            if apelido.upper() not in ('JOIN', 'WHERE', 'ON', 'LEFT', 'INNER',
+                                       'ORDER', 'GROUP', 'SET', 'VALUES'):
+                aliases[apelido.lower()] = tabela
+    return aliases
+
+
+def tabelas_varridas(plano, sql):
+    """
+    Retorna as tabelas quentes lidas por varredura completa em um plano
+    de EXPLAIN QUERY PLAN (linhas "SCAN x" sem uso de índice)
+    """
+    aliases = _aliases_tabelas_quentes(sql)
+    varridas = []
+    for detalhe in plano:
+        match = re.match(r'SCAN (?:TABLE )?(\w+)', detalhe)
+        if not match or 'USING' in detalhe:
+            continue
+        tabela = aliases.get(match.group(1).lower())
+        if tabela and tabela not in varridas:
+            varridas.append(tabela)
+    return varridas
+
+
+def explain_query_plan(conn, sql, parameters=()):
+    """Executa EXPLAIN QUERY PLAN e retorna a coluna de detalhe de cada passo"""
+    linhas = conn.execute(f'EXPLAIN QUERY PLAN {sql}', parameters or ()).fetchall()
+    return [linha[3] for linha in linhas]
+
+
+def _registrar_consulta_lenta(consulta, rota, metodo):
+    """Grava uma instrução lenta no log, com o plano de execução se for leitura"""
+    sql = _normalizar_sql(consulta['sql'])
+    registro = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'rota': rota,
+        'metodo': metodo,
+        'duracao_ms': round(consulta['tempo'] * 1000, 3),
+        'sql': sql
+    }
+
+    if sql.upper().startswith(('SELECT', 'WITH')):
+        try:
+            conn = sqlite3.connect(consulta['database'])
+            try:
+                if consulta['arquivo']:
+                    arquivamento.anexar(conn)
+                plano = explain_query_plan(conn, consulta['sql'], consulta['params'])
+            finally:
+                conn.close()
+            registro['plano'] = plano
+            registro['varredura_tabelas_quentes'] = tabelas_varridas(plano, sql)
+        except sqlite3.Error as e:
+            registro['erro_plano'] = str(e)
+
+    slow_query_logger.warning(json.dumps(registro, ensure_ascii=False))
+
+
+def _registrar_consultas_lentas(consultas, rota, metodo):
+    for consulta in consultas:
+        if consulta['tempo'] * 1000 >= SLOW_QUERY_MS:
+            _registrar_consulta_lenta(consulta, rota, metodo)
+
+
+def init_app(app):
+    """Registra os hooks de instrumentação na aplicação Flask"""
+    if SLOW_QUERY_LOG and not slow_query_logger.handlers:
+        handler = logging.FileHandler(SLOW_QUERY_LOG, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.WARNING)
+        slow_query_logger.propagate = False
+
+    @app.before_request
+    def iniciar_estatisticas_db():
+        g.db_stats = {'consultas': [], 'tempo_total': 0.0}
+
+    @app.after_request
+    def finalizar_estatisticas_db(response):
+        stats = get_request_stats()
+        if stats is None:
+            return response
+
+        consultas = g.db_stats['consultas']
+        rota = request.url_rule.rule if request.url_rule else request.path
+        metodo = request.method
+        if response.is_streamed:
+            # Respostas em streaming (exportação) executam e leem as consultas
+            # depois deste hook, enquanto o corpo é enviado: a lista continua
+            # recebendo as instruções e é verificada quando a resposta fecha
+            response.call_on_close(lambda: _registrar_consultas_lentas(consultas, rota, metodo))
+        else:
+            _registrar_consultas_lentas(consultas, rota, metodo)
+
+        if app.debug:
+            response.headers['X-DB-Queries'] = str(stats['total'])
+            response.headers['X-DB-Time-Ms'] = f"{stats['tempo_ms']:.3f}"
+            response.headers['X-DB-Slowest-Ms'] = f"{stats['mais_lenta_ms']:.3f}"
+            if stats['mais_lenta_sql']:
+                response.headers['X-DB-Slowest-Query'] = (
+                    stats['mais_lenta_sql'][:200].encode('ascii', 'replace').decode('ascii')
+                )
+
+        return response
@@ -0,0 +1,48 @@
+"""
+Cache do documento de detalhes das receitas
+
+O documento completo de uma receita (dados, médico, paciente e
+medicamentos) é montado em uma única consulta e guardado em memória com a
+chave (id_receita, versao). A versão é incrementada por triggers sempre que
+o status, os dados da receita ou as suas linhas de medicamento mudam, então
+um documento guardado nunca fica desatualizado: uma versão nova simplesmente
+não encontra entrada no cache.
+
+A checagem de permissão continua sendo feita a cada requisição; o cache só
+evita repetir o join pesado.
+"""
+
+import json
+import os
+
+import cache
+import queries
+
+DOCUMENTO_CACHE_SIZE = int(os.getenv('DOCUMENTO_CACHE_SIZE', '5000'))
+
+# Campos que cada perfil não recebe (admin recebe o documento completo)
+CAMPOS_OCULTOS = {
+    'paciente': ('nome_paciente',),
+    'medico': ('nome_medico', 'especialidade', 'crm'),
+}
+
+# A versão faz parte da chave, então as entradas nunca expiram por tempo
+cache.configure('receita_documento', max_entries=DOCUMENTO_CACHE_SIZE, ttl=0)
+
+
+def get_document(conn, receita_id, versao, arquivada=False):
+    """Documento completo da receita na versão pedida, do cache ou do banco"""
+    # A receita arquivada guarda a versão que tinha, então a chave não muda
+    sql = queries.RECEITA_DOCUMENTO_ARQUIVADO if arquivada else queries.RECEITA_DOCUMENTO
+    
+    def carregar():
+        linha = conn.execute(sql, (receita_id,)).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    return cache.get_or_load('receita_documento', (receita_id, versao), carregar)
+
+
+def for_role(documento, tipo):
+    """Cópia do documento apenas com os campos visíveis para o perfil"""
+    ocultos = CAMPOS_OCULTOS.get(tipo, ())
+    return {campo: valor for campo, valor in documento.items() if campo not in ocultos}
@@ -0,0 +1,192 @@
+"""
+Sincronização do estoque das farmácias a partir de snapshots do ERP
+
+A farmácia envia preços e quantidades atuais, o snapshot completo ou só
+parte dele. Os itens são processados em lotes de ESTOQUE_LOTE: cada lote é
+comparado com as linhas atuais em uma consulta e apenas os itens que mudaram
+são gravados, com executemany. Tudo roda em uma única transação, então quem
+lê o estoque nunca vê um snapshot aplicado pela metade.
+
+Snapshots grandes chegam em NDJSON (um item por linha) e são lidos de um
+arquivo temporário linha a linha, sem carregar o corpo inteiro em memória.
+
+Itens que caem para o estoque mínimo são marcados em AlertaEstoque pelo
+trigger estoque_baixo_alerta; distribuir_alertas transforma as marcas em
+notificações para os administradores depois do COMMIT, em uma transação
+própria e curta.
+"""
+
+import io
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+from itertools import islice
+
+import queries
+
+logger = logging.getLogger(__name__)
+
+ESTOQUE_LOTE = int(os.getenv('ESTOQUE_LOTE', '1000'))
+
+# Corpo acima deste tamanho vai para disco em vez de ficar em memória
+ESTOQUE_SPOOL_BYTES = 1024 * 1024
+
+# Mesmo padrão da coluna estoque_minimo no schema
+ESTOQUE_MINIMO_PADRAO = 5
+
+
+class SnapshotInvalido(Exception):
+    pass
+
+
+def copiar_corpo(stream):
+    """Copia o corpo da requisição em blocos para um arquivo temporário"""
+    arquivo = tempfile.SpooledTemporaryFile(max_size=ESTOQUE_SPOOL_BYTES)
+    while True:
+        bloco = stream.read(64 * 1024)
+        if not bloco:
+            break
+        arquivo.write(bloco)
+    arquivo.seek(0)
+    return arquivo
+
+
+def ler_ndjson(arquivo):
+    """Itens de um snapshot NDJSON, um objeto por linha"""
+    linhas = io.TextIOWrapper(arquivo, encoding='utf-8')
+    numero = 0
+    while True:
+        try:
+            linha = linhas.readline()
+        except UnicodeDecodeError:
+            # O texto é decodificado em blocos, então a linha exata não é conhecida
+            raise SnapshotInvalido('Snapshot não está em UTF-8') from None
+        if not linha:
+            return
+        numero += 1
+        if not linha.strip():
+            continue
+        try:
+            yield json.loads(linha)
+        except ValueError:
+            raise SnapshotInvalido(f'Linha {numero}: JSON inválido') from None
+
+
+def _inteiro(valor):
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+
+def _validar(item, posicao):
+    """(id_medicamento, preco, quantidade, estoque_minimo ou None) de um item"""
+    if not isinstance(item, dict):
+        raise SnapshotInvalido(f'Item {posicao}: deve ser um objeto')
+    id_medicamento = item.get('id_medicamento')
+    preco = item.get('preco_unitario')
+    quantidade = item.get('quantidade_disponivel')
+    minimo = item.get('estoque_minimo')
+    if not _inteiro(id_medicamento):
+        raise SnapshotInvalido(f'Item {posicao}: id_medicamento é obrigatório')
+    if not (_inteiro(preco) or isinstance(preco, float)) or preco < 0:
+        raise SnapshotInvalido(f'Item {posicao}: preco_unitario deve ser um número >= 0')
+    if not _inteiro(quantidade) or quantidade < 0:
+        raise SnapshotInvalido(f'Item {posicao}: quantidade_disponivel deve ser um inteiro >= 0')
+    if minimo is not None and (not _inteiro(minimo) or minimo < 0):
+        raise SnapshotInvalido(f'Item {posicao}: estoque_minimo deve ser um inteiro >= 0')
+    return id_medicamento, float(preco), quantidade, minimo
+
+
+def _lotes(itens, tamanho):
+    numerados = enumerate(itens, 1)
+    while True:
+        lote = list(islice(numerados, tamanho))
+        if not lote:
+            return
+        yield lote
+
+
+def sincronizar(conn, id_farmacia, itens, completo=False):
+    """
+    Aplica o snapshot ao estoque da farmácia e retorna as contagens.
+    Com completo=True, medicamentos com saldo que não vieram no snapshot
+    são zerados.
+    """
+    contagem = {'recebidos': 0, 'inseridos': 0, 'atualizados': 0, 'inalterados': 0, 'zerados': 0}
+    vistos = set()
+
+    conn.execute(queries.INICIAR_ESCRITA)
+    try:
+        for lote in _lotes(itens, ESTOQUE_LOTE):
+            # Medicamento repetido no snapshot: vale a última ocorrência
+            por_id = {}
+            for posicao, item in lote:
+                id_medicamento, preco, quantidade, minimo = _validar(item, posicao)
+                por_id[id_medicamento] = (preco, quantidade, minimo)
+            contagem['recebidos'] += len(lote)
+
+            ids = json.dumps(list(por_id))
+            existentes = {linha[0] for linha in conn.execute(queries.MEDICAMENTOS_EXISTENTES, (ids,))}
+            for id_medicamento in por_id:
+                if id_medicamento not in existentes:
+                    raise SnapshotInvalido(f'Medicamento {id_medicamento} não encontrado')
+
+            atuais = {
+                linha[0]: (linha[1], linha[2], linha[3])
+                for linha in conn.execute(queries.ESTOQUE_ATUAL, (ids, id_farmacia))
+            }
+            gravar = []
+            for id_medicamento, (preco, quantidade, minimo) in por_id.items():
+                atual = atuais.get(id_medicamento)
+                if atual is None:
+                    minimo = ESTOQUE_MINIMO_PADRAO if minimo is None else minimo
+                    contagem['inseridos'] += 1
+                else:
+                    minimo = atual[2] if minimo is None else minimo
+                    if (preco, quantidade, minimo) == atual:
+                        contagem['inalterados'] += 1
+                        continue
+                    contagem['atualizados'] += 1
+                gravar.append((id_farmacia, id_medicamento, preco, quantidade, minimo))
+
+            conn.executemany(queries.GRAVAR_ESTOQUE, gravar)
+            if completo:
+                vistos.update(por_id)
+
+        if completo:
+            zerar = [
+                (id_farmacia, linha[0])
+                for linha in conn.execute(queries.ESTOQUE_COM_SALDO, (id_farmacia,)).fetchall()
+                if linha[0] not in vistos
+            ]
+            conn.executemany(queries.ZERAR_ESTOQUE, zerar)
+            contagem['zerados'] = len(zerar)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return contagem
+
+
+def distribuir_alertas(conn):
+    """
+    Cria uma notificação por administrador para cada alerta pendente e
+    retorna quantas foram criadas. Chamada depois de gravar o estoque; uma
+    falha só adia os alertas para a próxima chamada.
+    """
+    try:
+        if not conn.execute(queries.EXISTEM_ALERTAS_ESTOQUE).fetchone():
+            return 0
+        conn.execute(queries.INICIAR_ESCRITA)
+        try:
+            criadas = conn.execute(queries.NOTIFICAR_ALERTAS_ESTOQUE).rowcount
+            conn.execute(queries.APAGAR_ALERTAS_ESTOQUE)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return criadas
+    except sqlite3.Error:
+        logger.exception('Falha ao distribuir os alertas de estoque baixo')
+        return 0
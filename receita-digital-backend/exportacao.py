@@ -0,0 +1,136 @@
+"""
+Exportação das receitas em CSV ou NDJSON, em streaming
+
+As receitas são lidas em lotes de EXPORT_LOTE por faixa de id_receita, cada
+lote em uma consulta curta: a memória fica constante e nenhuma transação de
+leitura fica aberta durante toda a exportação (o que impediria o checkpoint
+do WAL). A saída é enviada em blocos de cerca de 64 KB e, se o cliente
+aceitar, comprimida com gzip enquanto é gerada.
+
+No CSV cada linha é um medicamento da receita, com os dados da receita
+repetidos; no NDJSON cada linha é uma receita com a lista de medicamentos.
+As receitas saem em ordem de id_receita, então uma exportação interrompida
+é retomada passando o último id recebido por completo em apos_id. Com o
+banco de arquivo anexado, cada lote cobre a mesma faixa de id nos dois
+bancos e as receitas arquivadas são intercaladas na ordem de id.
+"""
+
+import csv
+import heapq
+import io
+import json
+import os
+import zlib
+from itertools import groupby
+
+import queries
+
+EXPORT_LOTE = int(os.getenv('EXPORT_LOTE', '5000'))
+
+FORMATOS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+CAMPOS_RECEITA = ('id_receita', 'numero', 'data_emissao', 'data_validade', 'status',
+                  'diagnostico', 'observacoes', 'id_paciente', 'nome_paciente',
+                  'id_medico', 'nome_medico', 'crm', 'especialidade')
+
+CAMPOS_MEDICAMENTO = ('id_medicamento', 'medicamento', 'principio_ativo', 'dosagem',
+                      'quantidade', 'posologia', 'observacoes_medicamento')
+
+_BLOCO = 64 * 1024
+
+
+def _ler(cursor):
+    while True:
+        linhas = cursor.fetchmany(1000)
+        if not linhas:
+            return
+        yield from linhas
+
+
+def _linhas(conn, apos_id, de, ate):
+    """Linhas da exportação, lote a lote, em ordem de id_receita"""
+    arquivo = getattr(conn, 'arquivo', False)
+    while True:
+        fins = [conn.execute(queries.FIM_LOTE_EXPORTACAO, (apos_id, de, ate, EXPORT_LOTE)).fetchone()[0]]
+        if arquivo:
+            fins.append(conn.execute(queries.FIM_LOTE_EXPORTACAO_ARQUIVADAS,
+                                     (apos_id, de, ate, EXPORT_LOTE)).fetchone()[0])
+        fins = [fim for fim in fins if fim is not None]
+        if not fins:
+            return
+        # O menor dos dois fins: no máximo EXPORT_LOTE receitas de cada banco
+        fim = min(fins)
+        principal = _ler(conn.execute(queries.EXPORTAR_RECEITAS, (apos_id, fim, de, ate)))
+        if arquivo:
+            arquivadas = _ler(conn.execute(queries.EXPORTAR_RECEITAS_ARQUIVADAS, (apos_id, fim, de, ate)))
+            yield from heapq.merge(principal, arquivadas, key=lambda linha: linha[0])
+        else:
+            yield from principal
+        apos_id = fim
+
+
+def _em_blocos(textos):
+    """Junta pedaços de texto em blocos de até _BLOCO caracteres"""
+    buffer, tamanho = [], 0
+    for texto in textos:
+        buffer.append(texto)
+        tamanho += len(texto)
+        if tamanho >= _BLOCO:
+            yield ''.join(buffer)
+            buffer, tamanho = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv(linhas):
+    saida = io.StringIO()
+    escritor = csv.writer(saida)
+
+    def linha_csv(valores):
+        saida.seek(0)
+        saida.truncate()
+        escritor.writerow(valores)
+        return saida.getvalue()
+
+    yield linha_csv(CAMPOS_RECEITA + CAMPOS_MEDICAMENTO)
+    for linha in linhas:
+        yield linha_csv(linha)
+
+
+def _ndjson(linhas):
+    # As linhas de uma receita chegam juntas (ordem de id_receita)
+    separador = len(CAMPOS_RECEITA)
+    for _, grupo in groupby(linhas, key=lambda linha: linha[0]):
+        grupo = list(grupo)
+        receita = dict(zip(CAMPOS_RECEITA, grupo[0][:separador]))
+        receita['medicamentos'] = [
+            dict(zip(CAMPOS_MEDICAMENTO, linha[separador:]))
+            for linha in grupo if linha[separador] is not None
+        ]
+        yield json.dumps(receita, ensure_ascii=False) + '\n'
+
+
+def _gzip(blocos):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloco in blocos:
+        dados = compressor.compress(bloco)
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+def exportar(conn, formato, apos_id=0, de='0000-01-01', ate='9999-12-31', comprimir=False):
+    """
+    Blocos (bytes) da exportação das receitas com id maior que apos_id e
+    emitidas em [de, ate). Fecha a conexão ao terminar ou se o cliente desistir.
+    """
+    try:
+        linhas = _linhas(conn, apos_id, de, ate)
+        textos = _csv(linhas) if formato == 'csv' else _ndjson(linhas)
+        blocos = (bloco.encode('utf-8') for bloco in _em_blocos(textos))
+        yield from _gzip(blocos) if comprimir else blocos
+    finally:
+        conn.close()
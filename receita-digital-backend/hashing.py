@@ -0,0 +1,158 @@
+"""
+Hashes de senha em pools de processos
+
+O hash de senha é lento de propósito e segura o GIL: calculado na thread da
+requisição, ele trava as outras requisições do mesmo processo. Aqui os
+hashes rodam em processos separados, criados na primeira vez em que são
+necessários, em dois pools independentes:
+
+- cadastro (HASH_PROCESSOS processos): hashes das senhas novas, em
+  /api/register e no cadastro em lote;
+- login (LOGIN_PROCESSOS processos): verificação das senhas no login, com
+  no máximo LOGIN_FILA_MAX verificações pendentes. Acima disso o login é
+  recusado na hora (PoolOcupado) em vez de formar uma fila que só cresce
+  no pico de abertura das clínicas.
+
+Os processos são criados pelo forkserver (spawn onde ele não existe): um
+fork feito de uma thread de requisição pode herdar locks presos por outras
+threads. Se um processo do pool morre (OOM killer, por exemplo), o pool
+quebrado é descartado e a chamada é repetida uma vez em um pool novo.
+
+O método e o custo do hash vêm de SENHA_METODO, no formato do werkzeug
+(por exemplo 'pbkdf2:sha256:600000' ou 'scrypt:32768:8:1'). Quando ele
+muda, a senha de quem faz login com um hash antigo é refeita no mesmo
+processo da verificação e gravada pela rota.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+HASH_PROCESSOS = int(os.getenv('HASH_PROCESSOS', str(os.cpu_count() or 1)))
+
+LOGIN_PROCESSOS = int(os.getenv('LOGIN_PROCESSOS', str(os.cpu_count() or 1)))
+
+# Verificações de login pendentes (rodando ou na fila) aceitas por processo da API
+LOGIN_FILA_MAX = int(os.getenv('LOGIN_FILA_MAX', str(LOGIN_PROCESSOS * 8)))
+
+# Prioridade (nice) dos processos de login: com poucos núcleos, as demais
+# requisições passam na frente dos hashes
+LOGIN_NICE = int(os.getenv('LOGIN_NICE', '10'))
+
+SENHA_METODO = os.getenv('SENHA_METODO', 'pbkdf2:sha256:600000')
+
+_pools = {}
+_pools_lock = threading.Lock()
+_TAMANHOS = {'cadastro': HASH_PROCESSOS, 'login': LOGIN_PROCESSOS}
+_NICE = {'cadastro': 0, 'login': LOGIN_NICE}
+_METODO_INICIO = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_login_vagas = threading.BoundedSemaphore(LOGIN_FILA_MAX)
+_contadores_lock = threading.Lock()
+_contadores = {'pendentes': 0, 'verificadas': 0, 'recusadas': 0, 'refeitas': 0}
+
+
+class PoolOcupado(Exception):
+    pass
+
+
+def _executor(nome):
+    with _pools_lock:
+        if nome not in _pools:
+            _pools[nome] = ProcessPoolExecutor(max_workers=_TAMANHOS[nome],
+                                               mp_context=multiprocessing.get_context(_METODO_INICIO),
+                                               initializer=_iniciar, initargs=(_NICE[nome],))
+        return _pools[nome]
+
+
+def _executar(nome, chamada):
+    """chamada(executor) no pool; com o pool quebrado, descarta e tenta uma vez em um novo"""
+    executor = _executor(nome)
+    try:
+        return chamada(executor)
+    except BrokenProcessPool:
+        with _pools_lock:
+            if _pools.get(nome) is executor:
+                del _pools[nome]
+        executor.shutdown(wait=False, cancel_futures=True)
+        return chamada(_executor(nome))
+
+
+def _iniciar(nice):
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+
+
+def _gerar(senha):
+    return generate_password_hash(senha, method=SENHA_METODO)
+
+
+@lru_cache(maxsize=None)
+def _prefixo(metodo):
+    """Prefixo que o werkzeug grava para o método (com os custos padrão preenchidos)"""
+    return generate_password_hash('', method=metodo).split('$', 1)[0]
+
+
+def _verificar(hash_atual, senha):
+    """(senha confere, hash novo se o método mudou) — roda no processo do pool"""
+    if not check_password_hash(hash_atual, senha):
+        return False, None
+    if hash_atual.split('$', 1)[0] != _prefixo(SENHA_METODO):
+        return True, _gerar(senha)
+    return True, None
+
+
+def gerar_hashes(senhas):
+    """Hashes das senhas, na mesma ordem, calculados em paralelo"""
+    if not senhas:
+        return []
+    # Poucos blocos por processo: menos idas e voltas entre os processos
+    blocos = max(1, len(senhas) // (HASH_PROCESSOS * 4))
+    return _executar('cadastro', lambda executor: list(executor.map(_gerar, senhas, chunksize=blocos)))
+
+
+def verificar_senha(hash_atual, senha):
+    """
+    Confere a senha no pool de login e retorna (confere, hash novo ou None).
+    Levanta PoolOcupado se já houver LOGIN_FILA_MAX verificações pendentes.
+    """
+    if not _login_vagas.acquire(blocking=False):
+        with _contadores_lock:
+            _contadores['recusadas'] += 1
+        raise PoolOcupado()
+    with _contadores_lock:
+        _contadores['pendentes'] += 1
+    try:
+        confere, novo_hash = _executar(
+            'login', lambda executor: executor.submit(_verificar, hash_atual, senha).result()
+        )
+    finally:
+        _login_vagas.release()
+        with _contadores_lock:
+            _contadores['pendentes'] -= 1
+    with _contadores_lock:
+        _contadores['verificadas'] += 1
+        if novo_hash:
+            _contadores['refeitas'] += 1
+    return confere, novo_hash
+
+
+def metricas():
+    """Séries do pool de login para o endpoint /metrics"""
+    with _contadores_lock:
+        contadores = dict(_contadores)
+    return [
+        ('login_hash_pending', 'gauge', 'Verificações de senha pendentes no pool de login', {},
+         contadores['pendentes']),
+        ('login_hash_total', 'counter', 'Verificações de senha no pool de login',
+         {'resultado': 'verificada'}, contadores['verificadas']),
+        ('login_hash_total', 'counter', 'Verificações de senha no pool de login',
+         {'resultado': 'recusada'}, contadores['recusadas']),
+        ('login_rehash_total', 'counter', 'Senhas refeitas com o SENHA_METODO atual no login', {},
+         contadores['refeitas']),
+    ]
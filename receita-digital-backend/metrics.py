@@ -0,0 +1,343 @@
+"""
+Métricas operacionais no formato texto do Prometheus
+
+Cada processo acumula contadores e histogramas em memória. Com
+METRICS_MULTIPROC_DIR configurado, cada worker grava periodicamente um
+snapshot em <dir>/metrics_<pid>_<início>.json e o endpoint /metrics soma os
+snapshots de todos os workers, de modo que a coleta independe de qual
+worker atende. O início (em ms) distingue um worker novo que recebeu o pid
+de um antigo.
+
+Os contadores de workers encerrados são somados em <dir>/encerrados.json e
+o arquivo do worker é apagado, para o diretório não crescer a cada
+reinício dos workers.
+"""
+
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, g, request
+
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1'))
+
+# Limites (em segundos) dos buckets do histograma de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_HELP = {
+    'http_requests_total': ('counter', 'Total de requisições HTTP por rota, método e status'),
+    'http_request_duration_seconds': ('histogram', 'Latência das requisições HTTP por rota'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_collectors = []
+_ultimo_flush = 0.0
+
+# (pid, início em ms) deste processo
+_processo = None
+
+_ENCERRADOS = 'encerrados.json'
+
+logger = logging.getLogger(__name__)
+
+
+def _chave(nome, labels):
+    return nome + '|' + json.dumps(sorted(labels.items()), ensure_ascii=False)
+
+
+def _separar_chave(chave):
+    nome, labels = chave.split('|', 1)
+    return nome, dict(json.loads(labels))
+
+
+def inc_counter(nome, labels=None, valor=1):
+    """Incrementa um contador"""
+    chave = _chave(nome, labels or {})
+    with _lock:
+        _counters[chave] = _counters.get(chave, 0) + valor
+
+
+def observe_histogram(nome, valor, labels=None, buckets=LATENCY_BUCKETS):
+    """Registra uma observação em um histograma"""
+    chave = _chave(nome, labels or {})
+    with _lock:
+        hist = _histograms.get(chave)
+        if hist is None:
+            hist = _histograms[chave] = {
+                'buckets': list(buckets),
+                'contagens': [0] * len(buckets),
+                'soma': 0.0,
+                'total': 0
+            }
+        for i, limite in enumerate(hist['buckets']):
+            if valor <= limite:
+                hist['contagens'][i] += 1
+                break
+        hist['soma'] += valor
+        hist['total'] += 1
+
+
+def register_collector(coletor):
+    """
+    Registra uma função chamada a cada coleta que retorna uma lista de
+    séries no formato (nome, tipo, ajuda, labels, valor), com tipo 'gauge'
+    ou 'counter'. Os valores de processos diferentes são somados.
+    """
+    _collectors.append(coletor)
+
+
+def _coletar_coletores():
+    gauges = {}
+    for coletor in _collectors:
+        try:
+            for nome, tipo, ajuda, labels, valor in coletor():
+                _HELP.setdefault(nome, (tipo, ajuda))
+                gauges[_chave(nome, labels or {})] = valor
+        except Exception:
+            # Um coletor com defeito não derruba o /metrics inteiro
+            logger.exception('Erro ao coletar métricas de %r', coletor)
+    return gauges
+
+
+def _identidade():
+    global _processo
+    # Depois de um fork o filho é outro worker e grava em outro arquivo
+    if _processo is None or _processo[0] != os.getpid():
+        _processo = (os.getpid(), int(time.time() * 1000))
+    return _processo
+
+
+def _snapshot():
+    with _lock:
+        counters = dict(_counters)
+        histograms = {
+            chave: {**hist, 'contagens': list(hist['contagens'])}
+            for chave, hist in _histograms.items()
+        }
+    pid, inicio = _identidade()
+    return {
+        'pid': pid,
+        'inicio': inicio,
+        'counters': counters,
+        'histograms': histograms,
+        'gauges': _coletar_coletores(),
+        'help': _HELP
+    }
+
+
+def _vazio():
+    return {'counters': {}, 'histograms': {}, 'gauges': {}, 'help': {}}
+
+
+def _somar(total, snapshot):
+    """Soma os valores do snapshot no total"""
+    total['help'].update(snapshot['help'])
+    for chave, valor in snapshot['counters'].items():
+        total['counters'][chave] = total['counters'].get(chave, 0) + valor
+    for chave, valor in snapshot['gauges'].items():
+        total['gauges'][chave] = total['gauges'].get(chave, 0) + valor
+    for chave, hist in snapshot['histograms'].items():
+        atual = total['histograms'].get(chave)
+        if atual is None:
+            total['histograms'][chave] = {**hist, 'contagens': list(hist['contagens'])}
+            continue
+        atual['contagens'] = [a + b for a, b in zip(atual['contagens'], hist['contagens'])]
+        atual['soma'] += hist['soma']
+        atual['total'] += hist['total']
+
+
+def _ler(caminho):
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar(destino, dados):
+    temporario = destino + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False)
+    os.replace(temporario, destino)
+
+
+def flush(force=False):
+    """Grava o snapshot deste processo no diretório compartilhado"""
+    global _ultimo_flush
+
+    if not METRICS_MULTIPROC_DIR:
+        return
+    agora = time.monotonic()
+    if not force and agora - _ultimo_flush < METRICS_FLUSH_INTERVAL:
+        return
+    _ultimo_flush = agora
+
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    pid, inicio = _identidade()
+    _gravar(os.path.join(METRICS_MULTIPROC_DIR, f'metrics_{pid}_{inicio}.json'), _snapshot())
+
+
+def _processo_ativo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _trava():
+    """Exclusão entre os processos que somam os workers encerrados"""
+    with open(os.path.join(METRICS_MULTIPROC_DIR, '.trava'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _mesclar_encerrados(caminhos):
+    """Soma os snapshots de workers encerrados em encerrados.json e apaga os arquivos"""
+    destino = os.path.join(METRICS_MULTIPROC_DIR, _ENCERRADOS)
+    with _trava():
+        total = _ler(destino) or {**_vazio(), 'mesclados': []}
+        # Arquivos já somados que não chegaram a ser apagados (processo caiu)
+        mesclados = set(total['mesclados'])
+        for caminho in caminhos:
+            nome = os.path.basename(caminho)
+            snapshot = None if nome in mesclados else _ler(caminho)
+            if snapshot is None:
+                continue
+            # Contadores de workers encerrados continuam valendo; gauges não
+            snapshot['gauges'] = {
+                chave: valor for chave, valor in snapshot['gauges'].items()
+                if snapshot['help'].get(_separar_chave(chave)[0], ('gauge',))[0] == 'counter'
+            }
+            _somar(total, snapshot)
+            mesclados.add(nome)
+        total['mesclados'] = sorted(
+            nome for nome in mesclados if os.path.exists(os.path.join(METRICS_MULTIPROC_DIR, nome))
+        )
+        _gravar(destino, total)
+        for caminho in caminhos:
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+
+def _snapshots():
+    if not METRICS_MULTIPROC_DIR:
+        return [_snapshot()]
+
+    flush(force=True)
+    lidos = []
+    for caminho in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, 'metrics_*.json')):
+        snapshot = _ler(caminho)
+        if snapshot is not None:
+            lidos.append((caminho, snapshot))
+
+    # Com o mesmo pid, só o worker iniciado por último pode estar vivo
+    ultimo_inicio = {}
+    for _, snapshot in lidos:
+        pid, inicio = snapshot['pid'], snapshot.get('inicio', 0)
+        ultimo_inicio[pid] = max(ultimo_inicio.get(pid, 0), inicio)
+
+    snapshots, encerrados = [], []
+    for caminho, snapshot in lidos:
+        pid = snapshot['pid']
+        if snapshot.get('inicio', 0) == ultimo_inicio[pid] and _processo_ativo(pid):
+            snapshots.append(snapshot)
+        else:
+            encerrados.append(caminho)
+    if encerrados:
+        _mesclar_encerrados(encerrados)
+
+    total = _ler(os.path.join(METRICS_MULTIPROC_DIR, _ENCERRADOS))
+    if total is not None:
+        snapshots.append(total)
+    return snapshots
+
+
+def _formatar_labels(labels):
+    if not labels:
+        return ''
+    pares = []
+    for nome, valor in labels.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pares.append(f'{nome}="{valor}"')
+    return '{' + ','.join(pares) + '}'
+
+
+def _formatar_valor(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def render():
+    """Agrega as métricas de todos os processos no formato texto do Prometheus"""
+    total = _vazio()
+    for snapshot in _snapshots():
+        _somar(total, snapshot)
+    counters, gauges, histograms = total['counters'], total['gauges'], total['histograms']
+    ajuda = {**_HELP, **{nome: tuple(info) for nome, info in total['help'].items()}}
+
+    series = {}
+    for chave, valor in counters.items():
+        nome, labels = _separar_chave(chave)
+        series.setdefault(nome, []).append(f'{nome}{_formatar_labels(labels)} {_formatar_valor(valor)}')
+    for chave, valor in gauges.items():
+        nome, labels = _separar_chave(chave)
+        series.setdefault(nome, []).append(f'{nome}{_formatar_labels(labels)} {_formatar_valor(valor)}')
+    for chave, hist in histograms.items():
+        nome, labels = _separar_chave(chave)
+        linhas = series.setdefault(nome, [])
+        acumulado = 0
+        for limite, contagem in zip(hist['buckets'], hist['contagens']):
+            acumulado += contagem
+            linhas.append(f'{nome}_bucket{_formatar_labels({**labels, "le": _formatar_valor(float(limite))})} {acumulado}')
+        linhas.append(f'{nome}_bucket{_formatar_labels({**labels, "le": "+Inf"})} {hist["total"]}')
+        linhas.append(f'{nome}_sum{_formatar_labels(labels)} {_formatar_valor(hist["soma"])}')
+        linhas.append(f'{nome}_count{_formatar_labels(labels)} {hist["total"]}')
+
+    saida = []
+    for nome in sorted(series):
+        tipo, texto = ajuda.get(nome, ('untyped', nome))
+        saida.append(f'# HELP {nome} {texto}')
+        saida.append(f'# TYPE {nome} {tipo}')
+        saida.extend(series[nome])
+    return '\n'.join(saida) + '\n'
+
+
+def init_app(app):
+    """Registra a coleta por requisição e o endpoint /metrics"""
+
+    @app.before_request
+    def iniciar_medicao():
+        g.metrics_inicio = time.perf_counter()
+
+    @app.after_request
+    def registrar_requisicao(response):
+        inicio = g.pop('metrics_inicio', None)
+        if inicio is None or request.path == '/metrics':
+            return response
+
+        # Rotas não encontradas são agrupadas para não explodir a cardinalidade
+        rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+        labels = {'method': request.method, 'route': rota}
+        inc_counter('http_requests_total', {**labels, 'status': str(response.status_code)})
+        observe_histogram('http_request_duration_seconds', time.perf_counter() - inicio, labels)
+        flush()
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        """Métricas no formato texto do Prometheus"""
+        return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Migrações versionadas do schema
+
+O script sqlite_backend_script.sql é a versão 0 do schema. Toda mudança
+posterior (índices, tabelas, triggers) fica em migrations/NNNN_descricao.sql
+e é aplicada em ordem, uma vez, registrando a versão na tabela schema_version.
+
+O banco é colocado em modo WAL antes de migrar: a criação de um índice
+segura apenas o lock de escrita e as leituras continuam sendo atendidas.
+Cada migração roda na sua própria transação curta, então um índice grande
+bloqueia os escritores só durante a sua construção. Depois de aplicar
+alguma migração são executados ANALYZE e PRAGMA optimize.
+
+Exemplos:
+    python migrate.py status
+    python migrate.py aplicar
+    python migrate.py aplicar --ate 3 --db outro.db
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+
+MIGRATIONS_DIR = os.getenv('MIGRATIONS_DIR', 'migrations')
+
+# Tempo máximo de espera por um lock antes de desistir (ms)
+MIGRATION_BUSY_TIMEOUT = int(os.getenv('MIGRATION_BUSY_TIMEOUT', '30000'))
+
+# Linhas amostradas por índice no ANALYZE; mantém o comando rápido em bancos grandes
+ANALYSIS_LIMIT = 1000
+
+_ARQUIVO = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+class MigrationError(Exception):
+    pass
+
+
+def list_migrations(diretorio=None):
+    """Migrações disponíveis como lista de (versao, nome, caminho) em ordem"""
+    diretorio = diretorio or MIGRATIONS_DIR
+    if not os.path.isdir(diretorio):
+        return []
+
+    migracoes = {}
+    for arquivo in os.listdir(diretorio):
+        encontrado = _ARQUIVO.match(arquivo)
+        if not encontrado:
+            continue
+        versao = int(encontrado.group(1))
+        if versao in migracoes:
+            raise MigrationError(f'Versão {versao} duplicada em {diretorio}')
+        migracoes[versao] = (versao, encontrado.group(2), os.path.join(diretorio, arquivo))
+    return [migracoes[versao] for versao in sorted(migracoes)]
+
+
+def _checksum(sql):
+    return hashlib.sha256(sql.encode('utf-8')).hexdigest()
+
+
+def _preparar(conn):
+    conn.execute(f'PRAGMA busy_timeout = {MIGRATION_BUSY_TIMEOUT}')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        versao INTEGER PRIMARY KEY,
+        nome TEXT NOT NULL,
+        checksum TEXT NOT NULL,
+        aplicada_em DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        duracao_ms REAL
+    )''')
+    conn.commit()
+
+
+def applied_versions(conn):
+    """Versões já aplicadas, como dicionário versao -> checksum"""
+    return dict(conn.execute('SELECT versao, checksum FROM schema_version').fetchall())
+
+
+def status(database, diretorio=None):
+    """Situação de cada migração: aplicada, pendente ou alterada depois de aplicada"""
+    conn = sqlite3.connect(database)
+    try:
+        _preparar(conn)
+        aplicadas = applied_versions(conn)
+    finally:
+        conn.close()
+
+    situacao = []
+    for versao, nome, caminho in list_migrations(diretorio):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            checksum = _checksum(f.read())
+        if versao not in aplicadas:
+            estado = 'pendente'
+        elif aplicadas[versao] != checksum:
+            estado = 'alterada'
+        else:
+            estado = 'aplicada'
+        situacao.append((versao, nome, estado))
+    return situacao
+
+
+def _aplicar_migracao(conn, versao, nome, sql):
+    inicio = time.perf_counter()
+    # BEGIN IMMEDIATE serializa workers migrando ao mesmo tempo; quem chega
+    # depois encontra a versão registrada e pula a migração
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if conn.execute('SELECT 1 FROM schema_version WHERE versao = ?', (versao,)).fetchone():
+            conn.rollback()
+            return False
+        for comando in _comandos(sql):
+            conn.execute(comando)
+        conn.execute(
+            'INSERT INTO schema_version (versao, nome, checksum, duracao_ms) VALUES (?, ?, ?, ?)',
+            (versao, nome, _checksum(sql), round((time.perf_counter() - inicio) * 1000, 3))
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise MigrationError(f'Falha na migração {versao:04d}_{nome}: {e}') from e
+    return True
+
+
+def _comandos(sql):
+    """Divide o script em comandos completos (triggers contêm ';' internos)"""
+    comandos, atual = [], ''
+    for linha in sql.splitlines(keepends=True):
+        atual += linha
+        if sqlite3.complete_statement(atual):
+            if atual.strip():
+                comandos.append(atual)
+            atual = ''
+    resto = [l for l in atual.splitlines() if l.strip() and not l.strip().startswith('--')]
+    if resto:
+        raise MigrationError('Comando SQL incompleto no final da migração')
+    return comandos
+
+
+def apply_migrations(database, diretorio=None, ate=None, verbose=False):
+    """Aplica as migrações pendentes em ordem e retorna as versões aplicadas"""
+    # isolation_level=None: as transações são controladas explicitamente
+    conn = sqlite3.connect(database, isolation_level=None)
+    try:
+        _preparar(conn)
+        aplicadas = applied_versions(conn)
+        novas = []
+
+        for versao, nome, caminho in list_migrations(diretorio):
+            if ate is not None and versao > ate:
+                break
+            with open(caminho, 'r', encoding='utf-8') as f:
+                sql = f.read()
+            if versao in aplicadas:
+                if aplicadas[versao] != _checksum(sql):
+                    print(f'Aviso: migração {versao:04d}_{nome} foi alterada depois de aplicada')
+                continue
+
+            if verbose:
+                print(f'Aplicando {versao:04d}_{nome}...', flush=True)
+            if _aplicar_migracao(conn, versao, nome, sql):
+                novas.append(versao)
+
+        if novas:
+            conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+            conn.execute('ANALYZE')
+            conn.execute('PRAGMA optimize')
+        return novas
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrações do schema do banco')
+    parser.add_argument('comando', choices=['status', 'aplicar'], nargs='?', default='aplicar')
+    parser.add_argument('--db', default='database.db', help='arquivo do banco de dados')
+    parser.add_argument('--dir', default=None, help='diretório das migrações')
+    parser.add_argument('--ate', type=int, default=None, help='aplicar somente até esta versão')
+    args = parser.parse_args()
+
+    if args.comando == 'status':
+        for versao, nome, estado in status(args.db, args.dir):
+            print(f'{versao:04d}_{nome}: {estado}')
+        return
+
+    inicio = time.perf_counter()
+    try:
+        novas = apply_migrations(args.db, args.dir, args.ate, verbose=True)
+    except MigrationError as e:
+        print(f'Erro: {e}')
+        sys.exit(1)
+    if novas:
+        print(f'{len(novas)} migração(ões) aplicada(s) em {time.perf_counter() - inicio:.1f}s')
+    else:
+        print('Banco já está na versão mais recente')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+-- Vendas por receita (trigger de venda e consultas de histórico da receita)
+CREATE INDEX IF NOT EXISTS idx_venda_receita ON Venda(id_receita);
+
+-- Estoque de um medicamento em todas as farmácias; a chave primária começa por id_farmacia
+CREATE INDEX IF NOT EXISTS idx_estoque_medicamento ON EstoqueFarmacia(id_medicamento);
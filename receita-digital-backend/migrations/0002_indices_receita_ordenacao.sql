@@ -0,0 +1,14 @@
+-- Listagens por paciente e por médico ordenadas por data de emissão sem ordenação temporária.
+-- Os índices de coluna única são prefixos dos compostos e deixam de ser necessários.
+CREATE INDEX IF NOT EXISTS idx_receita_paciente_emissao ON Receita(id_paciente, data_emissao DESC);
+DROP INDEX IF EXISTS idx_receita_paciente;
+
+CREATE INDEX IF NOT EXISTS idx_receita_medico_emissao ON Receita(id_medico, data_emissao DESC);
+DROP INDEX IF EXISTS idx_receita_medico;
+
+-- Listagem geral (admin) percorrida na ordem do índice
+CREATE INDEX IF NOT EXISTS idx_receita_emissao ON Receita(data_emissao DESC);
+
+-- Catálogos ordenados por nome
+CREATE INDEX IF NOT EXISTS idx_medicamento_nome ON Medicamento(nome);
+CREATE INDEX IF NOT EXISTS idx_farmacia_nome ON Farmacia(nome_fantasia);
@@ -0,0 +1,49 @@
+-- Versão do documento de cada receita, usada como chave do cache de detalhes.
+-- Fica em tabela separada para não disparar os triggers de UPDATE da Receita.
+-- Receitas sem linha aqui estão na versão 0.
+CREATE TABLE IF NOT EXISTS ReceitaVersao (
+    id_receita INTEGER PRIMARY KEY,
+    versao INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS receita_versao_update
+    AFTER UPDATE OF status, data_validade, diagnostico, observacoes, id_paciente, id_medico ON Receita
+    WHEN OLD.status IS NOT NEW.status
+      OR OLD.data_validade IS NOT NEW.data_validade
+      OR OLD.diagnostico IS NOT NEW.diagnostico
+      OR OLD.observacoes IS NOT NEW.observacoes
+      OR OLD.id_paciente IS NOT NEW.id_paciente
+      OR OLD.id_medico IS NOT NEW.id_medico
+BEGIN
+    INSERT INTO ReceitaVersao (id_receita, versao) VALUES (NEW.id_receita, 1)
+    ON CONFLICT(id_receita) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS receita_versao_delete
+    AFTER DELETE ON Receita
+BEGIN
+    DELETE FROM ReceitaVersao WHERE id_receita = OLD.id_receita;
+END;
+
+CREATE TRIGGER IF NOT EXISTS receita_medicamento_versao_insert
+    AFTER INSERT ON ReceitaMedicamento
+BEGIN
+    INSERT INTO ReceitaVersao (id_receita, versao) VALUES (NEW.id_receita, 1)
+    ON CONFLICT(id_receita) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS receita_medicamento_versao_update
+    AFTER UPDATE ON ReceitaMedicamento
+BEGIN
+    INSERT INTO ReceitaVersao (id_receita, versao) VALUES (OLD.id_receita, 1)
+    ON CONFLICT(id_receita) DO UPDATE SET versao = versao + 1;
+    INSERT INTO ReceitaVersao (id_receita, versao) VALUES (NEW.id_receita, 1)
+    ON CONFLICT(id_receita) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS receita_medicamento_versao_delete
+    AFTER DELETE ON ReceitaMedicamento
+BEGIN
+    INSERT INTO ReceitaVersao (id_receita, versao) VALUES (OLD.id_receita, 1)
+    ON CONFLICT(id_receita) DO UPDATE SET versao = versao + 1;
+END;
@@ -0,0 +1,112 @@
+-- Versão de cada namespace do cache em memória (cache.py). Os triggers abaixo
+-- incrementam a versão quando as tabelas de origem mudam, e cada processo
+-- esvazia o namespace correspondente na próxima leitura.
+CREATE TABLE IF NOT EXISTS CacheVersao (
+    namespace TEXT PRIMARY KEY,
+    versao INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS cache_usuario_insert
+    AFTER INSERT ON Usuario
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('usuarios', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_usuario_update
+    AFTER UPDATE ON Usuario
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('usuarios', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_usuario_delete
+    AFTER DELETE ON Usuario
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('usuarios', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_paciente_insert
+    AFTER INSERT ON Paciente
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('usuarios', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_paciente_update
+    AFTER UPDATE ON Paciente
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('usuarios', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_paciente_delete
+    AFTER DELETE ON Paciente
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('usuarios', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_medico_insert
+    AFTER INSERT ON Medico
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('usuarios', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_medico_update
+    AFTER UPDATE ON Medico
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('usuarios', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_medico_delete
+    AFTER DELETE ON Medico
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('usuarios', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_medicamento_insert
+    AFTER INSERT ON Medicamento
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('medicamentos', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_medicamento_update
+    AFTER UPDATE ON Medicamento
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('medicamentos', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_medicamento_delete
+    AFTER DELETE ON Medicamento
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('medicamentos', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_farmacia_insert
+    AFTER INSERT ON Farmacia
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('farmacias', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_farmacia_update
+    AFTER UPDATE ON Farmacia
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('farmacias', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cache_farmacia_delete
+    AFTER DELETE ON Farmacia
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('farmacias', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
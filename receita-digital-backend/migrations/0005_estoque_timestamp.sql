@@ -0,0 +1,15 @@
+-- O trigger original regravava a linha depois de todo UPDATE do estoque,
+-- dobrando as escritas de cada alteração. Agora ele só dispara quando uma
+-- coluna de estoque muda e o próprio comando não atualizou a data; quem grava
+-- o estoque pela API já define data_ultima_atualizacao no mesmo UPDATE.
+-- Como o UPDATE do trigger altera só a data, ele não dispara a si mesmo.
+DROP TRIGGER IF EXISTS update_estoque_timestamp;
+
+CREATE TRIGGER IF NOT EXISTS update_estoque_timestamp
+    AFTER UPDATE OF preco_unitario, quantidade_disponivel, estoque_minimo ON EstoqueFarmacia
+    WHEN NEW.data_ultima_atualizacao IS OLD.data_ultima_atualizacao
+BEGIN
+    UPDATE EstoqueFarmacia
+    SET data_ultima_atualizacao = CURRENT_TIMESTAMP
+    WHERE id_farmacia = NEW.id_farmacia AND id_medicamento = NEW.id_medicamento;
+END;
@@ -0,0 +1,29 @@
+-- Conjunto de itens com estoque baixo mantido pelo próprio SQLite: o índice
+-- parcial só contém as linhas com quantidade_disponivel <= estoque_minimo e
+-- só é tocado quando uma linha cruza o limite. view_estoque_baixo e a rota
+-- /api/farmacias/<id>/estoque-baixo usam a mesma condição e leem apenas ele,
+-- em vez de avaliar todo o EstoqueFarmacia.
+CREATE INDEX IF NOT EXISTS idx_estoque_baixo
+    ON EstoqueFarmacia(id_farmacia, id_medicamento)
+    WHERE quantidade_disponivel <= estoque_minimo;
+
+-- Destinatários dos alertas (administradores) sem varrer todos os usuários
+CREATE INDEX IF NOT EXISTS idx_usuario_tipo ON Usuario(tipo);
+
+-- Alerta quando um item cai para o estoque mínimo ou abaixo dele. Farmácias
+-- não têm usuário próprio, então a notificação vai para os administradores.
+CREATE TRIGGER IF NOT EXISTS estoque_baixo_alerta
+    AFTER UPDATE OF quantidade_disponivel, estoque_minimo ON EstoqueFarmacia
+    WHEN NEW.quantidade_disponivel <= NEW.estoque_minimo
+     AND OLD.quantidade_disponivel > OLD.estoque_minimo
+BEGIN
+    INSERT INTO Notificacao (id_usuario, mensagem, tipo)
+    SELECT u.id_usuario,
+           'Estoque baixo: ' || m.nome || ' em ' || f.nome_fantasia || ' (' ||
+           NEW.quantidade_disponivel || ' unidades, mínimo ' || NEW.estoque_minimo || ')',
+           'alerta'
+    FROM Usuario u
+    JOIN Medicamento m ON m.id_medicamento = NEW.id_medicamento
+    JOIN Farmacia f ON f.id_farmacia = NEW.id_farmacia
+    WHERE u.tipo = 'admin';
+END;
@@ -0,0 +1,28 @@
+-- Contagens de receitas pré-calculadas por dia e por mês para cada dimensão
+-- (medico, especialidade, medicamento, diagnostico), mantidas pelo job
+-- analytics.py. chave é o id do médico/medicamento ou o próprio texto da
+-- especialidade/diagnóstico; quantidade só é preenchida para medicamento.
+CREATE TABLE IF NOT EXISTS ReceitaDiaria (
+    dimensao TEXT NOT NULL,
+    dia DATE NOT NULL,
+    chave TEXT NOT NULL,
+    receitas INTEGER NOT NULL,
+    quantidade INTEGER,
+    PRIMARY KEY (dimensao, dia, chave)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ReceitaMensal (
+    dimensao TEXT NOT NULL,
+    mes TEXT NOT NULL,
+    chave TEXT NOT NULL,
+    receitas INTEGER NOT NULL,
+    quantidade INTEGER,
+    PRIMARY KEY (dimensao, mes, chave)
+) WITHOUT ROWID;
+
+-- Último dia completo já consolidado por cada job incremental
+CREATE TABLE IF NOT EXISTS AnalyticsProgresso (
+    tarefa TEXT PRIMARY KEY,
+    ultimo_dia DATE,
+    atualizado_em DATETIME
+);
@@ -0,0 +1,8 @@
+-- CPF só com dígitos. A coluna cpf mistura formatos ('123.456.789-01' e
+-- '12345678901'); a coluna gerada é virtual (calculada na leitura, sem
+-- ocupar espaço na tabela) e o índice permite comparar CPFs em qualquer
+-- formato sem varrer Paciente
+ALTER TABLE Paciente ADD COLUMN cpf_digitos TEXT
+    GENERATED ALWAYS AS (replace(replace(replace(cpf, '.', ''), '-', ''), ' ', '')) VIRTUAL;
+
+CREATE INDEX IF NOT EXISTS idx_paciente_cpf_digitos ON Paciente(cpf_digitos);
@@ -0,0 +1,11 @@
+-- O cache de usuários (cache.py) não guarda a senha, então trocar o hash
+-- (por exemplo, refeito no login quando SENHA_METODO muda) não precisa
+-- esvaziar o namespace 'usuarios' em todos os processos
+DROP TRIGGER IF EXISTS cache_usuario_update;
+
+CREATE TRIGGER IF NOT EXISTS cache_usuario_update
+    AFTER UPDATE OF id_usuario, nome, email, tipo ON Usuario
+BEGIN
+    INSERT INTO CacheVersao (namespace, versao) VALUES ('usuarios', 1)
+    ON CONFLICT(namespace) DO UPDATE SET versao = versao + 1;
+END;
@@ -0,0 +1,41 @@
+-- Busca de pacientes pelo nome: índice FTS5 com o nome de cada paciente
+-- (rowid = id_paciente), sem acentos e com prefixos de 2 e 3 letras
+-- pré-indexados, para "jose sil" achar "José da Silva" sem varrer Usuario.
+-- Os triggers mantêm o índice junto com Paciente e com o nome em Usuario.
+CREATE VIRTUAL TABLE IF NOT EXISTS PacienteNome USING fts5(
+    nome,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+INSERT INTO PacienteNome (rowid, nome)
+SELECT u.id_usuario, u.nome
+FROM Paciente p
+JOIN Usuario u ON u.id_usuario = p.id_paciente;
+
+CREATE TRIGGER IF NOT EXISTS paciente_nome_insert
+    AFTER INSERT ON Paciente
+BEGIN
+    INSERT INTO PacienteNome (rowid, nome)
+    SELECT id_usuario, nome FROM Usuario WHERE id_usuario = NEW.id_paciente;
+END;
+
+CREATE TRIGGER IF NOT EXISTS paciente_nome_delete
+    AFTER DELETE ON Paciente
+BEGIN
+    DELETE FROM PacienteNome WHERE rowid = OLD.id_paciente;
+END;
+
+-- Para quem não é paciente o UPDATE não encontra linha e não faz nada
+CREATE TRIGGER IF NOT EXISTS paciente_nome_update
+    AFTER UPDATE OF nome ON Usuario
+    WHEN NEW.nome IS NOT OLD.nome
+BEGIN
+    UPDATE PacienteNome SET nome = NEW.nome WHERE rowid = NEW.id_usuario;
+END;
+
+CREATE TRIGGER IF NOT EXISTS paciente_nome_usuario_delete
+    AFTER DELETE ON Usuario
+BEGIN
+    DELETE FROM PacienteNome WHERE rowid = OLD.id_usuario;
+END;
@@ -0,0 +1,69 @@
+-- Listagem paginada de usuários (/api/usuarios) por (nome, id_usuario).
+-- O id_usuario entra nos índices como rowid, então as páginas seguem a
+-- ordem do índice, com ou sem filtro de tipo. O índice por (tipo, nome)
+-- também atende as buscas só por tipo e substitui idx_usuario_tipo.
+CREATE INDEX IF NOT EXISTS idx_usuario_nome ON Usuario(nome);
+CREATE INDEX IF NOT EXISTS idx_usuario_tipo_nome ON Usuario(tipo, nome);
+DROP INDEX IF EXISTS idx_usuario_tipo;
+
+-- Busca por nome ou e-mail: índice FTS5 (rowid = id_usuario), sem acentos.
+-- O e-mail é quebrado em palavras no '@' e nos pontos
+CREATE VIRTUAL TABLE IF NOT EXISTS UsuarioBusca USING fts5(
+    nome,
+    email,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+INSERT INTO UsuarioBusca (rowid, nome, email)
+SELECT id_usuario, nome, email FROM Usuario;
+
+CREATE TRIGGER IF NOT EXISTS usuario_busca_insert
+    AFTER INSERT ON Usuario
+BEGIN
+    INSERT INTO UsuarioBusca (rowid, nome, email) VALUES (NEW.id_usuario, NEW.nome, NEW.email);
+END;
+
+CREATE TRIGGER IF NOT EXISTS usuario_busca_update
+    AFTER UPDATE OF nome, email ON Usuario
+BEGIN
+    UPDATE UsuarioBusca SET nome = NEW.nome, email = NEW.email WHERE rowid = OLD.id_usuario;
+END;
+
+CREATE TRIGGER IF NOT EXISTS usuario_busca_delete
+    AFTER DELETE ON Usuario
+BEGIN
+    DELETE FROM UsuarioBusca WHERE rowid = OLD.id_usuario;
+END;
+
+-- Total de usuários por tipo, mantido pelos triggers, para a listagem não
+-- precisar de COUNT(*) sobre Usuario
+CREATE TABLE IF NOT EXISTS UsuarioContagem (
+    tipo TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR REPLACE INTO UsuarioContagem (tipo, total)
+SELECT tipo, COUNT(*) FROM Usuario GROUP BY tipo;
+
+CREATE TRIGGER IF NOT EXISTS usuario_contagem_insert
+    AFTER INSERT ON Usuario
+BEGIN
+    INSERT INTO UsuarioContagem (tipo, total) VALUES (NEW.tipo, 1)
+    ON CONFLICT(tipo) DO UPDATE SET total = total + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS usuario_contagem_delete
+    AFTER DELETE ON Usuario
+BEGIN
+    UPDATE UsuarioContagem SET total = total - 1 WHERE tipo = OLD.tipo;
+END;
+
+CREATE TRIGGER IF NOT EXISTS usuario_contagem_update
+    AFTER UPDATE OF tipo ON Usuario
+    WHEN NEW.tipo IS NOT OLD.tipo
+BEGIN
+    UPDATE UsuarioContagem SET total = total - 1 WHERE tipo = OLD.tipo;
+    INSERT INTO UsuarioContagem (tipo, total) VALUES (NEW.tipo, 1)
+    ON CONFLICT(tipo) DO UPDATE SET total = total + 1;
+END;
@@ -0,0 +1,36 @@
+-- Códigos assinados das receitas (codigos.py). O código leva a versão do
+-- documento; com_codigo marca que já foi emitido código para a versão
+-- atual. Quando essa versão muda (status, validade, medicamentos) ou a
+-- receita é apagada, os códigos emitidos até ela entram em CodigoRevogacao,
+-- que os processos da API leem para a lista de revogados em memória.
+-- Receitas sem código emitido não geram nenhuma linha.
+ALTER TABLE ReceitaVersao ADD COLUMN com_codigo INTEGER NOT NULL DEFAULT 0;
+
+-- Códigos da receita com versão até versao não valem mais. validade é a da
+-- receita: depois dela os códigos já são recusados pela data e a linha pode
+-- ser esquecida
+CREATE TABLE IF NOT EXISTS CodigoRevogacao (
+    seq INTEGER PRIMARY KEY,
+    id_receita INTEGER NOT NULL,
+    versao INTEGER NOT NULL,
+    validade DATE
+);
+
+CREATE TRIGGER IF NOT EXISTS codigo_revogacao_versao
+    AFTER UPDATE OF versao ON ReceitaVersao
+    WHEN OLD.com_codigo AND NEW.versao IS NOT OLD.versao
+BEGIN
+    INSERT INTO CodigoRevogacao (id_receita, versao, validade)
+    VALUES (OLD.id_receita, OLD.versao,
+            (SELECT data_validade FROM Receita WHERE id_receita = OLD.id_receita));
+    UPDATE ReceitaVersao SET com_codigo = 0 WHERE id_receita = OLD.id_receita;
+END;
+
+-- A receita já foi apagada quando a versão sai: sem validade, a linha fica
+CREATE TRIGGER IF NOT EXISTS codigo_revogacao_delete
+    AFTER DELETE ON ReceitaVersao
+    WHEN OLD.com_codigo
+BEGIN
+    INSERT INTO CodigoRevogacao (id_receita, versao, validade)
+    VALUES (OLD.id_receita, OLD.versao, NULL);
+END;
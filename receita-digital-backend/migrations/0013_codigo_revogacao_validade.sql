@@ -0,0 +1,14 @@
+-- A revogação das receitas apagadas (inclusive as movidas para o arquivo)
+-- era gravada depois da receita sair, sem validade, e a linha nunca podia
+-- ser esquecida. Antes de apagar a receita ainda dá para ler a validade e a
+-- versão; arquivamento.py apaga as linhas vencidas.
+DROP TRIGGER IF EXISTS codigo_revogacao_delete;
+
+CREATE TRIGGER IF NOT EXISTS codigo_revogacao_receita_delete
+    BEFORE DELETE ON Receita
+    WHEN (SELECT com_codigo FROM ReceitaVersao WHERE id_receita = OLD.id_receita)
+BEGIN
+    INSERT INTO CodigoRevogacao (id_receita, versao, validade)
+    SELECT OLD.id_receita, versao, OLD.data_validade
+    FROM ReceitaVersao WHERE id_receita = OLD.id_receita;
+END;
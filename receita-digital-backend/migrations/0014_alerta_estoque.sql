@@ -0,0 +1,28 @@
+-- O trigger estoque_baixo_alerta inseria uma Notificacao por administrador
+-- dentro da transação da sincronização ou da venda: um snapshot que derruba
+-- mil itens gravava mil vezes o número de admins segurando o lock de
+-- escrita. Agora ele só marca o par (farmácia, medicamento) em AlertaEstoque
+-- (uma linha por par, atualizada se o item cair de novo antes do envio) e
+-- estoque.distribuir_alertas cria as notificações depois do COMMIT.
+CREATE TABLE IF NOT EXISTS AlertaEstoque (
+    id_farmacia INTEGER NOT NULL,
+    id_medicamento INTEGER NOT NULL,
+    quantidade_disponivel INTEGER NOT NULL,
+    estoque_minimo INTEGER NOT NULL,
+    criado_em DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_farmacia, id_medicamento)
+);
+
+DROP TRIGGER IF EXISTS estoque_baixo_alerta;
+
+CREATE TRIGGER IF NOT EXISTS estoque_baixo_alerta
+    AFTER UPDATE OF quantidade_disponivel, estoque_minimo ON EstoqueFarmacia
+    WHEN NEW.quantidade_disponivel <= NEW.estoque_minimo
+     AND OLD.quantidade_disponivel > OLD.estoque_minimo
+BEGIN
+    INSERT INTO AlertaEstoque (id_farmacia, id_medicamento, quantidade_disponivel, estoque_minimo)
+    VALUES (NEW.id_farmacia, NEW.id_medicamento, NEW.quantidade_disponivel, NEW.estoque_minimo)
+    ON CONFLICT(id_farmacia, id_medicamento) DO UPDATE SET
+        quantidade_disponivel = excluded.quantidade_disponivel,
+        estoque_minimo = excluded.estoque_minimo;
+END;
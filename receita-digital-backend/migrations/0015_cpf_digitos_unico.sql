@@ -0,0 +1,12 @@
+-- Paciente.cpf é UNIQUE só no texto: '123.456.789-01' e '12345678901'
+-- passavam como CPFs diferentes. O índice por cpf_digitos passa a ser
+-- único, então o mesmo CPF em outro formato é recusado pelo banco (o
+-- cadastro em lote responde ja_cadastrado com campo cpf).
+--
+-- Se a migração falhar com "UNIQUE constraint failed", há pacientes
+-- repetidos a resolver antes:
+--   SELECT cpf_digitos, group_concat(id_paciente) FROM Paciente
+--   WHERE cpf_digitos IS NOT NULL GROUP BY cpf_digitos HAVING COUNT(*) > 1;
+DROP INDEX IF EXISTS idx_paciente_cpf_digitos;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_paciente_cpf_digitos ON Paciente(cpf_digitos);
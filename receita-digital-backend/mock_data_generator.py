@@ -3,26 +3,192 @@
 """
 Script para gerar dados mock para o sistema de receitas médicas
 Baseado na estrutura do backend Flask fornecido
+
+Sem argumentos gera o conjunto pequeno de sempre (usuários, medicamentos e
+farmácias fixos e 25 receitas). Para bancos de benchmark, informe a escala:
+
+    python mock_data_generator.py --receitas 5_000_000 --pacientes 500_000 --workers 4
+
+Os dados são inseridos com executemany em transações grandes, com
+synchronous=OFF e sem os índices secundários durante a carga, e os hashes
+de senha são calculados uma única vez por perfil.
 """
 
-import sqlite3
+import argparse
 import json
-from werkzeug.security import generate_password_hash
-from datetime import datetime, timedelta
+import multiprocessing
 import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
 
 DATABASE = 'database.db'
 
-def clear_database():
+# Linhas por lote de executemany (e por transação)
+CHUNK_SIZE = 50000
+
+# Status possíveis para receitas
+STATUS_OPCOES = ['ativa', 'utilizada', 'cancelada']
+
+# Diagnósticos comuns
+DIAGNOSTICOS = [
+    'Hipertensão Arterial',
+    'Diabetes Mellitus Tipo 2',
+    'Infecção Respiratória',
+    'Gastrite',
+    'Cefaleia',
+    'Artralgia',
+    'Síndrome Gripal',
+    'Dislipidemia',
+    'Ansiedade',
+    'Lombalgia'
+]
+
+# Dosagens comuns
+DOSAGENS = ['1 comprimido', '2 comprimidos', '1/2 comprimido', '1 cápsula', '2 cápsulas']
+
+# Posologias comuns
+POSOLOGIAS = [
+    '1 vez ao dia',
+    '2 vezes ao dia',
+    '3 vezes ao dia',
+    'De 8 em 8 horas',
+    'De 12 em 12 horas',
+    'A cada 6 horas',
+    'Antes das refeições',
+    'Após as refeições',
+    'Em jejum',
+    'Ao deitar'
+]
+
+OBSERVACOES_RECEITA = [
+    'Paciente alérgico a dipirona',
+    'Tomar com bastante água',
+    'Evitar exposição ao sol',
+    'Retornar em 15 dias',
+    'Monitorar pressão arterial'
+]
+
+OBSERVACOES_MEDICAMENTO = [
+    'Tomar longe das refeições',
+    'Não partir ou mastigar',
+    'Pode causar sonolência',
+    'Tomar com alimentos',
+    'Interromper se houver efeitos colaterais'
+]
+
+# Vocabulário para os registros sintéticos gerados além dos fixos
+PRIMEIROS_NOMES = [
+    'Ana', 'Bruno', 'Camila', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique',
+    'Isabela', 'João', 'Larissa', 'Marcos', 'Natália', 'Otávio', 'Patrícia', 'Rafael',
+    'Sofia', 'Thiago', 'Vanessa', 'Vinícius'
+]
+SOBRENOMES = [
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira',
+    'Lima', 'Gomes', 'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Araújo', 'Melo'
+]
+ESPECIALIDADES = [
+    'Cardiologia', 'Clínica Geral', 'Endocrinologia', 'Pediatria', 'Neurologia',
+    'Dermatologia', 'Ortopedia', 'Psiquiatria', 'Ginecologia', 'Gastroenterologia'
+]
+UFS = ['SP', 'RJ', 'MG', 'RS', 'PR', 'BA', 'CE', 'PE', 'GO', 'SC']
+FABRICANTES = ['EMS', 'Medley', 'Eurofarma', 'Sandoz', 'Sanofi', 'Germed', 'Neo Química', 'Novartis']
+NOTIFICACOES = [
+    ('info', 'Você recebeu uma nova receita médica'),
+    ('info', 'Sua receita foi utilizada em uma farmácia'),
+    ('alerta', 'Sua receita vence em 7 dias'),
+    ('alerta', 'Estoque baixo de medicamento controlado'),
+    ('erro', 'Falha ao processar a última venda')
+]
+
+
+def connect(database=DATABASE):
+    """Conexão configurada para carga em massa"""
+    conn = sqlite3.connect(database)
+    # Durável apenas ao final: a carga pode ser refeita se o processo cair
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+def insert_many(conn, sql, linhas, chunk_size=CHUNK_SIZE):
+    """executemany em lotes, confirmando uma transação por lote"""
+    total = 0
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= chunk_size:
+            conn.executemany(sql, lote)
+            conn.commit()
+            total += len(lote)
+            lote = []
+    if lote:
+        conn.executemany(sql, lote)
+        conn.commit()
+        total += len(lote)
+    return total
+
+
+@contextmanager
+def triggers_desativados(conn, tabela):
+    """Remove os triggers de uma tabela durante a carga e os recria depois"""
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?",
+        (tabela,)
+    ).fetchall()
+    for nome, _ in triggers:
+        conn.execute(f'DROP TRIGGER {nome}')
+    try:
+        yield
+    finally:
+        for _, sql in triggers:
+            conn.execute(sql)
+        conn.commit()
+
+
+@contextmanager
+def indices_desativados(conn, tabelas):
+    """
+    Remove os índices secundários das tabelas durante a carga e os recria
+    no final: montar o índice de uma vez é mais rápido que mantê-lo linha a linha
+    """
+    marcadores = ','.join('?' * len(tabelas))
+    indices = conn.execute(
+        f"""SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({marcadores})""",
+        tabelas
+    ).fetchall()
+    for nome, _ in indices:
+        conn.execute(f'DROP INDEX {nome}')
+    try:
+        yield
+    finally:
+        for _, sql in indices:
+            conn.execute(sql)
+        conn.commit()
+
+
+def clear_database(conn):
     """Limpa todas as tabelas para inserir dados frescos"""
-    conn = sqlite3.connect(DATABASE)
-    
     # Desabilitar foreign keys temporariamente
     conn.execute('PRAGMA foreign_keys = OFF')
     
     tables = [
+        'Notificacao',
+        'Venda',
+        'EstoqueFarmacia',
+        'AlertaEstoque',
         'ReceitaMedicamento',
         'Receita', 
+        # Depois de Receita: o trigger de DELETE grava revogações de códigos
+        'CodigoRevogacao',
+        # Estatísticas consolidadas das receitas apagadas (veja analytics.py)
+        'ReceitaDiaria',
+        'ReceitaMensal',
+        'AnalyticsProgresso',
         'Medicamento',
         'Farmacia',
         'Paciente',
@@ -37,35 +203,54 @@ def clear_database():
         except sqlite3.OperationalError:
             print(f"Tabela {table} não existe")
     
+    # Reiniciar os ids gerados pelo AUTOINCREMENT
+    try:
+        conn.execute('DELETE FROM sqlite_sequence')
+    except sqlite3.OperationalError:
+        pass
+    
     # Reabilitar foreign keys
     conn.execute('PRAGMA foreign_keys = ON')
     conn.commit()
-    conn.close()
 
-def insert_mock_users():
+def password_hashes():
+    """Hashes calculados uma única vez e compartilhados por todos os usuários de cada perfil"""
+    return {
+        'admin': generate_password_hash('admin123'),
+        'medico': generate_password_hash('medico123'),
+        'paciente': generate_password_hash('paciente123')
+    }
+
+def _nome_sintetico(rng):
+    return f'{rng.choice(PRIMEIROS_NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}'
+
+def _cpf_sintetico(numero, rng):
+    digitos = f'{numero:011d}'
+    # A base real mistura CPFs formatados e só com dígitos
+    if rng.random() < 0.8:
+        return f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+    return digitos
+
+def insert_mock_users(conn, hashes, total_medicos=5, total_pacientes=7, rng=random):
     """Inserir usuários mock (admins, médicos e pacientes)"""
-    conn = sqlite3.connect(DATABASE)
-    
     # Admin
     admin_data = {
         'nome': 'Administrador Sistema',
         'email': 'admin@sistema.com',
-        'senha': generate_password_hash('admin123'),
         'tipo': 'admin'
     }
     
-    cursor = conn.execute(
-        'INSERT INTO Usuario (nome, email, senha, tipo) VALUES (?, ?, ?, ?)',
-        (admin_data['nome'], admin_data['email'], admin_data['senha'], admin_data['tipo'])
+    admin_id = 1
+    conn.execute(
+        'INSERT INTO Usuario (id_usuario, nome, email, senha, tipo) VALUES (?, ?, ?, ?, ?)',
+        (admin_id, admin_data['nome'], admin_data['email'], hashes['admin'], admin_data['tipo'])
     )
-    admin_id = cursor.lastrowid
     
     # Médicos
     medicos_data = [
         {
             'nome': 'Dr. João Silva',
             'email': 'joao.silva@clinica.com',
-            'senha': generate_password_hash('medico123'),
             'tipo': 'medico',
             'crm': 'CRM-SP 123456',
             'especialidade': 'Cardiologia'
@@ -73,7 +258,6 @@ def insert_mock_users():
         {
             'nome': 'Dra. Maria Santos',
             'email': 'maria.santos@hospital.com',
-            'senha': generate_password_hash('medico123'),
             'tipo': 'medico',
             'crm': 'CRM-RJ 789012',
             'especialidade': 'Clínica Geral'
@@ -81,7 +265,6 @@ def insert_mock_users():
         {
             'nome': 'Dr. Carlos Oliveira',
             'email': 'carlos.oliveira@clinica.com',
-            'senha': generate_password_hash('medico123'),
             'tipo': 'medico',
             'crm': 'CRM-MG 345678',
             'especialidade': 'Endocrinologia'
@@ -89,7 +272,6 @@ def insert_mock_users():
         {
             'nome': 'Dra. Ana Costa',
             'email': 'ana.costa@hospital.com',
-            'senha': generate_password_hash('medico123'),
             'tipo': 'medico',
             'crm': 'CRM-SP 901234',
             'especialidade': 'Pediatria'
@@ -97,34 +279,43 @@ def insert_mock_users():
         {
             'nome': 'Dr. Ricardo Ferreira',
             'email': 'ricardo.ferreira@clinica.com',
-            'senha': generate_password_hash('medico123'),
             'tipo': 'medico',
             'crm': 'CRM-RS 567890',
             'especialidade': 'Neurologia'
         }
     ]
     
-    medico_ids = []
-    for medico in medicos_data:
-        cursor = conn.execute(
-            'INSERT INTO Usuario (nome, email, senha, tipo) VALUES (?, ?, ?, ?)',
-            (medico['nome'], medico['email'], medico['senha'], medico['tipo'])
-        )
-        medico_id = cursor.lastrowid
-        medico_ids.append(medico_id)
-        
-        # Inserir dados específicos do médico
-        conn.execute(
-            'INSERT INTO Medico (id_medico, crm, especialidade) VALUES (?, ?, ?)',
-            (medico_id, medico['crm'], medico['especialidade'])
-        )
+    # Os ids são contíguos, então basta guardar o intervalo
+    medico_ids = range(admin_id + 1, admin_id + 1 + total_medicos)
+    medicos_data = medicos_data[:total_medicos]
+    
+    def usuarios_medicos():
+        for i, id_medico in enumerate(medico_ids):
+            if i < len(medicos_data):
+                medico = medicos_data[i]
+                yield (id_medico, medico['nome'], medico['email'], hashes['medico'], 'medico')
+            else:
+                yield (id_medico, f'Dr(a). {_nome_sintetico(rng)}',
+                       f'medico{id_medico}@clinica.com', hashes['medico'], 'medico')
+    
+    def dados_medicos():
+        for i, id_medico in enumerate(medico_ids):
+            if i < len(medicos_data):
+                medico = medicos_data[i]
+                yield (id_medico, medico['crm'], medico['especialidade'])
+            else:
+                yield (id_medico, f'CRM-{rng.choice(UFS)} {id_medico:07d}', rng.choice(ESPECIALIDADES))
+    
+    insert_many(conn, 'INSERT INTO Usuario (id_usuario, nome, email, senha, tipo) VALUES (?, ?, ?, ?, ?)',
+                usuarios_medicos())
+    insert_many(conn, 'INSERT INTO Medico (id_medico, crm, especialidade) VALUES (?, ?, ?)',
+                dados_medicos())
     
     # Pacientes
     pacientes_data = [
         {
             'nome': 'José da Silva',
             'email': 'jose.silva@email.com',
-            'senha': generate_password_hash('paciente123'),
             'tipo': 'paciente',
             'cpf': '123.456.789-01',
             'telefone': '(11) 98765-4321',
@@ -133,7 +324,6 @@ def insert_mock_users():
         {
             'nome': 'Maria Oliveira',
             'email': 'maria.oliveira@email.com',
-            'senha': generate_password_hash('paciente123'),
             'tipo': 'paciente',
             'cpf': '987.654.321-09',
             'telefone': '(21) 91234-5678',
@@ -142,7 +332,6 @@ def insert_mock_users():
         {
             'nome': 'Carlos Santos',
             'email': 'carlos.santos@email.com',
-            'senha': generate_password_hash('paciente123'),
             'tipo': 'paciente',
             'cpf': '456.789.123-45',
             'telefone': '(31) 99876-5432',
@@ -151,7 +340,6 @@ def insert_mock_users():
         {
             'nome': 'Ana Paula Costa',
             'email': 'ana.costa@email.com',
-            'senha': generate_password_hash('paciente123'),
             'tipo': 'paciente',
             'cpf': '321.654.987-12',
             'telefone': '(85) 98765-1234',
@@ -160,7 +348,6 @@ def insert_mock_users():
         {
             'nome': 'Pedro Almeida',
             'email': 'pedro.almeida@email.com',
-            'senha': generate_password_hash('paciente123'),
             'tipo': 'paciente',
             'cpf': '159.753.486-20',
             'telefone': '(51) 97654-3210',
@@ -169,7 +356,6 @@ def insert_mock_users():
         {
             'nome': 'Lucia Ferreira',
             'email': 'lucia.ferreira@email.com',
-            'senha': generate_password_hash('paciente123'),
             'tipo': 'paciente',
             'cpf': '753.159.642-85',
             'telefone': '(62) 96543-2109',
@@ -178,7 +364,6 @@ def insert_mock_users():
         {
             'nome': 'Roberto Lima',
             'email': 'roberto.lima@email.com',
-            'senha': generate_password_hash('paciente123'),
             'tipo': 'paciente',
             'cpf': '852.963.741-96',
             'telefone': '(81) 95432-1098',
@@ -186,35 +371,45 @@ def insert_mock_users():
         }
     ]
     
-    paciente_ids = []
-    for paciente in pacientes_data:
-        cursor = conn.execute(
-            'INSERT INTO Usuario (nome, email, senha, tipo) VALUES (?, ?, ?, ?)',
-            (paciente['nome'], paciente['email'], paciente['senha'], paciente['tipo'])
-        )
-        paciente_id = cursor.lastrowid
-        paciente_ids.append(paciente_id)
-        
-        # Inserir dados específicos do paciente
-        conn.execute(
-            'INSERT INTO Paciente (id_paciente, cpf, telefone, endereco) VALUES (?, ?, ?, ?)',
-            (paciente_id, paciente['cpf'], paciente['telefone'], paciente['endereco'])
-        )
-    
-    conn.commit()
-    conn.close()
+    paciente_ids = range(medico_ids.stop, medico_ids.stop + total_pacientes)
+    pacientes_data = pacientes_data[:total_pacientes]
+    
+    def usuarios_pacientes():
+        for i, id_paciente in enumerate(paciente_ids):
+            if i < len(pacientes_data):
+                paciente = pacientes_data[i]
+                yield (id_paciente, paciente['nome'], paciente['email'], hashes['paciente'], 'paciente')
+            else:
+                yield (id_paciente, _nome_sintetico(rng),
+                       f'paciente{id_paciente}@email.com', hashes['paciente'], 'paciente')
+    
+    def dados_pacientes():
+        for i, id_paciente in enumerate(paciente_ids):
+            if i < len(pacientes_data):
+                paciente = pacientes_data[i]
+                yield (id_paciente, paciente['cpf'], paciente['telefone'], paciente['endereco'])
+            else:
+                uf = rng.choice(UFS)
+                yield (id_paciente,
+                       # Faixa acima dos CPFs fixos para garantir unicidade
+                       _cpf_sintetico(10_000_000_000 + id_paciente, rng),
+                       f'({rng.randint(11, 99)}) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}',
+                       f'Rua {rng.choice(SOBRENOMES)}, {rng.randint(1, 9999)} - {uf}')
+    
+    insert_many(conn, 'INSERT INTO Usuario (id_usuario, nome, email, senha, tipo) VALUES (?, ?, ?, ?, ?)',
+                usuarios_pacientes())
+    insert_many(conn, 'INSERT INTO Paciente (id_paciente, cpf, telefone, endereco) VALUES (?, ?, ?, ?)',
+                dados_pacientes())
     
     print(f"Usuários inseridos:")
     print(f"- 1 Admin (ID: {admin_id})")
-    print(f"- {len(medico_ids)} Médicos (IDs: {medico_ids})")
-    print(f"- {len(paciente_ids)} Pacientes (IDs: {paciente_ids})")
+    print(f"- {len(medico_ids)} Médicos (IDs: {medico_ids.start}-{medico_ids.stop - 1})")
+    print(f"- {len(paciente_ids)} Pacientes (IDs: {paciente_ids.start}-{paciente_ids.stop - 1})")
     
     return admin_id, medico_ids, paciente_ids
 
-def insert_mock_medicamentos():
+def insert_mock_medicamentos(conn, total=10, rng=random):
     """Inserir medicamentos mock"""
-    conn = sqlite3.connect(DATABASE)
-    
     medicamentos_data = [
         {
             'nome': 'Losartana 50mg',
@@ -288,28 +483,34 @@ def insert_mock_medicamentos():
         }
     ]
     
-    medicamento_ids = []
-    for medicamento in medicamentos_data:
-        cursor = conn.execute(
-            '''INSERT INTO Medicamento 
-               (nome, principio_ativo, fabricante, codigo_barras, prescricao_obrigatoria) 
-               VALUES (?, ?, ?, ?, ?)''',
-            (medicamento['nome'], medicamento['principio_ativo'], 
-             medicamento['fabricante'], medicamento['codigo_barras'], 
-             medicamento['prescricao_obrigatoria'])
-        )
-        medicamento_ids.append(cursor.lastrowid)
-    
-    conn.commit()
-    conn.close()
+    medicamentos_data = medicamentos_data[:total]
+    medicamento_ids = range(1, total + 1)
+    
+    def linhas():
+        for i, id_medicamento in enumerate(medicamento_ids):
+            if i < len(medicamentos_data):
+                medicamento = medicamentos_data[i]
+                yield (id_medicamento, medicamento['nome'], medicamento['principio_ativo'],
+                       medicamento['fabricante'], medicamento['codigo_barras'],
+                       medicamento['prescricao_obrigatoria'])
+            else:
+                yield (id_medicamento, f'Medicamento {id_medicamento} {rng.choice([10, 20, 50, 100, 500])}mg',
+                       f'Princípio Ativo {id_medicamento}', rng.choice(FABRICANTES),
+                       f'789{id_medicamento:010d}', rng.randint(0, 1))
+    
+    insert_many(
+        conn,
+        '''INSERT INTO Medicamento 
+           (id_medicamento, nome, principio_ativo, fabricante, codigo_barras, prescricao_obrigatoria) 
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        linhas()
+    )
     
-    print(f"Medicamentos inseridos: {len(medicamento_ids)} (IDs: {medicamento_ids})")
+    print(f"Medicamentos inseridos: {len(medicamento_ids)}")
     return medicamento_ids
 
-def insert_mock_farmacias():
+def insert_mock_farmacias(conn, total=5, rng=random):
     """Inserir farmácias mock"""
-    conn = sqlite3.connect(DATABASE)
-    
     farmacias_data = [
         {
             'cnpj': '12.345.678/0001-90',
@@ -358,134 +559,199 @@ def insert_mock_farmacias():
         }
     ]
     
-    farmacia_ids = []
-    for farmacia in farmacias_data:
-        cursor = conn.execute(
-            '''INSERT INTO Farmacia 
-               (cnpj, nome_fantasia, endereco, telefone, responsavel_tecnico, latitude, longitude) 
-               VALUES (?, ?, ?, ?, ?, ?, ?)''',
-            (farmacia['cnpj'], farmacia['nome_fantasia'], farmacia['endereco'],
-             farmacia['telefone'], farmacia['responsavel_tecnico'], 
-             farmacia['latitude'], farmacia['longitude'])
-        )
-        farmacia_ids.append(cursor.lastrowid)
-    
-    conn.commit()
-    conn.close()
+    farmacias_data = farmacias_data[:total]
+    farmacia_ids = range(1, total + 1)
+    
+    def linhas():
+        for i, id_farmacia in enumerate(farmacia_ids):
+            if i < len(farmacias_data):
+                farmacia = farmacias_data[i]
+                yield (id_farmacia, farmacia['cnpj'], farmacia['nome_fantasia'], farmacia['endereco'],
+                       farmacia['telefone'], farmacia['responsavel_tecnico'],
+                       farmacia['latitude'], farmacia['longitude'])
+            else:
+                cnpj = f'{id_farmacia:08d}0001{id_farmacia % 100:02d}'
+                yield (id_farmacia,
+                       f'{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}',
+                       f'Farmácia {rng.choice(SOBRENOMES)} {id_farmacia}',
+                       f'Av. {rng.choice(SOBRENOMES)}, {rng.randint(1, 5000)} - {rng.choice(UFS)}',
+                       f'({rng.randint(11, 99)}) {rng.randint(2000, 3999)}-{rng.randint(1000, 9999)}',
+                       f'Farmacêutico(a) {_nome_sintetico(rng)}',
+                       # Aproximadamente o território brasileiro
+                       round(rng.uniform(-33.0, 4.0), 4), round(rng.uniform(-73.0, -35.0), 4))
+    
+    insert_many(
+        conn,
+        '''INSERT INTO Farmacia 
+           (id_farmacia, cnpj, nome_fantasia, endereco, telefone, responsavel_tecnico, latitude, longitude) 
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        linhas()
+    )
     
-    print(f"Farmácias inseridas: {len(farmacia_ids)} (IDs: {farmacia_ids})")
+    print(f"Farmácias inseridas: {len(farmacia_ids)}")
     return farmacia_ids
 
-def insert_mock_receitas(medico_ids, paciente_ids, medicamento_ids):
-    """Inserir receitas mock"""
-    conn = sqlite3.connect(DATABASE)
-    
-    # Status possíveis para receitas
-    status_opcoes = ['ativa', 'utilizada', 'cancelada']
-    
-    # Diagnósticos comuns
-    diagnosticos = [
-        'Hipertensão Arterial',
-        'Diabetes Mellitus Tipo 2',
-        'Infecção Respiratória',
-        'Gastrite',
-        'Cefaleia',
-        'Artralgia',
-        'Síndrome Gripal',
-        'Dislipidemia',
-        'Ansiedade',
-        'Lombalgia'
-    ]
-    
-    # Dosagens comuns
-    dosagens = ['1 comprimido', '2 comprimidos', '1/2 comprimido', '1 cápsula', '2 cápsulas']
-    
-    # Posologias comuns
-    posologias = [
-        '1 vez ao dia',
-        '2 vezes ao dia',
-        '3 vezes ao dia',
-        'De 8 em 8 horas',
-        'De 12 em 12 horas',
-        'A cada 6 horas',
-        'Antes das refeições',
-        'Após as refeições',
-        'Em jejum',
-        'Ao deitar'
-    ]
-    
-    receita_ids = []
+def insert_mock_estoque(conn, farmacia_ids, medicamento_ids, cobertura=0.6, rng=random):
+    """Inserir o estoque de cada farmácia para uma fração dos medicamentos"""
+    # Preço de referência por medicamento; cada farmácia varia em até 20%
+    precos = {id_medicamento: round(rng.uniform(5, 150), 2) for id_medicamento in medicamento_ids}
+    por_farmacia = max(1, int(len(medicamento_ids) * cobertura))
+    
+    def linhas():
+        for id_farmacia in farmacia_ids:
+            for id_medicamento in sorted(rng.sample(medicamento_ids, por_farmacia)):
+                estoque_minimo = rng.choice([5, 10, 20])
+                yield (id_farmacia, id_medicamento,
+                       round(precos[id_medicamento] * rng.uniform(0.8, 1.2), 2),
+                       # Cerca de 10% dos itens abaixo do estoque mínimo
+                       rng.randint(0, estoque_minimo) if rng.random() < 0.1 else rng.randint(estoque_minimo + 1, 500),
+                       estoque_minimo)
+    
+    total = insert_many(
+        conn,
+        '''INSERT INTO EstoqueFarmacia 
+           (id_farmacia, id_medicamento, preco_unitario, quantidade_disponivel, estoque_minimo) 
+           VALUES (?, ?, ?, ?, ?)''',
+        linhas()
+    )
     
-    # Gerar 25 receitas mock
-    for i in range(25):
-        medico_id = random.choice(medico_ids)
-        paciente_id = random.choice(paciente_ids)
-        diagnostico = random.choice(diagnosticos)
-        status = random.choice(status_opcoes)
-        
-        # Data de emissão (últimos 60 dias)
-        dias_atras = random.randint(0, 60)
-        data_emissao = datetime.now() - timedelta(days=dias_atras)
+    print(f"Itens de estoque inseridos: {total}")
+    return total
+
+def _gerar_lote_receitas(parametros):
+    """
+    Gera um lote de receitas, seus medicamentos e as vendas das receitas
+    utilizadas. Roda em processos separados quando --workers > 1.
+    """
+    (primeiro_id, quantidade, seed, medicos, pacientes, medicamentos,
+     farmacias, dias_historico, agora) = parametros
+    rng = random.Random(seed)
+    medico_ids, paciente_ids = range(*medicos), range(*pacientes)
+    medicamento_ids, farmacia_ids = range(*medicamentos), range(*farmacias)
+    hoje = agora.strftime('%Y-%m-%d')
+    
+    receitas, linhas, vendas = [], [], []
+    for receita_id in range(primeiro_id, primeiro_id + quantidade):
+        paciente_id = rng.choice(paciente_ids)
         
-        # Data de validade (30 dias após emissão)
-        validade_dias = random.randint(15, 45)
-        data_validade = data_emissao + timedelta(days=validade_dias)
+        # Data de emissão (últimos N dias)
+        data_emissao = agora - timedelta(days=rng.randint(0, dias_historico),
+                                         seconds=rng.randint(0, 86399))
         
-        # Observações opcionais
-        observacoes_gerais = None
-        if random.random() < 0.3:  # 30% das receitas têm observações
-            observacoes_gerais = random.choice([
-                'Paciente alérgico a dipirona',
-                'Tomar com bastante água',
-                'Evitar exposição ao sol',
-                'Retornar em 15 dias',
-                'Monitorar pressão arterial'
-            ])
+        # Data de validade (15 a 45 dias após emissão)
+        data_validade = (data_emissao + timedelta(days=rng.randint(15, 45))).strftime('%Y-%m-%d')
         
-        # Inserir receita
-        cursor = conn.execute(
-            '''INSERT INTO Receita 
-               (id_medico, id_paciente, data_emissao, data_validade, diagnostico, observacoes, status) 
-               VALUES (?, ?, ?, ?, ?, ?, ?)''',
-            (medico_id, paciente_id, data_emissao.strftime('%Y-%m-%d %H:%M:%S'), 
-             data_validade.strftime('%Y-%m-%d'), diagnostico, observacoes_gerais, status)
-        )
+        status = rng.choice(STATUS_OPCOES)
+        if status == 'ativa' and data_validade < hoje:
+            status = 'expirada'
         
-        receita_id = cursor.lastrowid
-        receita_ids.append(receita_id)
+        # 30% das receitas têm observações
+        observacoes_gerais = rng.choice(OBSERVACOES_RECEITA) if rng.random() < 0.3 else None
         
-        # Inserir 1-4 medicamentos por receita
-        num_medicamentos = random.randint(1, 4)
-        medicamentos_selecionados = random.sample(medicamento_ids, num_medicamentos)
+        receitas.append((receita_id, medico_ids[rng.randrange(len(medico_ids))], paciente_id,
+                         data_emissao.strftime('%Y-%m-%d %H:%M:%S'), data_validade,
+                         rng.choice(DIAGNOSTICOS), observacoes_gerais, status))
         
-        for medicamento_id in medicamentos_selecionados:
-            dosagem = random.choice(dosagens)
-            quantidade = random.randint(1, 3)
-            posologia = random.choice(posologias)
+        # 1-4 medicamentos por receita
+        num_medicamentos = min(rng.randint(1, 4), len(medicamento_ids))
+        valor_total = 0.0
+        for medicamento_id in rng.sample(medicamento_ids, num_medicamentos):
+            quantidade_med = rng.randint(1, 3)
+            valor_total += quantidade_med * rng.uniform(5, 150)
             
-            # Observações específicas do medicamento (opcional)
-            observacoes_med = None
-            if random.random() < 0.2:  # 20% dos medicamentos têm observações
-                observacoes_med = random.choice([
-                    'Tomar longe das refeições',
-                    'Não partir ou mastigar',
-                    'Pode causar sonolência',
-                    'Tomar com alimentos',
-                    'Interromper se houver efeitos colaterais'
-                ])
+            # 20% dos medicamentos têm observações
+            observacoes_med = rng.choice(OBSERVACOES_MEDICAMENTO) if rng.random() < 0.2 else None
             
-            conn.execute(
-                '''INSERT INTO ReceitaMedicamento 
-                   (id_receita, id_medicamento, dosagem, quantidade, posologia, observacoes) 
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                (receita_id, medicamento_id, dosagem, quantidade, posologia, observacoes_med)
-            )
+            linhas.append((receita_id, medicamento_id, rng.choice(DOSAGENS), quantidade_med,
+                           rng.choice(POSOLOGIAS), observacoes_med))
+        
+        # Receitas utilizadas foram dispensadas em alguma farmácia
+        if status == 'utilizada' and len(farmacia_ids):
+            data_venda = data_emissao + timedelta(hours=rng.randint(1, 24 * 10))
+            vendas.append((rng.choice(farmacia_ids), paciente_id, receita_id,
+                           min(data_venda, agora).strftime('%Y-%m-%d %H:%M:%S'), round(valor_total, 2)))
     
-    conn.commit()
-    conn.close()
+    return receitas, linhas, vendas
+
+def insert_mock_receitas(conn, medico_ids, paciente_ids, medicamento_ids, farmacia_ids,
+                         total=25, dias_historico=60, workers=1, seed=None):
+    """Inserir receitas mock, seus medicamentos e as vendas das receitas utilizadas"""
+    agora = datetime.now()
+    base_seed = seed if seed is not None else random.randrange(2**32)
+    
+    lotes = [
+        (inicio, min(CHUNK_SIZE, total - inicio + 1), base_seed + inicio,
+         (medico_ids.start, medico_ids.stop), (paciente_ids.start, paciente_ids.stop),
+         (medicamento_ids.start, medicamento_ids.stop), (farmacia_ids.start, farmacia_ids.stop),
+         dias_historico, agora)
+        for inicio in range(1, total + 1, CHUNK_SIZE)
+    ]
+    
+    pool = multiprocessing.Pool(workers) if workers > 1 and len(lotes) > 1 else None
+    gerados = pool.imap(_gerar_lote_receitas, lotes) if pool else map(_gerar_lote_receitas, lotes)
+    
+    total_receitas = total_linhas = total_vendas = 0
+    try:
+        # As vendas geradas são históricas: os triggers que validam a receita
+        # no momento da venda rejeitariam receitas já vencidas. Receitas novas
+        # não precisam de versão de documento (ausente equivale à versão 0)
+        with triggers_desativados(conn, 'Venda'), \
+                triggers_desativados(conn, 'ReceitaMedicamento'), \
+                indices_desativados(conn, ('Receita', 'ReceitaMedicamento', 'Venda')):
+            for receitas, linhas, vendas in gerados:
+                conn.executemany(
+                    '''INSERT INTO Receita 
+                       (id_receita, id_medico, id_paciente, data_emissao, data_validade, diagnostico, observacoes, status) 
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                    receitas
+                )
+                conn.executemany(
+                    '''INSERT INTO ReceitaMedicamento 
+                       (id_receita, id_medicamento, dosagem, quantidade, posologia, observacoes) 
+                       VALUES (?, ?, ?, ?, ?, ?)''',
+                    linhas
+                )
+                conn.executemany(
+                    '''INSERT INTO Venda 
+                       (id_farmacia, id_paciente, id_receita, data_venda, valor_total) 
+                       VALUES (?, ?, ?, ?, ?)''',
+                    vendas
+                )
+                conn.commit()
+                
+                total_receitas += len(receitas)
+                total_linhas += len(linhas)
+                total_vendas += len(vendas)
+                if total > CHUNK_SIZE:
+                    print(f"  {total_receitas}/{total} receitas...", flush=True)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    
+    print(f"Receitas inseridas: {total_receitas} ({total_linhas} medicamentos prescritos, "
+          f"{total_vendas} vendas)")
+    return range(1, total + 1)
+
+def insert_mock_notificacoes(conn, usuario_ids, total=20, rng=random):
+    """Inserir notificações mock para usuários aleatórios"""
+    agora = datetime.now()
+    
+    def linhas():
+        for _ in range(total):
+            tipo, mensagem = rng.choice(NOTIFICACOES)
+            data_envio = agora - timedelta(minutes=rng.randint(0, 60 * 24 * 60))
+            yield (rng.choice(usuario_ids), mensagem, data_envio.strftime('%Y-%m-%d %H:%M:%S'),
+                   1 if rng.random() < 0.5 else 0, tipo)
+    
+    inseridas = insert_many(
+        conn,
+        'INSERT INTO Notificacao (id_usuario, mensagem, data_envio, foi_lida, tipo) VALUES (?, ?, ?, ?, ?)',
+        linhas()
+    )
     
-    print(f"Receitas inseridas: {len(receita_ids)} (IDs: {receita_ids[:5]}...)")
-    return receita_ids
+    print(f"Notificações inseridas: {inseridas}")
+    return inseridas
 
 def generate_login_credentials():
     """Gerar arquivo com credenciais de login para teste"""
@@ -545,36 +811,78 @@ def generate_login_credentials():
         json.dump(credentials, f, indent=2, ensure_ascii=False)
     
     print("\nArquivo 'credenciais_teste.json' criado com as credenciais de login!")
+def parse_args():
+    parser = argparse.ArgumentParser(description='Gerador de dados mock do sistema de receitas')
+    parser.add_argument('--db', default=DATABASE, help='arquivo do banco (padrão: database.db)')
+    parser.add_argument('--medicos', type=int, default=5)
+    parser.add_argument('--pacientes', type=int, default=7)
+    parser.add_argument('--medicamentos', type=int, default=10)
+    parser.add_argument('--farmacias', type=int, default=5)
+    parser.add_argument('--receitas', type=int, default=25)
+    parser.add_argument('--notificacoes', type=int, default=20)
+    parser.add_argument('--cobertura-estoque', type=float, default=0.6,
+                        help='fração dos medicamentos em estoque em cada farmácia')
+    parser.add_argument('--dias-historico', type=int, default=60,
+                        help='receitas emitidas nos últimos N dias')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processos para gerar os lotes de receitas')
+    parser.add_argument('--seed', type=int, default=None, help='semente para dados reprodutíveis')
+    args = parser.parse_args()
+    
+    if args.medicos < 1 or args.pacientes < 1 or args.medicamentos < 1:
+        parser.error('são necessários ao menos 1 médico, 1 paciente e 1 medicamento')
+    return args
 
 def main():
     """Função principal para executar a geração de dados mock"""
+    args = parse_args()
+    rng = random.Random(args.seed)
+    inicio = time.perf_counter()
+    
     print("=== Gerador de Dados Mock - Sistema de Receitas Médicas ===\n")
     
+    conn = connect(args.db)
+    
     print("1. Limpando banco de dados...")
-    clear_database()
+    clear_database(conn)
     
     print("\n2. Inserindo usuários...")
-    admin_id, medico_ids, paciente_ids = insert_mock_users()
+    admin_id, medico_ids, paciente_ids = insert_mock_users(
+        conn, password_hashes(), args.medicos, args.pacientes, rng
+    )
     
     print("\n3. Inserindo medicamentos...")
-    medicamento_ids = insert_mock_medicamentos()
+    medicamento_ids = insert_mock_medicamentos(conn, args.medicamentos, rng)
     
-    print("\n4. Inserindo farmácias...")
-    farmacia_ids = insert_mock_farmacias()
+    print("\n4. Inserindo farmácias e estoque...")
+    farmacia_ids = insert_mock_farmacias(conn, args.farmacias, rng)
+    total_estoque = insert_mock_estoque(conn, farmacia_ids, medicamento_ids, args.cobertura_estoque, rng)
     
-    print("\n5. Inserindo receitas...")
-    receita_ids = insert_mock_receitas(medico_ids, paciente_ids, medicamento_ids)
+    print("\n5. Inserindo receitas e vendas...")
+    receita_ids = insert_mock_receitas(
+        conn, medico_ids, paciente_ids, medicamento_ids, farmacia_ids,
+        args.receitas, args.dias_historico, args.workers, args.seed
+    )
+    
+    print("\n6. Inserindo notificações...")
+    total_notificacoes = insert_mock_notificacoes(conn, range(1, paciente_ids.stop), args.notificacoes, rng)
+    
+    print("\n7. Atualizando estatísticas do banco...")
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
     
-    print("\n6. Gerando credenciais de teste...")
+    print("\n8. Gerando credenciais de teste...")
     generate_login_credentials()
     
     print(f"\n=== RESUMO ===")
-    print(f"✅ Dados mock inseridos com sucesso!")
+    print(f"✅ Dados mock inseridos com sucesso em {time.perf_counter() - inicio:.1f}s!")
     print(f"📊 Total de registros criados:")
     print(f"   - Usuários: {1 + len(medico_ids) + len(paciente_ids)} (1 admin, {len(medico_ids)} médicos, {len(paciente_ids)} pacientes)")
     print(f"   - Medicamentos: {len(medicamento_ids)}")
-    print(f"   - Farmácias: {len(farmacia_ids)}")
+    print(f"   - Farmácias: {len(farmacia_ids)} ({total_estoque} itens de estoque)")
     print(f"   - Receitas: {len(receita_ids)}")
+    print(f"   - Notificações: {total_notificacoes}")
     print(f"\n🔑 Credenciais salvas em 'credenciais_teste.json'")
     print(f"\n🚀 O sistema está pronto para testes!")
 
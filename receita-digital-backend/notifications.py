@@ -1,6 +1,8 @@
 import requests
 import os
+import threading
 from dotenv import load_dotenv
+import tracing
 
 load_dotenv()
 
@@ -8,6 +10,53 @@ class NotificationManager:
     def __init__(self):
         self.expo_api_url = "https://exp.host/--/api/v2/push/send"
         self.project_id = os.getenv('EXPO_PROJECT_ID')
+        self._lock = threading.Lock()
+        self.envios_em_andamento = 0
+        self.envios_total = 0
+        self.falhas_total = 0
+
+    def _post(self, payload):
+        """Envia a requisição ao serviço de push contabilizando os envios pendentes"""
+        with self._lock:
+            self.envios_em_andamento += 1
+            self.envios_total += 1
+        try:
+            quantidade = len(payload) if isinstance(payload, list) else 1
+            with tracing.span('notification.push', {'http.url': self.expo_api_url,
+                                                    'notification.quantidade': quantidade}) as span:
+                response = requests.post(
+                    self.expo_api_url,
+                    json=payload,
+                    headers={
+                        "Content-Type": "application/json",
+                        "Accept": "application/json",
+                    }
+                )
+                if span:
+                    span.atributos['http.status_code'] = response.status_code
+            if response.status_code != 200:
+                with self._lock:
+                    self.falhas_total += 1
+            return response
+        except Exception:
+            with self._lock:
+                self.falhas_total += 1
+            raise
+        finally:
+            with self._lock:
+                self.envios_em_andamento -= 1
+
+    def metricas(self):
+        """Métricas de envio de notificações para o endpoint /metrics"""
+        with self._lock:
+            return [
+                ('notification_queue_depth', 'gauge', 'Envios de notificação push em andamento', None,
+                 self.envios_em_andamento),
+                ('notification_sends_total', 'counter', 'Envios de notificação push realizados', None,
+                 self.envios_total),
+                ('notification_failures_total', 'counter', 'Envios de notificação push com falha', None,
+                 self.falhas_total),
+            ]
 
     def send_push_notification(self, push_token, title, body, data=None):
         """
@@ -23,14 +72,7 @@ class NotificationManager:
                 "priority": "high",
             }
 
-            response = requests.post(
-                self.expo_api_url,
-                json=message,
-                headers={
-                    "Content-Type": "application/json",
-                    "Accept": "application/json",
-                }
-            )
+            response = self._post(message)
 
             if response.status_code == 200:
                 return response.json()
@@ -59,14 +101,7 @@ class NotificationManager:
                 for token in push_tokens
             ]
 
-            response = requests.post(
-                self.expo_api_url,
-                json=messages,
-                headers={
-                    "Content-Type": "application/json",
-                    "Accept": "application/json",
-                }
-            )
+            response = self._post(messages)
 
             if response.status_code == 200:
                 return response.json()
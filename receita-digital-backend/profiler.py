@@ -0,0 +1,137 @@
+"""
+Perfilamento sob demanda de requisições individuais
+
+Um admin envia o cabeçalho X-Profile em qualquer rota protegida e a
+requisição é executada sob cProfile. O resultado (pstats) é guardado em um
+buffer circular em disco com no máximo PROFILE_MAX_ENTRIES entradas.
+Sem o cabeçalho nada é instrumentado.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from flask import make_response, request
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_ENTRIES = int(os.getenv('PROFILE_MAX_ENTRIES', '20'))
+
+PROFILE_HEADER = 'X-Profile'
+
+_lock = threading.Lock()
+_sequencia = 0
+
+
+def _novo_id():
+    global _sequencia
+    with _lock:
+        _sequencia += 1
+        return f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{_sequencia:04d}"
+
+
+def _caminho(profile_id, extensao):
+    return os.path.join(PROFILE_DIR, f'{profile_id}.{extensao}')
+
+
+def _descartar_antigos():
+    """Mantém apenas os perfis mais recentes no diretório"""
+    metadados = sorted(
+        (os.path.getmtime(os.path.join(PROFILE_DIR, nome)), nome)
+        for nome in os.listdir(PROFILE_DIR) if nome.endswith('.json')
+    )
+    for _, nome in metadados[:-PROFILE_MAX_ENTRIES or None]:
+        profile_id = nome[:-len('.json')]
+        for extensao in ('json', 'pstats'):
+            try:
+                os.remove(_caminho(profile_id, extensao))
+            except FileNotFoundError:
+                pass
+
+
+def _gravar(profile, response, duracao):
+    """Grava o perfil e os metadados no buffer em disco e retorna o id"""
+    profile_id = _novo_id()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile.dump_stats(_caminho(profile_id, 'pstats'))
+
+    metadados = {
+        'id': profile_id,
+        'rota': request.url_rule.rule if request.url_rule else request.path,
+        'caminho': request.full_path,
+        'metodo': request.method,
+        'status': response.status_code,
+        'duracao_ms': round(duracao * 1000, 3),
+        'data': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    with open(_caminho(profile_id, 'json'), 'w', encoding='utf-8') as f:
+        json.dump(metadados, f, ensure_ascii=False)
+
+    with _lock:
+        _descartar_antigos()
+    return profile_id
+
+
+def profile_request(view, *args, **kwargs):
+    """
+    Executa a view sob cProfile e grava o resultado no buffer em disco. Se o
+    perfilamento falhar, a resposta da view sai normalmente, sem X-Profile-Id
+    """
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Outro perfil já ativo (a partir do Python 3.12 o cProfile é global)
+        return view(*args, **kwargs)
+    inicio = time.perf_counter()
+    try:
+        resultado = view(*args, **kwargs)
+    finally:
+        profile.disable()
+    duracao = time.perf_counter() - inicio
+
+    response = make_response(resultado)
+    try:
+        profile_id = _gravar(profile, response, duracao)
+    except Exception:
+        # Disco cheio, diretório sem permissão etc.: o perfil é perdido
+        return response
+
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def list_profiles():
+    """Lista os perfis armazenados, do mais recente para o mais antigo"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+
+    perfis = []
+    for nome in os.listdir(PROFILE_DIR):
+        if not nome.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, nome), encoding='utf-8') as f:
+                perfis.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return sorted(perfis, key=lambda p: p['id'], reverse=True)
+
+
+def get_profile_path(profile_id):
+    """Caminho do arquivo pstats de um perfil, ou None se não existir"""
+    if not re.fullmatch(r'[\w-]+', profile_id):
+        return None
+    caminho = _caminho(profile_id, 'pstats')
+    return caminho if os.path.exists(caminho) else None
+
+
+def format_profile(caminho, ordenacao='cumulative', limite=50):
+    """Resumo textual de um perfil ordenado pela coluna escolhida"""
+    saida = io.StringIO()
+    stats = pstats.Stats(caminho, stream=saida)
+    stats.strip_dirs().sort_stats(ordenacao).print_stats(limite)
+    return saida.getvalue()
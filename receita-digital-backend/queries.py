@@ -0,0 +1,548 @@
+"""
+Instruções SQL usadas pelas rotas da API
+
+Todas as consultas ficam aqui para que test_query_plans.py possa verificar
+o plano de execução de cada uma contra um banco populado. Consultas novas
+devem ser adicionadas a este módulo em vez de escritas direto nas rotas.
+"""
+
+# Autenticação e usuários
+
+# Sem a senha: o resultado fica no cache de usuários
+USUARIO_POR_ID = 'SELECT id_usuario, nome, email, tipo FROM Usuario WHERE id_usuario = ?'
+
+USUARIO_POR_EMAIL = 'SELECT * FROM Usuario WHERE email = ?'
+
+USUARIO_ID_POR_EMAIL = 'SELECT id_usuario FROM Usuario WHERE email = ?'
+
+INSERIR_USUARIO = 'INSERT INTO Usuario (nome, email, senha, tipo) VALUES (?, ?, ?, ?)'
+
+# Só grava se o hash ainda for o lido no login (a senha pode ter mudado nesse meio tempo)
+ATUALIZAR_SENHA = 'UPDATE Usuario SET senha = ? WHERE id_usuario = ? AND senha = ?'
+
+INSERIR_PACIENTE = 'INSERT INTO Paciente (id_paciente, cpf, telefone, endereco) VALUES (?, ?, ?, ?)'
+
+INSERIR_MEDICO = 'INSERT INTO Medico (id_medico, crm, especialidade) VALUES (?, ?, ?)'
+
+PERFIL_USUARIO = 'SELECT id_usuario, nome, email, tipo FROM Usuario WHERE id_usuario = ?'
+
+PERFIL_PACIENTE = 'SELECT cpf, telefone, endereco FROM Paciente WHERE id_paciente = ?'
+
+PERFIL_MEDICO = 'SELECT crm, especialidade FROM Medico WHERE id_medico = ?'
+
+# Listagem de usuários paginada por (nome, id_usuario): cada página começa
+# depois do último usuário da anterior. Com busca, o CROSS JOIN parte do
+# índice FTS5 UsuarioBusca e só os usuários encontrados são ordenados
+_PAGINA_USUARIOS = '''SELECT u.id_usuario, u.nome, u.email, u.tipo
+                      FROM {origem}
+                      WHERE {filtro}(u.nome, u.id_usuario) > (?, ?)
+                      ORDER BY u.nome, u.id_usuario
+                      LIMIT ?'''
+
+_BUSCA_USUARIOS = 'UsuarioBusca b CROSS JOIN Usuario u ON u.id_usuario = b.rowid'
+
+USUARIOS_PAGINA = _PAGINA_USUARIOS.format(origem='Usuario u', filtro='')
+
+USUARIOS_DO_TIPO_PAGINA = _PAGINA_USUARIOS.format(origem='Usuario u', filtro='u.tipo = ? AND ')
+
+USUARIOS_BUSCA_PAGINA = _PAGINA_USUARIOS.format(origem=_BUSCA_USUARIOS, filtro='UsuarioBusca MATCH ? AND ')
+
+USUARIOS_DO_TIPO_BUSCA_PAGINA = _PAGINA_USUARIOS.format(
+    origem=_BUSCA_USUARIOS, filtro='UsuarioBusca MATCH ? AND u.tipo = ? AND '
+)
+
+# Totais mantidos por triggers (migração 0011), sem COUNT(*) em Usuario
+CONTAGEM_USUARIOS = 'SELECT tipo, total FROM UsuarioContagem'
+
+PACIENTE_EXISTE = 'SELECT id_paciente FROM Paciente WHERE id_paciente = ?'
+
+# Busca de pacientes: pelo CPF só com dígitos (idx_paciente_cpf_digitos) ou
+# pelo nome no índice FTS5 PacienteNome, do mais relevante para o menos.
+# Só os 1000 primeiros nomes encontrados são ordenados por relevância: um
+# prefixo curto ("mar") casa com centenas de milhares de pacientes e a busca
+# precisa ser refinada de qualquer forma
+PACIENTES_POR_CPF = '''SELECT p.id_paciente, u.nome, u.email, p.cpf_digitos
+                       FROM Paciente p
+                       JOIN Usuario u ON u.id_usuario = p.id_paciente
+                       WHERE p.cpf_digitos = ?
+                       ORDER BY p.id_paciente'''
+
+PACIENTES_POR_NOME = '''SELECT n.id_paciente, u.nome, u.email, p.cpf_digitos
+                        FROM (SELECT rowid AS id_paciente, rank
+                              FROM PacienteNome
+                              WHERE PacienteNome MATCH ?
+                              LIMIT 1000) n
+                        JOIN Usuario u ON u.id_usuario = n.id_paciente
+                        JOIN Paciente p ON p.id_paciente = n.id_paciente
+                        ORDER BY n.rank
+                        LIMIT ?'''
+
+# Cadastro em lote: valores já existentes entre os do lote (arrays JSON)
+
+EMAILS_EXISTENTES = '''SELECT u.email
+                   FROM json_each(?) ids
+                   CROSS JOIN Usuario u ON u.email = ids.value'''
+
+CPFS_EXISTENTES = '''SELECT p.cpf_digitos
+                   FROM json_each(?) ids
+                   CROSS JOIN Paciente p ON p.cpf_digitos = ids.value'''
+
+CRMS_EXISTENTES = '''SELECT m.crm
+                   FROM json_each(?) ids
+                   CROSS JOIN Medico m ON m.crm = ids.value'''
+
+# Cada usuário do lote é inserido em um savepoint: um conflito desfaz só a linha
+SAVEPOINT_USUARIO = 'SAVEPOINT usuario'
+
+CONFIRMAR_USUARIO = 'RELEASE usuario'
+
+DESFAZER_USUARIO = 'ROLLBACK TO usuario'
+
+# Catálogos
+
+LISTAR_MEDICAMENTOS = 'SELECT * FROM Medicamento ORDER BY nome'
+
+MEDICAMENTO_EXISTE = 'SELECT id_medicamento FROM Medicamento WHERE id_medicamento = ?'
+
+INSERIR_MEDICAMENTO = '''INSERT INTO Medicamento
+               (nome, principio_ativo, fabricante, codigo_barras, prescricao_obrigatoria)
+               VALUES (?, ?, ?, ?, ?)'''
+
+LISTAR_FARMACIAS = 'SELECT * FROM Farmacia ORDER BY nome_fantasia'
+
+INSERIR_FARMACIA = '''INSERT INTO Farmacia
+               (cnpj, nome_fantasia, endereco, telefone, responsavel_tecnico, latitude, longitude)
+               VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+# Receitas
+#
+# Receitas antigas em status final ficam no banco de arquivo (anexado como
+# "arquivo", veja arquivamento.py), com as mesmas tabelas. As consultas de
+# histórico são montadas a partir de um modelo com o prefixo do esquema:
+# '' para o banco principal e 'arquivo.' para o arquivo
+
+INSERIR_RECEITA = '''INSERT INTO Receita
+               (id_medico, id_paciente, data_emissao, data_validade, diagnostico, observacoes, status)
+               VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+INSERIR_RECEITA_MEDICAMENTO = '''INSERT INTO ReceitaMedicamento
+                   (id_receita, id_medicamento, dosagem, quantidade, posologia, observacoes)
+                   VALUES (?, ?, ?, ?, ?, ?)'''
+
+# Dono e versão do documento; usada na checagem de permissão de cada requisição
+_ACESSO = '''SELECT r.id_paciente, r.id_medico, COALESCE(v.versao, 0) as versao
+                   FROM {esquema}Receita r
+                   LEFT JOIN {esquema}ReceitaVersao v ON v.id_receita = r.id_receita
+                   WHERE r.id_receita = ?'''
+
+RECEITA_ACESSO = _ACESSO.format(esquema='')
+
+RECEITA_ACESSO_ARQUIVADA = _ACESSO.format(esquema='arquivo.')
+
+# Dados assinados no código da receita (veja codigos.py), lidos em uma única
+# consulta para a versão e os itens serem do mesmo instante
+RECEITA_CODIGO = '''SELECT r.id_paciente, r.id_medico, r.status, r.data_validade,
+                          COALESCE(v.versao, 0) AS versao, COALESCE(v.com_codigo, 0) AS com_codigo,
+                          (SELECT json_group_array(json_array(rm.id_medicamento, rm.quantidade))
+                           FROM ReceitaMedicamento rm
+                           WHERE rm.id_receita = r.id_receita) AS itens
+                   FROM Receita r
+                   LEFT JOIN ReceitaVersao v ON v.id_receita = r.id_receita
+                   WHERE r.id_receita = ?'''
+
+# Marca a versão como tendo código emitido, só se ela ainda for a lida; uma
+# mudança no meio do caminho faz a rota ler a receita de novo
+MARCAR_CODIGO_EMITIDO = 'UPDATE ReceitaVersao SET com_codigo = 1 WHERE id_receita = ? AND versao = ?'
+
+CRIAR_VERSAO_COM_CODIGO = '''INSERT INTO ReceitaVersao (id_receita, versao, com_codigo) VALUES (?, 0, 1)
+                             ON CONFLICT(id_receita) DO NOTHING'''
+
+# Revogações novas desde a última lida, sem as de receitas já vencidas
+REVOGACOES_DESDE = '''SELECT seq, id_receita, versao FROM CodigoRevogacao
+                      WHERE seq > ? AND (validade IS NULL OR validade >= ?)
+                      ORDER BY seq'''
+
+# Documento completo da receita (dados, médico, paciente e medicamentos) em JSON
+_DOCUMENTO = '''SELECT json_object(
+                       'id_receita', r.id_receita,
+                       'id_paciente', r.id_paciente,
+                       'id_medico', r.id_medico,
+                       'data_emissao', r.data_emissao,
+                       'data_validade', r.data_validade,
+                       'diagnostico', r.diagnostico,
+                       'observacoes', r.observacoes,
+                       'status', r.status,
+                       'numero', printf('#%08d', r.id_receita),
+                       'nome_paciente', up.nome,
+                       'nome_medico', um.nome,
+                       'especialidade', m.especialidade,
+                       'crm', m.crm,
+                       'medicamentos', json((
+                           SELECT json_group_array(json_object(
+                               'id_receita_medicamento', rm.id_receita_medicamento,
+                               'id_receita', rm.id_receita,
+                               'id_medicamento', rm.id_medicamento,
+                               'dosagem', rm.dosagem,
+                               'quantidade', rm.quantidade,
+                               'posologia', rm.posologia,
+                               'observacoes', rm.observacoes,
+                               'nome', med.nome,
+                               'principio_ativo', med.principio_ativo,
+                               'fabricante', med.fabricante
+                           ))
+                           FROM {esquema}ReceitaMedicamento rm
+                           JOIN Medicamento med ON rm.id_medicamento = med.id_medicamento
+                           WHERE rm.id_receita = r.id_receita
+                       ))
+                   ) as documento
+                   FROM {esquema}Receita r
+                   JOIN Paciente p ON r.id_paciente = p.id_paciente
+                   JOIN Usuario up ON p.id_paciente = up.id_usuario
+                   JOIN Medico m ON r.id_medico = m.id_medico
+                   JOIN Usuario um ON m.id_medico = um.id_usuario
+                   WHERE r.id_receita = ?'''
+
+RECEITA_DOCUMENTO = _DOCUMENTO.format(esquema='')
+
+RECEITA_DOCUMENTO_ARQUIVADO = _DOCUMENTO.format(esquema='arquivo.')
+
+# Lote de receitas: os ids chegam como um único parâmetro em array JSON.
+# O CROSS JOIN obriga o SQLite a partir da lista de ids (o planejador não
+# conhece o tamanho de json_each e poderia varrer a tabela de receitas)
+_LOTE = '''SELECT r.*,
+                          printf('#%08d', r.id_receita) as numero,
+                          up.nome as nome_paciente,
+                          um.nome as nome_medico,
+                          m.especialidade,
+                          m.crm
+                   FROM json_each(?) ids
+                   CROSS JOIN {esquema}Receita r ON r.id_receita = ids.value
+                   JOIN Paciente p ON r.id_paciente = p.id_paciente
+                   JOIN Usuario up ON p.id_paciente = up.id_usuario
+                   JOIN Medico m ON r.id_medico = m.id_medico
+                   JOIN Usuario um ON m.id_medico = um.id_usuario'''
+
+RECEITAS_LOTE = _LOTE.format(esquema='')
+
+RECEITAS_LOTE_ARQUIVADAS = _LOTE.format(esquema='arquivo.')
+
+_MEDICAMENTOS_DAS_RECEITAS = '''SELECT rm.*, med.nome, med.principio_ativo, med.fabricante
+                   FROM json_each(?) ids
+                   CROSS JOIN {esquema}ReceitaMedicamento rm ON rm.id_receita = ids.value
+                   JOIN Medicamento med ON rm.id_medicamento = med.id_medicamento'''
+
+MEDICAMENTOS_DAS_RECEITAS = _MEDICAMENTOS_DAS_RECEITAS.format(esquema='')
+
+MEDICAMENTOS_DAS_RECEITAS_ARQUIVADAS = _MEDICAMENTOS_DAS_RECEITAS.format(esquema='arquivo.')
+
+RECEITA_DO_MEDICO = 'SELECT id_receita FROM Receita WHERE id_receita = ? AND id_medico = ?'
+
+RECEITA_EXISTE = 'SELECT id_receita FROM Receita WHERE id_receita = ?'
+
+ATUALIZAR_STATUS_RECEITA = 'UPDATE Receita SET status = ? WHERE id_receita = ?'
+
+_LISTA_RECEITAS = '''SELECT r.*,
+                          um.nome as nome_medico,
+                          m.especialidade,
+                          m.crm,
+                          up.nome as nome_paciente
+                   FROM {esquema}Receita r
+                   JOIN Medico m ON r.id_medico = m.id_medico
+                   JOIN Usuario um ON m.id_medico = um.id_usuario
+                   JOIN Paciente p ON r.id_paciente = p.id_paciente
+                   JOIN Usuario up ON p.id_paciente = up.id_usuario'''
+
+# Todas as listas recebem o período [de, ate) depois do filtro
+_FILTROS_LISTA = {
+    None: 'WHERE r.data_emissao >= ? AND r.data_emissao < ?',
+    'paciente': 'WHERE r.id_paciente = ? AND r.data_emissao >= ? AND r.data_emissao < ?',
+    'medico': 'WHERE r.id_medico = ? AND r.data_emissao >= ? AND r.data_emissao < ?',
+}
+
+
+def _lista_completa(filtro, esquema):
+    return '\n                   '.join((
+        _LISTA_RECEITAS.format(esquema=esquema),
+        _FILTROS_LISTA[filtro],
+        'ORDER BY r.data_emissao DESC'
+    ))
+
+
+RECEITAS_DO_PACIENTE = _lista_completa('paciente', '')
+
+RECEITAS_DO_MEDICO = _lista_completa('medico', '')
+
+RECEITAS_TODAS = _lista_completa(None, '')
+
+RECEITAS_ARQUIVADAS_DO_PACIENTE = _lista_completa('paciente', 'arquivo.')
+
+RECEITAS_ARQUIVADAS_DO_MEDICO = _lista_completa('medico', 'arquivo.')
+
+RECEITAS_ARQUIVADAS_TODAS = _lista_completa(None, 'arquivo.')
+
+# Data de emissão mais recente no arquivo: períodos que começam depois dela
+# não precisam consultar o arquivo
+LIMITE_ARQUIVO = 'SELECT MAX(data_emissao) FROM arquivo.Receita'
+
+# Projeção das listas (?fields= e ?view=resumo): cada campo aceito aponta
+# para a sua expressão SQL e para o join de que depende. Só os joins dos
+# campos pedidos entram na consulta
+CAMPOS_LISTA_RECEITAS = {
+    'id_receita': ('r.id_receita', None),
+    'id_paciente': ('r.id_paciente', None),
+    'id_medico': ('r.id_medico', None),
+    'data_emissao': ('r.data_emissao', None),
+    'data_validade': ('r.data_validade', None),
+    'diagnostico': ('r.diagnostico', None),
+    'observacoes': ('r.observacoes', None),
+    'status': ('r.status', None),
+    'numero': ("printf('#%08d', r.id_receita)", None),
+    'nome_medico': ('um.nome', 'um'),
+    'especialidade': ('m.especialidade', 'm'),
+    'crm': ('m.crm', 'm'),
+    'nome_paciente': ('up.nome', 'up'),
+    'total_medicamentos': ('(SELECT COUNT(*) FROM {esquema}ReceitaMedicamento rm WHERE rm.id_receita = r.id_receita)', None),
+}
+
+_JOINS_LISTA = {
+    'm': 'JOIN Medico m ON r.id_medico = m.id_medico',
+    'um': 'JOIN Usuario um ON r.id_medico = um.id_usuario',
+    'up': 'JOIN Usuario up ON r.id_paciente = up.id_usuario',
+}
+
+# Campos do cartão da lista no app (view=resumo)
+CAMPOS_RESUMO = ('id_receita', 'numero', 'data_emissao', 'status',
+                 'nome_medico', 'especialidade', 'crm', 'total_medicamentos')
+
+
+def lista_receitas(campos, filtro=None, esquema=''):
+    """SELECT da lista de receitas só com os campos pedidos (nomes já validados)"""
+    colunas = ',\n                          '.join(
+        f'{CAMPOS_LISTA_RECEITAS[campo][0].format(esquema=esquema)} as {campo}' for campo in campos
+    )
+    necessarios = {CAMPOS_LISTA_RECEITAS[campo][1] for campo in campos}
+    partes = [f'SELECT {colunas}', f'FROM {esquema}Receita r']
+    partes += [join for alias, join in _JOINS_LISTA.items() if alias in necessarios]
+    partes += [_FILTROS_LISTA[filtro], 'ORDER BY r.data_emissao DESC']
+    return '\n                   '.join(parte for parte in partes if parte)
+
+
+
+def colunas_lista_receitas(campos, com_arquivo=False):
+    """
+    Colunas do SELECT de uma projeção: id_receita sempre acompanha os campos,
+    e data_emissao também quando a lista é intercalada com o arquivo
+    """
+    extras = ['id_receita', 'data_emissao'] if com_arquivo else ['id_receita']
+    return extras + [campo for campo in campos if campo not in extras and campo != 'medicamentos']
+
+# Vendas
+
+RECEITA_PARA_VENDA = 'SELECT id_paciente, status FROM Receita WHERE id_receita = ?'
+
+ITENS_DA_RECEITA = 'SELECT id_medicamento, quantidade FROM ReceitaMedicamento WHERE id_receita = ?'
+
+FARMACIA_EXISTE = 'SELECT id_farmacia FROM Farmacia WHERE id_farmacia = ?'
+
+# Baixa condicional: não altera nada se o estoque não cobrir a quantidade
+BAIXAR_ESTOQUE = '''UPDATE EstoqueFarmacia
+                   SET quantidade_disponivel = quantidade_disponivel - ?,
+                       data_ultima_atualizacao = CURRENT_TIMESTAMP
+                   WHERE id_farmacia = ? AND id_medicamento = ? AND quantidade_disponivel >= ?
+                   RETURNING preco_unitario'''
+
+INSERIR_VENDA = '''INSERT INTO Venda (id_farmacia, id_paciente, id_receita, valor_total)
+                   VALUES (?, ?, ?, ?)'''
+
+# Sincronização do estoque
+
+# Abre a transação já com o lock de escrita, antes das leituras que ela compara
+INICIAR_ESCRITA = 'BEGIN IMMEDIATE'
+
+MEDICAMENTOS_EXISTENTES = '''SELECT med.id_medicamento
+                   FROM json_each(?) ids
+                   CROSS JOIN Medicamento med ON med.id_medicamento = ids.value'''
+
+ESTOQUE_ATUAL = '''SELECT e.id_medicamento, e.preco_unitario, e.quantidade_disponivel, e.estoque_minimo
+                   FROM json_each(?) ids
+                   CROSS JOIN EstoqueFarmacia e ON e.id_farmacia = ? AND e.id_medicamento = ids.value'''
+
+GRAVAR_ESTOQUE = '''INSERT INTO EstoqueFarmacia
+                   (id_farmacia, id_medicamento, preco_unitario, quantidade_disponivel, estoque_minimo)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(id_farmacia, id_medicamento) DO UPDATE SET
+                       preco_unitario = excluded.preco_unitario,
+                       quantidade_disponivel = excluded.quantidade_disponivel,
+                       estoque_minimo = excluded.estoque_minimo,
+                       data_ultima_atualizacao = CURRENT_TIMESTAMP'''
+
+ESTOQUE_COM_SALDO = '''SELECT id_medicamento FROM EstoqueFarmacia
+                   WHERE id_farmacia = ? AND quantidade_disponivel > 0'''
+
+ZERAR_ESTOQUE = '''UPDATE EstoqueFarmacia
+                   SET quantidade_disponivel = 0, data_ultima_atualizacao = CURRENT_TIMESTAMP
+                   WHERE id_farmacia = ? AND id_medicamento = ?'''
+
+# Alertas de estoque baixo marcados pelo trigger estoque_baixo_alerta,
+# distribuídos aos administradores depois da transação que os gerou
+EXISTEM_ALERTAS_ESTOQUE = 'SELECT 1 FROM AlertaEstoque LIMIT 1'
+
+NOTIFICAR_ALERTAS_ESTOQUE = '''INSERT INTO Notificacao (id_usuario, mensagem, tipo)
+                   SELECT u.id_usuario,
+                          'Estoque baixo: ' || m.nome || ' em ' || f.nome_fantasia || ' (' ||
+                          a.quantidade_disponivel || ' unidades, mínimo ' || a.estoque_minimo || ')',
+                          'alerta'
+                   FROM AlertaEstoque a
+                   JOIN Medicamento m ON m.id_medicamento = a.id_medicamento
+                   JOIN Farmacia f ON f.id_farmacia = a.id_farmacia
+                   JOIN Usuario u ON u.tipo = 'admin'
+                   ORDER BY a.criado_em, a.id_farmacia, a.id_medicamento, u.id_usuario'''
+
+APAGAR_ALERTAS_ESTOQUE = 'DELETE FROM AlertaEstoque'
+
+# Itens com estoque baixo, paginados pelo id do medicamento. A condição é a
+# mesma do índice parcial idx_estoque_baixo, que só contém esses itens
+ESTOQUE_BAIXO_DA_FARMACIA = '''SELECT e.id_medicamento,
+                          m.nome as medicamento,
+                          m.principio_ativo,
+                          e.quantidade_disponivel,
+                          e.estoque_minimo,
+                          e.preco_unitario,
+                          e.data_ultima_atualizacao
+                   FROM EstoqueFarmacia e
+                   JOIN Medicamento m ON m.id_medicamento = e.id_medicamento
+                   WHERE e.id_farmacia = ? AND e.quantidade_disponivel <= e.estoque_minimo
+                     AND e.id_medicamento > ?
+                   ORDER BY e.id_medicamento
+                   LIMIT ?'''
+
+# Exportação em lotes por faixa de id: FIM_LOTE_EXPORTACAO acha o último id
+# do lote e EXPORTAR_RECEITAS lê a faixa em ordem de id, com uma linha por
+# medicamento (ou uma linha sem medicamento). O '+' em data_emissao mantém a
+# leitura pela chave primária, na ordem de id, em vez do índice de datas.
+# As versões _ARQUIVADAS leem o arquivo, sem as receitas que também estão no
+# banco principal (arquivamento interrompido)
+_FIM_LOTE_EXPORTACAO = '''SELECT MAX(id_receita) FROM (
+                       SELECT id_receita FROM {esquema}Receita r
+                       WHERE id_receita > ? AND +data_emissao >= ? AND +data_emissao < ?{restricao}
+                       ORDER BY id_receita
+                       LIMIT ?
+                   )'''
+
+_EXPORTAR_RECEITAS = '''SELECT r.id_receita,
+                          printf('#%08d', r.id_receita) as numero,
+                          r.data_emissao,
+                          r.data_validade,
+                          r.status,
+                          r.diagnostico,
+                          r.observacoes,
+                          r.id_paciente,
+                          up.nome as nome_paciente,
+                          r.id_medico,
+                          um.nome as nome_medico,
+                          m.crm,
+                          m.especialidade,
+                          rm.id_medicamento,
+                          med.nome as medicamento,
+                          med.principio_ativo,
+                          rm.dosagem,
+                          rm.quantidade,
+                          rm.posologia,
+                          rm.observacoes as observacoes_medicamento
+                   FROM {esquema}Receita r
+                   JOIN Usuario up ON up.id_usuario = r.id_paciente
+                   JOIN Medico m ON m.id_medico = r.id_medico
+                   JOIN Usuario um ON um.id_usuario = r.id_medico
+                   LEFT JOIN {esquema}ReceitaMedicamento rm ON rm.id_receita = r.id_receita
+                   LEFT JOIN Medicamento med ON med.id_medicamento = rm.id_medicamento
+                   WHERE r.id_receita > ? AND r.id_receita <= ?
+                     AND +r.data_emissao >= ? AND +r.data_emissao < ?{restricao}
+                   ORDER BY r.id_receita'''
+
+_FORA_DO_PRINCIPAL = '''
+                     AND NOT EXISTS (SELECT 1 FROM main.Receita p WHERE p.id_receita = r.id_receita)'''
+
+FIM_LOTE_EXPORTACAO = _FIM_LOTE_EXPORTACAO.format(esquema='', restricao='')
+FIM_LOTE_EXPORTACAO_ARQUIVADAS = _FIM_LOTE_EXPORTACAO.format(esquema='arquivo.', restricao=_FORA_DO_PRINCIPAL)
+
+EXPORTAR_RECEITAS = _EXPORTAR_RECEITAS.format(esquema='', restricao='')
+EXPORTAR_RECEITAS_ARQUIVADAS = _EXPORTAR_RECEITAS.format(esquema='arquivo.', restricao=_FORA_DO_PRINCIPAL)
+
+# Analytics: meses inteiros do período vêm de ReceitaMensal e os dias soltos
+# do início e do fim de ReceitaDiaria (veja analytics.intervalos)
+
+_ANALYTICS_PARTES = '''SELECT mes, chave, receitas, quantidade FROM ReceitaMensal
+                       WHERE dimensao = ? AND mes >= ? AND mes <= ?
+                       UNION ALL
+                       SELECT substr(dia, 1, 7), chave, receitas, quantidade FROM ReceitaDiaria
+                       WHERE dimensao = ? AND dia >= ? AND dia <= ?
+                       UNION ALL
+                       SELECT substr(dia, 1, 7), chave, receitas, quantidade FROM ReceitaDiaria
+                       WHERE dimensao = ? AND dia >= ? AND dia <= ?'''
+
+ANALYTICS_TOTAL = '''SELECT chave, SUM(receitas) as receitas, SUM(quantidade) as quantidade
+                   FROM (''' + _ANALYTICS_PARTES + ''')
+                   GROUP BY chave
+                   ORDER BY receitas DESC, chave
+                   LIMIT ?'''
+
+ANALYTICS_POR_MES = '''SELECT mes, chave, SUM(receitas) as receitas, SUM(quantidade) as quantidade
+                   FROM (''' + _ANALYTICS_PARTES + ''')
+                   GROUP BY mes, chave
+                   ORDER BY mes, receitas DESC, chave
+                   LIMIT ?'''
+
+PROGRESSO_ANALYTICS = 'SELECT ultimo_dia, atualizado_em FROM AnalyticsProgresso WHERE tarefa = ?'
+
+NOMES_MEDICOS = '''SELECT u.id_usuario as id, u.nome
+                   FROM json_each(?) ids
+                   CROSS JOIN Usuario u ON u.id_usuario = ids.value'''
+
+NOMES_MEDICAMENTOS = '''SELECT med.id_medicamento as id, med.nome
+                   FROM json_each(?) ids
+                   CROSS JOIN Medicamento med ON med.id_medicamento = ids.value'''
+
+# Estatísticas
+
+STATS_PACIENTE_TOTAL = 'SELECT COUNT(*) as total FROM Receita WHERE id_paciente = ?'
+
+STATS_PACIENTE_POR_STATUS = 'SELECT COUNT(*) as total FROM Receita WHERE id_paciente = ? AND status = ?'
+
+STATS_MEDICO_TOTAL = 'SELECT COUNT(*) as total FROM Receita WHERE id_medico = ?'
+
+STATS_MEDICO_POR_STATUS = 'SELECT COUNT(*) as total FROM Receita WHERE id_medico = ? AND status = ?'
+
+STATS_MEDICO_PACIENTES = 'SELECT COUNT(DISTINCT id_paciente) as pacientes FROM Receita WHERE id_medico = ?'
+
+STATS_TOTAL_RECEITAS = 'SELECT COUNT(*) as total FROM Receita'
+
+# Receitas arquivadas entram nos totais; ativas nunca são arquivadas
+
+STATS_ARQUIVADAS_PACIENTE_TOTAL = 'SELECT COUNT(*) as total FROM arquivo.Receita WHERE id_paciente = ?'
+
+STATS_ARQUIVADAS_PACIENTE_POR_STATUS = '''SELECT COUNT(*) as total FROM arquivo.Receita
+                   WHERE id_paciente = ? AND status = ?'''
+
+STATS_ARQUIVADAS_MEDICO_TOTAL = 'SELECT COUNT(*) as total FROM arquivo.Receita WHERE id_medico = ?'
+
+STATS_MEDICO_PACIENTES_COM_ARQUIVO = '''SELECT COUNT(*) as pacientes FROM (
+                       SELECT id_paciente FROM Receita WHERE id_medico = ?
+                       UNION
+                       SELECT id_paciente FROM arquivo.Receita WHERE id_medico = ?
+                   )'''
+
+STATS_ARQUIVADAS_TOTAL = 'SELECT COUNT(*) as total FROM arquivo.Receita'
+
+STATS_TOTAL_USUARIOS = 'SELECT COUNT(*) as total FROM Usuario'
+
+STATS_TOTAL_MEDICAMENTOS = 'SELECT COUNT(*) as total FROM Medicamento'
+
+STATS_TOTAL_FARMACIAS = 'SELECT COUNT(*) as total FROM Farmacia'
+
+
+def all_queries():
+    """Todas as instruções do módulo como dicionário nome -> SQL"""
+    return {
+        nome: valor for nome, valor in globals().items()
+        if nome.isupper() and not nome.startswith('_') and isinstance(valor, str)
+    }
@@ -0,0 +1,94 @@
+"""
+Coalescência de leituras idênticas concorrentes (single-flight)
+
+Quando várias requisições pedem a mesma chave ao mesmo tempo, apenas a
+primeira executa a consulta; as demais esperam por ela e recebem o mesmo
+resultado (ou a mesma exceção). Quem espera mais que o timeout da chave
+desiste de esperar e executa a consulta por conta própria.
+
+O resultado compartilhado é o mesmo objeto para todos os chamadores e não
+deve ser alterado.
+"""
+
+import os
+import threading
+
+SINGLEFLIGHT_TIMEOUT = float(os.getenv('SINGLEFLIGHT_TIMEOUT', '5'))
+
+_lock = threading.Lock()
+_em_andamento = {}
+_timeouts = {}
+_contadores = {}
+
+
+class _Chamada:
+    __slots__ = ('evento', 'resultado', 'erro')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+def set_timeout(grupo, segundos):
+    """Define o tempo máximo de espera padrão para as chaves de um grupo"""
+    _timeouts[grupo] = segundos
+
+
+def _contar(grupo, evento):
+    with _lock:
+        contadores = _contadores.setdefault(grupo, {'executadas': 0, 'compartilhadas': 0, 'expiradas': 0})
+        contadores[evento] += 1
+
+
+def do(grupo, chave, funcao, timeout=None):
+    """Executa funcao() uma única vez para chamadas simultâneas com a mesma chave"""
+    identificador = (grupo, chave)
+    with _lock:
+        chamada = _em_andamento.get(identificador)
+        lider = chamada is None
+        if lider:
+            chamada = _em_andamento[identificador] = _Chamada()
+
+    if lider:
+        try:
+            chamada.resultado = funcao()
+            return chamada.resultado
+        except Exception as e:
+            chamada.erro = e
+            raise
+        finally:
+            with _lock:
+                _em_andamento.pop(identificador, None)
+            chamada.evento.set()
+            _contar(grupo, 'executadas')
+
+    if not chamada.evento.wait(_timeouts.get(grupo, SINGLEFLIGHT_TIMEOUT) if timeout is None else timeout):
+        _contar(grupo, 'expiradas')
+        _contar(grupo, 'executadas')
+        return funcao()
+
+    _contar(grupo, 'compartilhadas')
+    if chamada.erro is not None:
+        raise chamada.erro
+    return chamada.resultado
+
+
+def metricas():
+    """Séries da coalescência para o endpoint /metrics"""
+    with _lock:
+        em_andamento = len(_em_andamento)
+        contadores = {grupo: dict(valores) for grupo, valores in _contadores.items()}
+
+    series = [('singleflight_in_flight', 'gauge', 'Execuções coalescidas em andamento', {}, em_andamento)]
+    for grupo, valores in contadores.items():
+        labels = {'grupo': grupo}
+        series.append(('singleflight_executions_total', 'counter',
+                       'Execuções reais de consultas coalescidas', labels, valores['executadas']))
+        series.append(('singleflight_saved_total', 'counter',
+                       'Execuções evitadas por reaproveitar uma consulta em andamento',
+                       labels, valores['compartilhadas']))
+        series.append(('singleflight_timeouts_total', 'counter',
+                       'Esperas que excederam o timeout e executaram por conta própria',
+                       labels, valores['expiradas']))
+    return series
@@ -0,0 +1,105 @@
+"""
+Testes da consolidação das estatísticas de receitas (analytics.py)
+
+Confere que as execuções incrementais chegam às mesmas tabelas que a
+reconstrução completa e que /api/analytics/receitas concorda com um GROUP BY
+direto sobre as receitas do banco principal e do arquivo.
+
+Execute com: python -m pytest test_analytics.py
+"""
+
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+import analytics
+import arquivamento
+from conftest import ADMIN, autorizacao, criar_receita
+
+# Contagem direta do período [de, ate], nas mesmas chaves da rota
+_DIRETO = {
+    'medico': '''SELECT r.id_medico, COUNT(*), NULL FROM {esquema}Receita r
+                 WHERE r.data_emissao >= ? AND r.data_emissao < ?
+                 GROUP BY r.id_medico''',
+    'especialidade': '''SELECT COALESCE(m.especialidade, 'Não informada'), COUNT(*), NULL
+                 FROM {esquema}Receita r JOIN Medico m ON m.id_medico = r.id_medico
+                 WHERE r.data_emissao >= ? AND r.data_emissao < ?
+                 GROUP BY 1''',
+    'medicamento': '''SELECT rm.id_medicamento, COUNT(DISTINCT r.id_receita), SUM(rm.quantidade)
+                 FROM {esquema}Receita r
+                 JOIN {esquema}ReceitaMedicamento rm ON rm.id_receita = r.id_receita
+                 WHERE r.data_emissao >= ? AND r.data_emissao < ?
+                 GROUP BY rm.id_medicamento''',
+    'diagnostico': '''SELECT r.diagnostico, COUNT(*), NULL FROM {esquema}Receita r
+                 WHERE r.data_emissao >= ? AND r.data_emissao < ?
+                 GROUP BY r.diagnostico''',
+}
+
+
+def tabelas(caminho):
+    with sqlite3.connect(caminho) as conn:
+        return (
+            conn.execute('SELECT * FROM ReceitaDiaria ORDER BY dimensao, dia, chave').fetchall(),
+            conn.execute('SELECT * FROM ReceitaMensal ORDER BY dimensao, mes, chave').fetchall(),
+        )
+
+
+def diagnostico(caminho, id_receita, texto):
+    with sqlite3.connect(caminho) as conn:
+        conn.execute('UPDATE Receita SET diagnostico = ? WHERE id_receita = ?', (texto, id_receita))
+
+
+def test_incremental_igual_a_reconstrucao(banco_api):
+    criar_receita(banco_api, emissao='2024-01-30 09:00:00')
+    criar_receita(banco_api, itens=((2, 4),), emissao='2024-01-31 10:00:00')
+    assert analytics.atualizar(banco_api, hoje=date(2024, 1, 31)) == 2
+
+    # O dia atual da execução anterior ainda recebe receitas, e o mês vira
+    diagnostico(banco_api, criar_receita(banco_api, emissao='2024-01-31 18:00:00'), 'Gripe')
+    criar_receita(banco_api, itens=((1, 1),), emissao='2024-02-01 08:00:00')
+    analytics.atualizar(banco_api, hoje=date(2024, 2, 2))
+    criar_receita(banco_api, emissao='2024-02-02 15:00:00', status='cancelada')
+    criar_receita(banco_api, itens=((2, 2),), emissao='2024-03-05 11:00:00')
+    analytics.atualizar(banco_api, hoje=date(2024, 3, 5))
+    incremental = tabelas(banco_api)
+
+    analytics.atualizar(banco_api, reconstruir=True, hoje=date(2024, 3, 5))
+
+    assert incremental == tabelas(banco_api)
+    diarias, mensais = incremental
+    assert ('medicamento', '2024-01', '1', 2, 4) in mensais
+
+
+@pytest.mark.parametrize('dimensao', analytics.DIMENSOES)
+def test_rota_igual_a_contagem_direta_com_arquivo(cliente, banco_api, dimensao):
+    de, ate = date(2024, 1, 15), date(2024, 3, 20)
+    criar_receita(banco_api, emissao='2024-01-10 10:00:00', status='utilizada')
+    criar_receita(banco_api, emissao='2024-01-20 10:00:00', status='utilizada')
+    diagnostico(banco_api, criar_receita(banco_api, itens=((2, 3),), emissao='2024-02-10 10:00:00',
+                                         status='cancelada'), 'Gripe')
+    criar_receita(banco_api, itens=((1, 5),), emissao='2024-02-29 23:00:00')
+    criar_receita(banco_api, emissao='2024-03-20 12:00:00', status='expirada')
+    criar_receita(banco_api, emissao='2024-03-21 12:00:00')
+    assert arquivamento.arquivar(banco_api, meses=0)['arquivadas'] == 4
+    analytics.atualizar(banco_api, hoje=date(2024, 3, 31))
+
+    resposta = cliente.get(f'/api/analytics/receitas?dim={dimensao}&de={de}&ate={ate}',
+                           headers=autorizacao(ADMIN))
+
+    assert resposta.status_code == 200, resposta.get_json()
+    rota = {(str(item['chave']), item['receitas'], item.get('quantidade'))
+            for item in resposta.get_json()['resultados']}
+    periodo = (de.isoformat(), (ate + timedelta(days=1)).isoformat())
+    conn = sqlite3.connect(banco_api)
+    try:
+        assert arquivamento.anexar(conn)
+        direto = {}
+        for esquema in ('main.', 'arquivo.'):
+            for chave, receitas, quantidade in conn.execute(_DIRETO[dimensao].format(esquema=esquema), periodo):
+                anterior = direto.get(str(chave), (0, None))
+                soma = None if quantidade is None else (anterior[1] or 0) + quantidade
+                direto[str(chave)] = (anterior[0] + receitas, soma)
+    finally:
+        conn.close()
+    assert rota == {(chave, receitas, quantidade) for chave, (receitas, quantidade) in direto.items()}
@@ -0,0 +1,128 @@
+"""
+Testes do arquivamento das receitas antigas (arquivamento.py)
+
+Arquiva receitas em status final de um banco pequeno e confere que elas
+saem do banco principal, continuam legíveis pelo arquivo anexado e
+aparecem na lista e na exportação; e que uma receita alterada entre a
+cópia e a remoção fica no banco principal.
+
+Execute com: python -m pytest test_arquivamento.py
+"""
+
+import json
+import sqlite3
+
+import pytest
+
+import arquivamento
+import exportacao
+from conftest import ADMIN, autorizacao, criar_receita
+
+
+@pytest.fixture
+def receitas(banco_api):
+    """Ids por nome; as finais e antigas vão para o arquivo, intercaladas com as que ficam"""
+    return {
+        'utilizada': criar_receita(banco_api, status='utilizada', emissao='2024-01-10 10:00:00'),
+        'ativa_antiga': criar_receita(banco_api, emissao='2024-02-10 10:00:00'),
+        'cancelada': criar_receita(banco_api, itens=((2, 3),), status='cancelada',
+                                   emissao='2024-03-10 10:00:00'),
+        'ativa': criar_receita(banco_api),
+    }
+
+
+def ids(conn, sql, *parametros):
+    return [linha[0] for linha in conn.execute(sql, parametros)]
+
+
+def test_receitas_arquivadas_saem_do_banco_principal(banco_api, receitas):
+    contagem = arquivamento.arquivar(banco_api, meses=0)
+
+    assert contagem['arquivadas'] == 2
+    arquivadas = [receitas['utilizada'], receitas['cancelada']]
+    conn = sqlite3.connect(banco_api)
+    try:
+        assert ids(conn, 'SELECT id_receita FROM Receita ORDER BY id_receita') == [
+            receitas['ativa_antiga'], receitas['ativa']]
+        assert ids(conn, 'SELECT DISTINCT id_receita FROM ReceitaMedicamento ORDER BY 1') == [
+            receitas['ativa_antiga'], receitas['ativa']]
+
+        assert arquivamento.anexar(conn)
+        assert ids(conn, 'SELECT id_receita FROM arquivo.Receita ORDER BY id_receita') == arquivadas
+        itens = conn.execute('''SELECT id_receita, id_medicamento, quantidade
+                                FROM arquivo.ReceitaMedicamento ORDER BY id_receita, id_medicamento''').fetchall()
+        assert itens == [(receitas['utilizada'], 1, 2), (receitas['utilizada'], 2, 1),
+                         (receitas['cancelada'], 2, 3)]
+
+        # A API anexa o arquivo somente leitura
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute('DELETE FROM arquivo.Receita')
+    finally:
+        conn.close()
+
+
+def test_lista_intercala_as_receitas_arquivadas(cliente, banco_api, receitas):
+    arquivamento.arquivar(banco_api, meses=0)
+
+    resposta = cliente.get('/api/receitas', headers=autorizacao(ADMIN))
+
+    assert resposta.status_code == 200, resposta.get_json()
+    lista = resposta.get_json()
+    # Mais recentes primeiro, misturando os dois bancos
+    assert [receita['id_receita'] for receita in lista] == [
+        receitas['ativa'], receitas['cancelada'], receitas['ativa_antiga'], receitas['utilizada']]
+    cancelada = next(receita for receita in lista if receita['id_receita'] == receitas['cancelada'])
+    assert [(m['id_medicamento'], m['quantidade']) for m in cancelada['medicamentos']] == [(2, 3)]
+
+
+def test_exportacao_intercala_as_receitas_arquivadas(cliente, banco_api, receitas, monkeypatch):
+    arquivamento.arquivar(banco_api, meses=0)
+    # Lotes de uma receita: cada faixa de id cruza os dois bancos
+    monkeypatch.setattr(exportacao, 'EXPORT_LOTE', 1)
+
+    resposta = cliente.get('/api/export/receitas?formato=ndjson', headers=autorizacao(ADMIN))
+
+    assert resposta.status_code == 200
+    exportadas = [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+    assert [receita['id_receita'] for receita in exportadas] == sorted(receitas.values())
+    assert {receita['id_receita']: len(receita['medicamentos']) for receita in exportadas} == {
+        receitas['utilizada']: 2, receitas['ativa_antiga']: 2, receitas['cancelada']: 1, receitas['ativa']: 2}
+
+
+class _AlteraAntesDeApagar(sqlite3.Connection):
+    """Altera a receita alvo entre a cópia e a remoção (segundo BEGIN IMMEDIATE)"""
+
+    alvo = None
+    inicios = 0
+
+    def execute(self, sql, *args):
+        if sql == 'BEGIN IMMEDIATE':
+            self.inicios += 1
+            if self.inicios == 2:
+                super().execute("UPDATE Receita SET observacoes = 'alterada' WHERE id_receita = ?",
+                                (self.alvo,))
+        return super().execute(sql, *args)
+
+
+def test_receita_alterada_durante_a_copia_fica_no_banco_principal(banco_api, receitas):
+    arquivo = 'arquivo.db'
+    arquivamento.criar_arquivo(arquivo)
+    conn = sqlite3.connect(banco_api, isolation_level=None, factory=_AlteraAntesDeApagar)
+    conn.alvo = receitas['cancelada']
+    try:
+        conn.execute('ATTACH DATABASE ? AS arquivo', (arquivo,))
+        arquivadas, alteradas = arquivamento._mover_lote(conn, [receitas['utilizada'], receitas['cancelada']])
+
+        assert (arquivadas, alteradas) == (1, 1)
+        assert ids(conn, 'SELECT id_receita FROM main.Receita WHERE id_receita IN (?, ?)',
+                   receitas['utilizada'], receitas['cancelada']) == [receitas['cancelada']]
+        assert conn.execute('SELECT observacoes FROM main.Receita WHERE id_receita = ?',
+                            (receitas['cancelada'],)).fetchone()[0] == 'alterada'
+        assert ids(conn, 'SELECT COUNT(*) FROM main.ReceitaMedicamento WHERE id_receita = ?',
+                   receitas['cancelada']) == [1]
+        # A cópia desatualizada sai do arquivo
+        assert ids(conn, 'SELECT id_receita FROM arquivo.Receita') == [receitas['utilizada']]
+        assert ids(conn, 'SELECT id_receita FROM arquivo.ReceitaMedicamento WHERE id_receita = ?',
+                   receitas['cancelada']) == []
+    finally:
+        conn.close()
@@ -0,0 +1,111 @@
+"""
+Testes do cache em memória (cache.py)
+
+Confere a invalidação entre conexões (uma gravação por outra conexão muda
+CacheVersao e esvazia o namespace na próxima leitura) e a expiração por
+TTL e por LRU ao chegar em max_entries.
+
+Execute com: python -m pytest test_cache.py
+"""
+
+import sqlite3
+
+import pytest
+
+import cache
+from conftest import ADMIN, autorizacao
+
+
+@pytest.fixture(autouse=True)
+def namespaces(banco_api, monkeypatch):
+    """Namespaces criados no teste somem depois; os da aplicação começam vazios"""
+    monkeypatch.setattr(cache, '_namespaces', dict(cache._namespaces))
+    cache.invalidate()
+
+
+class Carga:
+    """carregar() que conta as chamadas e devolve o valor atual"""
+
+    def __init__(self, valor='v'):
+        self.valor = valor
+        self.chamadas = 0
+
+    def __call__(self):
+        self.chamadas += 1
+        return self.valor
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def monotonic(self):
+        return self.agora
+
+
+def medicamentos(cliente):
+    resposta = cliente.get('/api/medicamentos', headers=autorizacao(ADMIN))
+    assert resposta.status_code == 200
+    return [medicamento['nome'] for medicamento in resposta.get_json()]
+
+
+def test_gravacao_de_outra_conexao_invalida(cliente, banco_api):
+    antes = medicamentos(cliente)
+
+    with sqlite3.connect(banco_api) as conn:
+        conn.execute("INSERT INTO Medicamento (nome, principio_ativo, fabricante) "
+                     "VALUES ('Ibuprofeno 400mg', 'Ibuprofeno', 'Lab C')")
+
+    assert medicamentos(cliente) == sorted(antes + ['Ibuprofeno 400mg'])
+
+
+def test_so_o_namespace_alterado_e_esvaziado(banco_api):
+    lista, usuario = Carga(), Carga()
+    cache.get_or_load('medicamentos', 'lista', lista)
+    cache.get_or_load('usuarios', ('usuario', 1), usuario)
+
+    with sqlite3.connect(banco_api) as conn:
+        conn.execute("UPDATE Medicamento SET fabricante = 'Lab Z' WHERE id_medicamento = 1")
+
+    cache.get_or_load('medicamentos', 'lista', lista)
+    cache.get_or_load('usuarios', ('usuario', 1), usuario)
+    assert (lista.chamadas, usuario.chamadas) == (2, 1)
+
+    # Sem gravação nova, PRAGMA data_version não muda e o cache vale
+    cache.get_or_load('medicamentos', 'lista', lista)
+    assert lista.chamadas == 2
+
+
+def test_expiracao_por_ttl(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(cache, 'time', relogio)
+    cache.configure('teste_ttl', ttl=10)
+    carga = Carga()
+
+    cache.get_or_load('teste_ttl', 'a', carga)
+    relogio.agora += 9
+    cache.get_or_load('teste_ttl', 'a', carga)
+    assert carga.chamadas == 1
+
+    relogio.agora += 2
+    cache.get_or_load('teste_ttl', 'a', carga)
+    assert carga.chamadas == 2
+
+
+def test_lru_ao_chegar_em_max_entries():
+    cache.configure('teste_lru', max_entries=2, ttl=0)
+    cargas = {chave: Carga(chave) for chave in 'abc'}
+
+    cache.get_or_load('teste_lru', 'a', cargas['a'])
+    cache.get_or_load('teste_lru', 'b', cargas['b'])
+    # "a" passa a ser a mais recente; "c" expulsa "b"
+    cache.get_or_load('teste_lru', 'a', cargas['a'])
+    cache.get_or_load('teste_lru', 'c', cargas['c'])
+
+    assert cache.stats()['teste_lru']['entradas'] == 2
+    # Da menos para a mais recente
+    assert list(cache._namespaces['teste_lru'].entradas) == ['a', 'c']
+
+    cache.get_or_load('teste_lru', 'b', cargas['b'])
+    assert {chave: carga.chamadas for chave, carga in cargas.items()} == {'a': 1, 'b': 2, 'c': 1}
+    assert list(cache._namespaces['teste_lru'].entradas) == ['c', 'b']
@@ -0,0 +1,104 @@
+"""
+Testes do cadastro de usuários em lote (POST /api/usuarios/lote)
+
+Confere os repetidos dentro do lote, os conflitos com cadastros que já
+existem (CPF em qualquer formato), o savepoint que desfaz só a linha que
+conflita com um cadastro concorrente e os hashes gerados no pool.
+
+Execute com: python -m pytest test_cadastro.py
+"""
+
+import sqlite3
+
+from werkzeug.security import check_password_hash
+
+import hashing
+from conftest import ADMIN, autorizacao
+
+
+def paciente(email, cpf=None, senha='senha123'):
+    return {'nome': f'Paciente {email}', 'email': email, 'senha': senha, 'tipo': 'paciente', 'cpf': cpf}
+
+
+def cadastrar(cliente, usuarios):
+    resposta = cliente.post('/api/usuarios/lote', json={'usuarios': usuarios}, headers=autorizacao(ADMIN))
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()
+
+
+def resultados(resposta):
+    return [(r['resultado'], r.get('campo')) for r in resposta['resultados']]
+
+
+def emails(banco_api):
+    with sqlite3.connect(banco_api) as conn:
+        return {linha[0] for linha in conn.execute('SELECT email FROM Usuario')}
+
+
+def test_repetidos_dentro_do_lote(cliente, banco_api):
+    resposta = cadastrar(cliente, [
+        paciente('a@teste.com', '111.222.333-44'),
+        paciente('a@teste.com', '555.666.777-88'),
+        # Mesmo CPF da primeira linha, em outro formato
+        paciente('b@teste.com', '11122233344'),
+        paciente('c@teste.com', '999.888.777-66'),
+    ])
+
+    assert resultados(resposta) == [('criado', None), ('duplicado', 'email'), ('duplicado', 'cpf'), ('criado', None)]
+    assert resposta['criados'] == 2
+    assert {'a@teste.com', 'c@teste.com'} <= emails(banco_api)
+    assert 'b@teste.com' not in emails(banco_api)
+
+
+def test_conflitos_com_cadastros_existentes(cliente, banco_api):
+    resposta = cadastrar(cliente, [
+        paciente('admin@teste.com'),
+        # O paciente de teste tem '123.456.789-01'
+        paciente('novo@teste.com', '12345678901'),
+        {'nome': 'Dr. Novo', 'email': 'dr@teste.com', 'senha': 'x', 'tipo': 'medico',
+         'crm': 'CRM-T1', 'especialidade': 'Cardiologia'},
+        paciente('livre@teste.com', '000.111.222-33'),
+    ])
+
+    assert resultados(resposta) == [('ja_cadastrado', 'email'), ('ja_cadastrado', 'cpf'),
+                                    ('ja_cadastrado', 'crm'), ('criado', None)]
+
+
+def test_conflito_concorrente_desfaz_so_a_linha(cliente, banco_api, monkeypatch):
+    gerar_hashes = hashing.gerar_hashes
+
+    def com_cadastro_concorrente(senhas):
+        # Outra requisição grava o CPF entre a verificação e a inserção
+        with sqlite3.connect(banco_api) as conn:
+            conn.execute("INSERT INTO Usuario (id_usuario, nome, email, senha, tipo) "
+                         "VALUES (10, 'Concorrente', 'concorrente@teste.com', '-', 'paciente')")
+            conn.execute("INSERT INTO Paciente (id_paciente, cpf) VALUES (10, '444.555.666-77')")
+        return gerar_hashes(senhas)
+
+    monkeypatch.setattr(hashing, 'gerar_hashes', com_cadastro_concorrente)
+
+    resposta = cadastrar(cliente, [
+        paciente('primeiro@teste.com', '000.111.222-33'),
+        paciente('conflito@teste.com', '444.555.666-77'),
+        paciente('ultimo@teste.com', '999.888.777-66'),
+    ])
+
+    assert resultados(resposta) == [('criado', None), ('ja_cadastrado', 'cpf'), ('criado', None)]
+    # O Usuario da linha já tinha sido inserido quando o Paciente falhou
+    cadastrados = emails(banco_api)
+    assert 'conflito@teste.com' not in cadastrados
+    assert {'primeiro@teste.com', 'ultimo@teste.com', 'concorrente@teste.com'} <= cadastrados
+
+
+def test_senhas_com_hash_do_pool(cliente, banco_api):
+    resposta = cadastrar(cliente, [paciente('um@teste.com', senha='senha-um'),
+                                   paciente('dois@teste.com', senha=' senha dois ')])
+
+    assert resposta['criados'] == 2
+    assert 'cadastro' in hashing._pools
+    with sqlite3.connect(banco_api) as conn:
+        senhas = dict(conn.execute("SELECT email, senha FROM Usuario WHERE email IN ('um@teste.com', 'dois@teste.com')"))
+    assert check_password_hash(senhas['um@teste.com'], 'senha-um')
+    # A senha é usada como veio, com os espaços
+    assert check_password_hash(senhas['dois@teste.com'], ' senha dois ')
+    assert not check_password_hash(senhas['dois@teste.com'], 'senha dois')
@@ -0,0 +1,132 @@
+"""
+Testes dos códigos assinados de receita (codigos.py e as rotas de código)
+
+Emite códigos pela API em um banco pequeno e confere a assinatura, a
+revogação depois da venda e da mudança de status, a adulteração, a validade
+e a troca de chave.
+
+Execute com: python -m pytest test_codigos.py
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+import codigos
+from conftest import ADMIN, FARMACIA, MEDICO, PACIENTE, autorizacao, criar_receita
+
+
+@pytest.fixture(autouse=True)
+def chaves(banco_api, monkeypatch):
+    # Cada conferência lê as revogações novas na hora
+    monkeypatch.setattr(codigos, 'CODIGO_SINCRONIZACAO_MS', 0)
+    codigos.configurar('1:segredo-de-teste')
+    yield
+    codigos.configurar('')
+
+
+def emitir(cliente, id_receita, id_usuario=PACIENTE):
+    resposta = cliente.get(f'/api/receitas/{id_receita}/codigo', headers=autorizacao(id_usuario))
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()['codigo']
+
+
+def conferir(cliente, codigo):
+    resposta = cliente.post('/api/receitas/verificar', json={'codigo': codigo},
+                            headers=autorizacao(ADMIN))
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()
+
+
+def test_codigo_emitido_confere(cliente, banco_api):
+    id_receita = criar_receita(banco_api, itens=((1, 2), (2, 1)))
+
+    resultado = conferir(cliente, emitir(cliente, id_receita))
+
+    assert resultado['valido'] is True
+    assert resultado['receita']['id_receita'] == id_receita
+    assert resultado['receita']['id_paciente'] == PACIENTE
+    assert resultado['receita']['medicamentos'] == [
+        {'id_medicamento': 1, 'quantidade': 2},
+        {'id_medicamento': 2, 'quantidade': 1},
+    ]
+
+
+def test_venda_revoga_o_codigo(cliente, banco_api):
+    id_receita = criar_receita(banco_api)
+    codigo = emitir(cliente, id_receita)
+
+    venda = cliente.post('/api/vendas', json={'id_receita': id_receita, 'id_farmacia': FARMACIA},
+                         headers=autorizacao(ADMIN))
+    assert venda.status_code == 201, venda.get_json()
+
+    assert conferir(cliente, codigo) == {'valido': False, 'motivo': 'revogada', 'id_receita': id_receita}
+
+
+def test_mudanca_de_status_revoga_o_codigo(cliente, banco_api):
+    id_receita = criar_receita(banco_api)
+    codigo = emitir(cliente, id_receita, MEDICO)
+
+    resposta = cliente.put(f'/api/receitas/{id_receita}/status', json={'status': 'cancelada'},
+                           headers=autorizacao(MEDICO))
+    assert resposta.status_code == 200, resposta.get_json()
+
+    assert conferir(cliente, codigo)['motivo'] == 'revogada'
+
+
+def test_codigo_de_outra_receita_continua_valido(cliente, banco_api):
+    revogada = criar_receita(banco_api)
+    outra = criar_receita(banco_api)
+    codigo_revogado, codigo = emitir(cliente, revogada), emitir(cliente, outra)
+
+    cliente.put(f'/api/receitas/{revogada}/status', json={'status': 'cancelada'},
+                headers=autorizacao(ADMIN))
+
+    assert conferir(cliente, codigo_revogado)['motivo'] == 'revogada'
+    assert conferir(cliente, codigo)['valido'] is True
+
+
+def test_assinatura_adulterada(cliente, banco_api):
+    codigo = emitir(cliente, criar_receita(banco_api))
+
+    # Um caractere no meio da assinatura (os últimos 26 caracteres)
+    posicao = len(codigo) - 10
+    trocado = 'A' if codigo[posicao] != 'A' else 'B'
+    adulterado = codigo[:posicao] + trocado + codigo[posicao + 1:]
+
+    assert conferir(cliente, adulterado) == {'valido': False, 'motivo': 'assinatura'}
+
+
+def test_codigo_vencido(banco_api):
+    ontem = (date.today() - timedelta(days=1)).isoformat()
+    codigo = codigos.gerar(99999, PACIENTE, 1, ontem, [(1, 1)])
+
+    assert codigos.verificar([codigo]) == [{'valido': False, 'motivo': 'vencida', 'id_receita': 99999}]
+
+
+def test_troca_de_chave(cliente, banco_api):
+    id_receita = criar_receita(banco_api)
+    antigo = emitir(cliente, id_receita)
+
+    # A chave nova assina e a antiga continua valendo na conferência
+    codigos.configurar('2:segredo-novo,1:segredo-de-teste')
+    novo = emitir(cliente, id_receita)
+    assert novo != antigo
+    assert conferir(cliente, antigo)['valido'] is True
+    assert conferir(cliente, novo)['valido'] is True
+
+    # Retirada a chave antiga, só os códigos novos valem
+    codigos.configurar('2:segredo-novo')
+    assert conferir(cliente, antigo)['motivo'] == 'assinatura'
+    assert conferir(cliente, novo)['valido'] is True
+
+
+def test_sem_chave_os_codigos_ficam_desativados(cliente, banco_api):
+    id_receita = criar_receita(banco_api)
+    codigo = emitir(cliente, id_receita)
+    codigos.configurar('')
+
+    assert cliente.get(f'/api/receitas/{id_receita}/codigo',
+                       headers=autorizacao(PACIENTE)).status_code == 503
+    assert cliente.post('/api/receitas/verificar', json={'codigo': codigo},
+                        headers=autorizacao(ADMIN)).status_code == 503
@@ -0,0 +1,59 @@
+"""
+Testes do log de consultas lentas (db_monitor.py)
+
+Com o limite em zero toda instrução é lenta: confere que as consultas de
+uma rota comum e as da exportação, executadas enquanto o corpo é enviado
+em streaming, chegam ao log com a rota e o plano.
+
+Execute com: python -m pytest test_db_monitor.py
+"""
+
+import json
+import logging
+
+import pytest
+
+import db_monitor
+import queries
+from conftest import ADMIN, autorizacao, criar_receita
+
+
+@pytest.fixture
+def registros(banco_api, monkeypatch):
+    """Registros do log de consultas lentas, já decodificados"""
+    monkeypatch.setattr(db_monitor, 'SLOW_QUERY_MS', 0)
+    capturados = []
+
+    class Captura(logging.Handler):
+        def emit(self, record):
+            capturados.append(json.loads(record.getMessage()))
+
+    # Em vez do arquivo configurado em SLOW_QUERY_LOG
+    monkeypatch.setattr(db_monitor.slow_query_logger, 'handlers', [Captura()])
+    return capturados
+
+
+def sqls(registros, rota):
+    return [registro['sql'] for registro in registros if registro['rota'] == rota]
+
+
+def test_consultas_de_uma_rota_comum(cliente, banco_api, registros):
+    resposta = cliente.get('/api/usuarios', headers=autorizacao(ADMIN))
+
+    assert resposta.status_code == 200
+    assert ' '.join(queries.USUARIOS_PAGINA.split()) in sqls(registros, '/api/usuarios')
+
+
+def test_consultas_da_exportacao_em_streaming(cliente, banco_api, registros):
+    criar_receita(banco_api)
+
+    resposta = cliente.get('/api/export/receitas?formato=ndjson', headers=autorizacao(ADMIN))
+    corpo = resposta.get_data(as_text=True)
+    # As consultas lidas durante o envio vão para o log quando a resposta fecha
+    resposta.close()
+
+    assert resposta.status_code == 200 and corpo
+    exportacao = [registro for registro in registros if registro['rota'] == '/api/export/receitas']
+    assert ' '.join(queries.EXPORTAR_RECEITAS.split()) in [registro['sql'] for registro in exportacao]
+    assert all(registro['metodo'] == 'GET' and 'plano' in registro
+               for registro in exportacao if registro['sql'].startswith('SELECT'))
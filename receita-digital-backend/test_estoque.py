@@ -0,0 +1,160 @@
+"""
+Testes da sincronização do estoque (PUT /api/farmacias/<id>/estoque)
+
+Envia snapshots em NDJSON e confere o snapshot parcial e o completo, a
+posição informada para uma linha malformada e os snapshots maiores que um
+lote de ESTOQUE_LOTE, inclusive um item inválido em um lote posterior; e
+os alertas de estoque baixo, distribuídos aos administradores depois da
+gravação.
+
+Execute com: python -m pytest test_estoque.py
+"""
+
+import json
+import sqlite3
+
+import pytest
+
+import estoque
+from conftest import ADMIN, FARMACIA, autorizacao, criar_receita
+
+
+def sincronizar(cliente, itens, completo=False):
+    corpo = itens if isinstance(itens, str) else ''.join(json.dumps(item) + '\n' for item in itens)
+    return cliente.put(f'/api/farmacias/{FARMACIA}/estoque' + ('?completo=1' if completo else ''),
+                       data=corpo.encode('utf-8'), content_type='application/x-ndjson',
+                       headers=autorizacao(ADMIN))
+
+
+def item(id_medicamento, quantidade, preco=10.0):
+    return {'id_medicamento': id_medicamento, 'preco_unitario': preco, 'quantidade_disponivel': quantidade}
+
+
+def saldos(banco_api):
+    with sqlite3.connect(banco_api) as conn:
+        return dict(conn.execute(
+            'SELECT id_medicamento, quantidade_disponivel FROM EstoqueFarmacia WHERE id_farmacia = ?',
+            (FARMACIA,)
+        ).fetchall())
+
+
+@pytest.fixture
+def medicamentos(banco_api):
+    """Mais três medicamentos (3 a 5), ainda sem estoque"""
+    with sqlite3.connect(banco_api) as conn:
+        conn.executemany(
+            "INSERT INTO Medicamento (id_medicamento, nome, principio_ativo, fabricante) VALUES (?, ?, ?, 'Lab C')",
+            [(id_medicamento, f'Medicamento {id_medicamento}', 'Teste') for id_medicamento in (3, 4, 5)]
+        )
+    return [1, 2, 3, 4, 5]
+
+
+def test_snapshot_parcial_mantem_os_itens_ausentes(cliente, banco_api):
+    resposta = sincronizar(cliente, [item(1, 40)])
+
+    assert resposta.status_code == 200, resposta.get_json()
+    assert resposta.get_json()['atualizados'] == 1
+    assert resposta.get_json()['zerados'] == 0
+    assert saldos(banco_api) == {1: 40, 2: 100}
+
+
+def test_snapshot_completo_zera_os_itens_ausentes(cliente, banco_api):
+    resposta = sincronizar(cliente, [item(1, 40)], completo=True)
+
+    assert resposta.status_code == 200, resposta.get_json()
+    assert resposta.get_json()['zerados'] == 1
+    assert saldos(banco_api) == {1: 40, 2: 0}
+
+
+def test_linha_malformada_informa_a_posicao(cliente, banco_api):
+    corpo = json.dumps(item(1, 40)) + '\n\n{"id_medicamento": 2,\n'
+
+    resposta = sincronizar(cliente, corpo)
+
+    assert resposta.status_code == 400
+    assert resposta.get_json()['message'] == 'Linha 3: JSON inválido'
+    assert saldos(banco_api) == {1: 100, 2: 100}
+
+
+def test_snapshot_maior_que_um_lote(cliente, banco_api, medicamentos, monkeypatch):
+    monkeypatch.setattr(estoque, 'ESTOQUE_LOTE', 2)
+
+    resposta = sincronizar(cliente, [item(id_medicamento, id_medicamento * 10) for id_medicamento in medicamentos],
+                           completo=True)
+
+    assert resposta.status_code == 200, resposta.get_json()
+    contagem = resposta.get_json()
+    assert (contagem['recebidos'], contagem['inseridos'], contagem['atualizados'], contagem['zerados']) == (5, 3, 2, 0)
+    assert saldos(banco_api) == {1: 10, 2: 20, 3: 30, 4: 40, 5: 50}
+
+
+def test_item_invalido_em_um_lote_posterior_cancela_o_snapshot(cliente, banco_api, medicamentos, monkeypatch):
+    monkeypatch.setattr(estoque, 'ESTOQUE_LOTE', 2)
+    itens = [item(id_medicamento, 7) for id_medicamento in medicamentos]
+    itens[4]['quantidade_disponivel'] = -1
+
+    resposta = sincronizar(cliente, itens, completo=True)
+
+    # Os dois primeiros lotes já foram gravados na transação, e são desfeitos
+    assert resposta.status_code == 400
+    assert resposta.get_json()['message'] == 'Item 5: quantidade_disponivel deve ser um inteiro >= 0'
+    assert saldos(banco_api) == {1: 100, 2: 100}
+
+
+@pytest.fixture
+def admins(banco_api):
+    """Um segundo administrador; os alertas vão para todos"""
+    with sqlite3.connect(banco_api) as conn:
+        conn.execute("INSERT INTO Usuario (id_usuario, nome, email, senha, tipo) "
+                     "VALUES (4, 'Admin Dois', 'admin2@teste.com', '-', 'admin')")
+    return [ADMIN, 4]
+
+
+def alertas(banco_api):
+    with sqlite3.connect(banco_api) as conn:
+        notificacoes = conn.execute(
+            "SELECT id_usuario, mensagem FROM Notificacao WHERE tipo = 'alerta' ORDER BY id_notificacao"
+        ).fetchall()
+        pendentes = conn.execute('SELECT COUNT(*) FROM AlertaEstoque').fetchone()[0]
+    return notificacoes, pendentes
+
+
+def test_alerta_de_estoque_baixo_na_sincronizacao(cliente, banco_api, admins):
+    resposta = sincronizar(cliente, [item(1, 3), item(2, 4)])
+
+    assert resposta.status_code == 200, resposta.get_json()
+    notificacoes, pendentes = alertas(banco_api)
+    assert pendentes == 0
+    assert sorted(id_usuario for id_usuario, _ in notificacoes) == [ADMIN, ADMIN, 4, 4]
+    assert (ADMIN, 'Estoque baixo: Dipirona 500mg em Farmácia Teste (3 unidades, mínimo 5)') in notificacoes
+
+
+def test_alerta_de_estoque_baixo_na_venda(cliente, banco_api, admins):
+    with sqlite3.connect(banco_api) as conn:
+        conn.execute('UPDATE EstoqueFarmacia SET quantidade_disponivel = 6 WHERE id_medicamento = 1')
+
+    resposta = cliente.post('/api/vendas', json={'id_receita': criar_receita(banco_api, itens=((1, 2),)),
+                                                 'id_farmacia': FARMACIA},
+                            headers=autorizacao(ADMIN))
+
+    assert resposta.status_code == 201, resposta.get_json()
+    notificacoes, pendentes = alertas(banco_api)
+    assert pendentes == 0
+    assert [id_usuario for id_usuario, _ in notificacoes] == admins
+
+
+def test_alerta_pendente_e_um_so_por_item(banco_api, admins):
+    with sqlite3.connect(banco_api) as conn:
+        # Cai, volta e cai de novo antes da distribuição
+        for quantidade in (3, 50, 2):
+            conn.execute('UPDATE EstoqueFarmacia SET quantidade_disponivel = ? WHERE id_medicamento = 1',
+                         (quantidade,))
+        assert conn.execute('SELECT id_medicamento, quantidade_disponivel FROM AlertaEstoque').fetchall() == [(1, 2)]
+        assert conn.execute('SELECT COUNT(*) FROM Notificacao').fetchone()[0] == 0
+        conn.commit()
+
+        assert estoque.distribuir_alertas(conn) == 2
+
+    notificacoes, pendentes = alertas(banco_api)
+    assert pendentes == 0
+    assert len(notificacoes) == 2
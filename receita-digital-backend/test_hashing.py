@@ -0,0 +1,53 @@
+"""
+Testes dos pools de hash de senha (hashing.py)
+
+Confere a verificação e o rehash no pool de login e que um pool com um
+processo morto é recriado em vez de derrubar todos os logins seguintes.
+
+Execute com: python -m pytest test_hashing.py
+"""
+
+import os
+import signal
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import hashing
+
+
+def _matar_processos(nome):
+    for processo in list(hashing._executor(nome)._processes.values()):
+        os.kill(processo.pid, signal.SIGKILL)
+        processo.join()
+
+
+def test_verificacao_e_rehash_com_o_metodo_atual():
+    antigo = generate_password_hash('segredo', method='pbkdf2:sha256:1000')
+
+    assert hashing.verificar_senha(antigo, 'errada') == (False, None)
+    confere, novo_hash = hashing.verificar_senha(antigo, 'segredo')
+    assert confere
+    assert novo_hash.startswith(hashing._prefixo(hashing.SENHA_METODO) + '$')
+    assert check_password_hash(novo_hash, 'segredo')
+    assert hashing.verificar_senha(novo_hash, 'segredo') == (True, None)
+
+
+def test_pool_de_login_com_processo_morto_e_recriado():
+    hash_senha = hashing.gerar_hashes(['segredo'])[0]
+    assert hashing.verificar_senha(hash_senha, 'segredo') == (True, None)
+    quebrado = hashing._executor('login')
+
+    _matar_processos('login')
+
+    assert hashing.verificar_senha(hash_senha, 'segredo') == (True, None)
+    assert hashing._executor('login') is not quebrado
+    assert hashing.verificar_senha(hash_senha, 'outra') == (False, None)
+
+
+def test_pool_de_cadastro_com_processo_morto_e_recriado():
+    hashing.gerar_hashes(['a'])
+    _matar_processos('cadastro')
+
+    hashes = hashing.gerar_hashes(['a', 'b', 'c'])
+
+    assert [check_password_hash(h, s) for h, s in zip(hashes, 'abc')] == [True, True, True]
@@ -0,0 +1,91 @@
+"""
+Testes da busca de pacientes (GET /api/pacientes/busca)
+
+Busca pelo CPF em formatos diferentes (coluna cpf_digitos, agora com índice
+único) e pelo nome sem acentos e por prefixo no índice FTS5 PacienteNome,
+inclusive depois de trocas de nome.
+
+Execute com: python -m pytest test_pacientes.py
+"""
+
+import sqlite3
+
+import pytest
+
+from conftest import ADMIN, MEDICO, PACIENTE, autorizacao
+
+
+def buscar(cliente, **parametros):
+    resposta = cliente.get('/api/pacientes/busca', query_string=parametros, headers=autorizacao(MEDICO))
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()
+
+
+def ids(pacientes):
+    return [paciente['id_paciente'] for paciente in pacientes]
+
+
+@pytest.fixture
+def pacientes(banco_api):
+    """Ids por nome; o CPF de cada um está gravado em um formato diferente"""
+    cadastro = {'jose': (10, 'José da Silva', '111.222.333-44'),
+                'joselia': (11, 'Josélia Araújo', '55566677788'),
+                'maria': (12, 'Maria José Souza', '999 888 777 66')}
+    with sqlite3.connect(banco_api) as conn:
+        for id_paciente, nome, cpf in cadastro.values():
+            conn.execute("INSERT INTO Usuario (id_usuario, nome, email, senha, tipo) VALUES (?, ?, ?, '-', 'paciente')",
+                         (id_paciente, nome, f'{id_paciente}@teste.com'))
+            conn.execute('INSERT INTO Paciente (id_paciente, cpf) VALUES (?, ?)', (id_paciente, cpf))
+    return {chave: id_paciente for chave, (id_paciente, _, _) in cadastro.items()}
+
+
+@pytest.mark.parametrize('cpf', ['111.222.333-44', '11122233344', '111 222 333 44', '111.222.333-44 '])
+def test_cpf_em_qualquer_formato(cliente, pacientes, cpf):
+    encontrados = buscar(cliente, cpf=cpf)
+
+    assert ids(encontrados) == [pacientes['jose']]
+    # Pelo CPF, o número vem completo e formatado
+    assert encontrados[0]['cpf'] == '111.222.333-44'
+
+
+def test_cpf_gravado_sem_pontuacao(cliente, pacientes):
+    assert ids(buscar(cliente, cpf='555.666.777-88')) == [pacientes['joselia']]
+    assert ids(buscar(cliente, cpf='99988877766')) == [pacientes['maria']]
+    assert ids(buscar(cliente, cpf='123.456.789-01')) == [PACIENTE]
+    assert buscar(cliente, cpf='000.000.000-00') == []
+
+
+def test_cpf_invalido(cliente, pacientes):
+    resposta = cliente.get('/api/pacientes/busca?cpf=123.456', headers=autorizacao(ADMIN))
+
+    assert resposta.status_code == 400
+
+
+def test_mesmo_cpf_em_outro_formato_e_recusado(banco_api, pacientes):
+    with sqlite3.connect(banco_api) as conn:
+        conn.execute("INSERT INTO Usuario (id_usuario, nome, email, senha, tipo) "
+                     "VALUES (20, 'Outro', 'outro@teste.com', '-', 'paciente')")
+        with pytest.raises(sqlite3.IntegrityError, match='cpf_digitos'):
+            conn.execute("INSERT INTO Paciente (id_paciente, cpf) VALUES (20, '11122233344')")
+
+
+def test_nome_sem_acentos_e_por_prefixo(cliente, pacientes):
+    # "jose" é prefixo de José e de Josélia
+    assert set(ids(buscar(cliente, nome='jose'))) == set(pacientes.values())
+    assert ids(buscar(cliente, nome='JOSÉ SIL')) == [pacientes['jose']]
+    assert ids(buscar(cliente, nome='joselia araujo')) == [pacientes['joselia']]
+    assert ids(buscar(cliente, nome='araú')) == [pacientes['joselia']]
+    # Médicos e admins não entram na busca de pacientes
+    assert buscar(cliente, nome='ana teste') == []
+
+    encontrados = buscar(cliente, nome='maria jose')
+    assert ids(encontrados) == [pacientes['maria']]
+    assert encontrados[0]['cpf'] == '***.888.777-**'
+
+
+def test_nome_segue_as_trocas(cliente, banco_api, pacientes):
+    with sqlite3.connect(banco_api) as conn:
+        conn.execute("UPDATE Usuario SET nome = 'José Ribeiro' WHERE id_usuario = ?", (pacientes['jose'],))
+
+    assert buscar(cliente, nome='jose sil') == []
+    assert ids(buscar(cliente, nome='ribeiro')) == [pacientes['jose']]
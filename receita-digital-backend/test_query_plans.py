@@ -0,0 +1,145 @@
+"""
+Verifica o plano de execução de cada consulta de queries.py
+
+Monta um banco com o schema, as migrações e dados do gerador mock (parte
+deles movida para o banco de arquivo) e roda EXPLAIN QUERY PLAN em cada
+SELECT. Falha se uma tabela quente for lida por varredura completa ou se a
+consulta precisar de ordenação temporária.
+
+Execute com: python -m pytest test_query_plans.py
+"""
+
+import os
+import random
+import re
+import sqlite3
+
+import pytest
+
+import arquivamento
+import db_monitor
+import migrate
+import mock_data_generator
+import queries
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+
+# Escala suficiente para o ANALYZE refletir a distribuição real dos dados
+RECEITAS = 20000
+PACIENTES = 1000
+MEDICOS = 50
+
+CONSULTAS = {
+    nome: sql for nome, sql in queries.all_queries().items()
+    if sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+}
+
+
+def _listas_de_receitas():
+    """
+    Listas montadas por campos (?fields= e ?view=resumo) como listar_receitas
+    as monta: a view resumo, cada campo sozinho (cada join e subconsulta) e
+    todos juntos, para cada filtro, sem e com o arquivo
+    """
+    projecoes = {'resumo': queries.CAMPOS_RESUMO, 'todos': tuple(queries.CAMPOS_LISTA_RECEITAS)}
+    projecoes.update((campo, (campo,)) for campo in queries.CAMPOS_LISTA_RECEITAS)
+    consultas = {}
+    for nome, campos in projecoes.items():
+        for filtro in ('paciente', 'medico', None):
+            base = f'lista_receitas[{nome}, {filtro or "todas"}'
+            consultas[f'{base}]'] = queries.lista_receitas(queries.colunas_lista_receitas(campos), filtro)
+            colunas = queries.colunas_lista_receitas(campos, com_arquivo=True)
+            consultas[f'{base}, com arquivo]'] = queries.lista_receitas(colunas, filtro)
+            consultas[f'{base}, arquivadas]'] = queries.lista_receitas(colunas, filtro, 'arquivo.')
+    return consultas
+
+
+CONSULTAS.update(_listas_de_receitas())
+
+
+@pytest.fixture(scope='module')
+def banco(tmp_path_factory):
+    caminho = str(tmp_path_factory.mktemp('planos') / 'planos.db')
+    with sqlite3.connect(caminho) as conn:
+        with open(os.path.join(AQUI, 'sqlite_backend_script.sql'), 'r', encoding='utf-8') as f:
+            conn.executescript(f.read())
+    migrate.apply_migrations(caminho, os.path.join(AQUI, 'migrations'))
+
+    rng = random.Random(42)
+    conn = mock_data_generator.connect(caminho)
+    _, medico_ids, paciente_ids = mock_data_generator.insert_mock_users(
+        conn, mock_data_generator.password_hashes(), MEDICOS, PACIENTES, rng
+    )
+    medicamento_ids = mock_data_generator.insert_mock_medicamentos(conn, 200, rng)
+    farmacia_ids = mock_data_generator.insert_mock_farmacias(conn, 30, rng)
+    mock_data_generator.insert_mock_receitas(
+        conn, medico_ids, paciente_ids, medicamento_ids, farmacia_ids,
+        RECEITAS, dias_historico=365, seed=42
+    )
+    conn.commit()
+
+    # Metade do histórico vai para o arquivo, anexado como na API
+    arquivo = str(tmp_path_factory.mktemp('planos') / 'arquivo.db')
+    arquivamento.arquivar(caminho, arquivo, meses=6)
+    conn.execute('ANALYZE')
+    conn.commit()
+    arquivamento.anexar(conn, arquivo)
+    yield conn
+    conn.close()
+
+
+def _usa_tabela_quente(sql):
+    return any(re.search(rf'\b{tabela}\b', sql) for tabela in db_monitor.HOT_TABLES)
+
+
+@pytest.mark.parametrize('nome', sorted(CONSULTAS))
+def test_sem_varredura_de_tabela_quente(banco, nome):
+    sql = CONSULTAS[nome]
+    plano = db_monitor.explain_query_plan(banco, sql, (1,) * sql.count('?'))
+    assert not db_monitor.tabelas_varridas(plano, sql), '\n'.join(plano)
+
+
+@pytest.mark.parametrize('nome', sorted(n for n, sql in CONSULTAS.items() if _usa_tabela_quente(sql)))
+def test_sem_ordenacao_temporaria(banco, nome):
+    sql = CONSULTAS[nome]
+    plano = db_monitor.explain_query_plan(banco, sql, (1,) * sql.count('?'))
+    ordenacoes = [passo for passo in plano if re.search(r'TEMP B-TREE FOR (ORDER|GROUP) BY', passo)]
+    assert not ordenacoes, '\n'.join(plano)
+
+
+def test_rotas_usam_queries_centralizadas():
+    with open(os.path.join(AQUI, 'app.py'), 'r', encoding='utf-8') as f:
+        codigo = f.read()
+    # Literais SQL passados direto para execute() fogem da verificação de planos
+    literais = re.findall(r'^[^#\n]*execute\(\s*[\'"]', codigo, flags=re.MULTILINE)
+    assert not literais, literais
+
+
+def test_busca_de_pacientes_usa_indices(banco):
+    # Paciente e Usuario não são tabelas quentes, mas a busca roda a cada
+    # receita criada e precisa continuar indexada com milhões de pacientes
+    plano = db_monitor.explain_query_plan(banco, queries.PACIENTES_POR_CPF, ('12345678901',))
+    assert any('idx_paciente_cpf_digitos' in passo for passo in plano), '\n'.join(plano)
+
+    plano = db_monitor.explain_query_plan(banco, queries.PACIENTES_POR_NOME, ('"jo"*', 20))
+    assert any('VIRTUAL TABLE INDEX' in passo for passo in plano), '\n'.join(plano)
+    assert not any(re.search(r'\bSCAN (u|p)\b', passo) for passo in plano), '\n'.join(plano)
+
+
+@pytest.mark.parametrize('nome, indice', [
+    ('USUARIOS_PAGINA', 'idx_usuario_nome'),
+    ('USUARIOS_DO_TIPO_PAGINA', 'idx_usuario_tipo_nome'),
+])
+def test_listagem_de_usuarios_segue_o_indice(banco, nome, indice):
+    sql = getattr(queries, nome)
+    plano = db_monitor.explain_query_plan(banco, sql, ('paciente',) * sql.count('?'))
+    assert any(indice in passo for passo in plano), '\n'.join(plano)
+    assert not any('TEMP B-TREE' in passo for passo in plano), '\n'.join(plano)
+
+
+@pytest.mark.parametrize('nome', ['USUARIOS_BUSCA_PAGINA', 'USUARIOS_DO_TIPO_BUSCA_PAGINA'])
+def test_busca_de_usuarios_parte_do_fts(banco, nome):
+    sql = getattr(queries, nome)
+    plano = db_monitor.explain_query_plan(banco, sql, ('"jo"*',) + (1,) * (sql.count('?') - 1))
+    assert 'VIRTUAL TABLE INDEX' in plano[0], '\n'.join(plano)
+    assert not any(re.search(r'\bSCAN u\b', passo) for passo in plano), '\n'.join(plano)
@@ -0,0 +1,121 @@
+"""
+Testes da listagem de usuários (GET /api/usuarios)
+
+Percorre as páginas pelo cursor (apos_nome, apos_id) com nomes repetidos e
+cadastros no meio do caminho, e confere os totais de UsuarioContagem e a
+busca em UsuarioBusca depois de inserções, remoções, trocas de tipo e de
+nome feitas direto no banco.
+
+Execute com: python -m pytest test_usuarios.py
+"""
+
+import sqlite3
+
+import pytest
+
+from conftest import ADMIN, PACIENTE, autorizacao
+
+NOMES = ['Maria Souza', 'Ana Lima', 'Maria Souza', 'Bruno Alves', 'Maria Souza', 'Ana Lima',
+         'Carla Dias', 'Bruno Alves', 'Élio Ramos', 'Ana Lima']
+
+
+def inserir(banco_api, nome, tipo='paciente'):
+    with sqlite3.connect(banco_api) as conn:
+        email = f'{len(nome)}.{conn.execute("SELECT MAX(id_usuario) FROM Usuario").fetchone()[0] + 1}@teste.com'
+        return conn.execute('INSERT INTO Usuario (nome, email, senha, tipo) VALUES (?, ?, ?, ?)',
+                            (nome, email, '-', tipo)).lastrowid
+
+
+def executar(banco_api, sql, *parametros):
+    with sqlite3.connect(banco_api) as conn:
+        conn.execute(sql, parametros)
+
+
+def listar(cliente, **parametros):
+    resposta = cliente.get('/api/usuarios', query_string=parametros, headers=autorizacao(ADMIN))
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()
+
+
+def paginas(cliente, durante=None, **parametros):
+    """Ids de todas as páginas, na ordem; durante() roda depois da primeira"""
+    ids, cursor = [], {}
+    while True:
+        pagina = listar(cliente, limite=3, **parametros, **cursor)
+        ids += [usuario['id_usuario'] for usuario in pagina['usuarios']]
+        if durante:
+            durante()
+            durante = None
+        if not pagina['proximo']:
+            return ids
+        cursor = pagina['proximo']
+
+
+def esperados(banco_api, onde='1', *parametros):
+    with sqlite3.connect(banco_api) as conn:
+        return [linha[0] for linha in conn.execute(
+            f'SELECT id_usuario FROM Usuario WHERE {onde} ORDER BY nome, id_usuario', parametros)]
+
+
+@pytest.fixture
+def usuarios(banco_api):
+    return [inserir(banco_api, nome, 'medico' if posicao % 3 == 0 else 'paciente')
+            for posicao, nome in enumerate(NOMES)]
+
+
+def test_paginas_sem_buracos_nem_repeticoes(cliente, banco_api, usuarios):
+    assert paginas(cliente) == esperados(banco_api)
+    assert paginas(cliente, tipo='paciente') == esperados(banco_api, "tipo = 'paciente'")
+
+
+def test_cadastros_durante_a_paginacao(cliente, banco_api, usuarios):
+    novos = []
+
+    def cadastrar():
+        # Um antes do cursor (não desloca as próximas páginas) e um depois
+        novos.extend([inserir(banco_api, 'Aaron Antes'), inserir(banco_api, 'Zeca Depois')])
+
+    ids = paginas(cliente, durante=cadastrar)
+
+    assert len(ids) == len(set(ids))
+    assert novos[0] not in ids and novos[1] in ids
+    assert ids == [id_usuario for id_usuario in esperados(banco_api) if id_usuario != novos[0]]
+
+
+def test_totais_acompanham_insercao_remocao_e_tipo(cliente, banco_api, usuarios):
+    def totais():
+        return listar(cliente, limite=1)['totais']
+
+    assert totais() == {'paciente': 7, 'medico': 5, 'admin': 1, 'todos': 13}
+
+    executar(banco_api, 'DELETE FROM Usuario WHERE id_usuario = ?', usuarios[1])
+    executar(banco_api, "UPDATE Usuario SET tipo = 'admin' WHERE id_usuario = ?", usuarios[0])
+    inserir(banco_api, 'Nova Admin', 'admin')
+    # Atualização que mantém o tipo não altera os totais
+    executar(banco_api, "UPDATE Usuario SET tipo = 'paciente' WHERE id_usuario = ?", PACIENTE)
+
+    assert totais() == {'paciente': 6, 'medico': 4, 'admin': 3, 'todos': 13}
+    with sqlite3.connect(banco_api) as conn:
+        assert dict(conn.execute('SELECT tipo, total FROM UsuarioContagem')) == dict(
+            conn.execute('SELECT tipo, COUNT(*) FROM Usuario GROUP BY tipo'))
+
+
+def test_busca_segue_as_trocas_de_nome(cliente, banco_api, usuarios):
+    def encontrados(busca):
+        return {usuario['id_usuario'] for usuario in listar(cliente, busca=busca)['usuarios']}
+
+    # Sem acentos e por prefixo
+    assert encontrados('elio') == {usuarios[8]}
+    assert encontrados('mar sou') == {usuarios[0], usuarios[2], usuarios[4]}
+
+    executar(banco_api, "UPDATE Usuario SET nome = 'Mariana Castro' WHERE id_usuario = ?", usuarios[2])
+    executar(banco_api, 'DELETE FROM Usuario WHERE id_usuario = ?', usuarios[4])
+
+    assert encontrados('mar sou') == {usuarios[0]}
+    assert encontrados('castro') == {usuarios[2]}
+    assert encontrados('maria') == {usuarios[0], usuarios[2]}
+    # E-mail também é buscado, quebrado nos pontos e no '@'
+    executar(banco_api, "UPDATE Usuario SET email = 'carla.nova@exemplo.com' WHERE id_usuario = ?", usuarios[6])
+    assert encontrados('exemplo') == {usuarios[6]}
+    assert {usuario['id_usuario'] for usuario in listar(cliente, busca='maria', tipo='medico')['usuarios']} == {
+        usuarios[0]}
@@ -0,0 +1,95 @@
+"""
+Testes do registro de vendas (POST /api/vendas) sob concorrência
+
+Dois terminais disputando o mesmo estoque ou a mesma receita: só uma venda
+pode passar, o estoque nunca fica negativo e a perdedora recebe 409.
+
+Execute com: python -m pytest test_vendas.py
+"""
+
+import sqlite3
+import threading
+
+from conftest import ADMIN, FARMACIA, autorizacao, criar_receita
+
+
+def vender(cliente, id_receita):
+    return cliente.post('/api/vendas', json={'id_receita': id_receita, 'id_farmacia': FARMACIA},
+                        headers=autorizacao(ADMIN))
+
+
+def vender_ao_mesmo_tempo(banco_api, ids_receitas):
+    """Status das vendas disparadas juntas, uma thread (e um cliente) por receita"""
+    import app as api
+
+    inicio = threading.Barrier(len(ids_receitas))
+    status = [None] * len(ids_receitas)
+
+    def terminal(posicao, id_receita):
+        cliente = api.app.test_client()
+        inicio.wait()
+        status[posicao] = vender(cliente, id_receita).status_code
+
+    threads = [threading.Thread(target=terminal, args=item) for item in enumerate(ids_receitas)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return status
+
+
+def estoque(banco_api, id_medicamento):
+    with sqlite3.connect(banco_api) as conn:
+        return conn.execute(
+            'SELECT quantidade_disponivel FROM EstoqueFarmacia WHERE id_farmacia = ? AND id_medicamento = ?',
+            (FARMACIA, id_medicamento)
+        ).fetchone()[0]
+
+
+def vendas(banco_api):
+    with sqlite3.connect(banco_api) as conn:
+        return conn.execute('SELECT COUNT(*) FROM Venda').fetchone()[0]
+
+
+def test_estoque_para_uma_venda_so(banco_api):
+    with sqlite3.connect(banco_api) as conn:
+        conn.execute('UPDATE EstoqueFarmacia SET quantidade_disponivel = 3 WHERE id_medicamento = 1')
+    receitas = [criar_receita(banco_api, itens=((1, 2),)) for _ in range(2)]
+
+    status = vender_ao_mesmo_tempo(banco_api, receitas)
+
+    assert sorted(status) == [201, 409]
+    assert estoque(banco_api, 1) == 1
+    assert vendas(banco_api) == 1
+
+
+def test_mesma_receita_em_dois_terminais(banco_api):
+    id_receita = criar_receita(banco_api, itens=((1, 2), (2, 1)))
+
+    status = vender_ao_mesmo_tempo(banco_api, [id_receita, id_receita])
+
+    assert sorted(status) == [201, 409]
+    assert (estoque(banco_api, 1), estoque(banco_api, 2)) == (98, 99)
+    assert vendas(banco_api) == 1
+
+
+def test_receita_ja_utilizada(cliente, banco_api):
+    id_receita = criar_receita(banco_api, status='utilizada')
+
+    resposta = vender(cliente, id_receita)
+
+    assert resposta.status_code == 409
+    assert estoque(banco_api, 1) == 100
+
+
+def test_trigger_da_venda_desfaz_a_baixa(cliente, banco_api):
+    # Ativa, mas vencida: passa pela leitura da rota e é recusada pelo
+    # trigger check_receita_validade_before_venda (IntegrityError)
+    id_receita = criar_receita(banco_api, validade='2000-01-01')
+
+    resposta = vender(cliente, id_receita)
+
+    assert resposta.status_code == 409
+    assert resposta.get_json()['message'] == 'Receita expirada'
+    assert (estoque(banco_api, 1), estoque(banco_api, 2)) == (100, 100)
+    assert vendas(banco_api) == 0
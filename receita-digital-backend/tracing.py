@@ -0,0 +1,258 @@
+"""
+Tracing leve por spans
+
+Cada requisição amostrada recebe um trace id (ou herda o do cabeçalho W3C
+traceparent) e os spans abertos durante ela (autenticação, instruções SQL,
+chamadas de notificação) ficam ligados a ele. Os spans finalizados são
+exportados em segundo plano para um arquivo JSON por linha ou, se
+OTEL_EXPORTER_OTLP_ENDPOINT estiver definido, para um coletor OTLP/HTTP.
+
+TRACE_SAMPLE_RATE controla a fração de requisições amostradas (0 desliga).
+Requisições não amostradas não criam spans. A decisão de amostragem de um
+traceparent recebido só é seguida com o tracing ligado, ou com
+TRACE_HONOR_PARENT: senão qualquer cliente forçaria a gravação de spans.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from flask import g, request
+
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+TRACE_HONOR_PARENT = os.getenv('TRACE_HONOR_PARENT', '').lower() in ('1', 'true', 'sim')
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'receita-digital-backend')
+
+# Spans aguardando exportação; quando a fila enche os novos são descartados
+TRACE_QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', '10000'))
+TRACE_BATCH_SIZE = 512
+
+_span_atual = contextvars.ContextVar('span_atual', default=None)
+_fila = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+_exportador = None
+_exportador_lock = threading.Lock()
+descartados = 0
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'nome', 'atributos',
+                 'inicio', 'fim', 'erro')
+
+    def __init__(self, nome, trace_id, parent_id=None, atributos=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.nome = nome
+        self.atributos = atributos or {}
+        self.inicio = time.time_ns()
+        self.fim = None
+        self.erro = None
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'nome': self.nome,
+            'inicio_ns': self.inicio,
+            'duracao_ms': round((self.fim - self.inicio) / 1e6, 3),
+            'atributos': self.atributos,
+            'erro': self.erro
+        }
+
+
+def current_trace_id():
+    """Trace id da requisição atual, ou None se ela não foi amostrada"""
+    span = _span_atual.get()
+    return span.trace_id if span else None
+
+
+def start_trace(nome, traceparent=None, atributos=None):
+    """
+    Decide a amostragem e abre o span raiz da requisição. Retorna o token
+    usado em end_trace, ou None quando a requisição não foi amostrada.
+    """
+    trace_id, parent_id, amostrado = None, None, None
+
+    # Formato W3C: versão-traceid-parentid-flags; o bit 0 das flags é "amostrado"
+    if traceparent and (TRACE_SAMPLE_RATE > 0 or TRACE_HONOR_PARENT):
+        partes = traceparent.split('-')
+        if len(partes) == 4 and len(partes[1]) == 32 and len(partes[2]) == 16:
+            try:
+                flags = int(partes[3], 16)
+            except ValueError:
+                flags = None
+            if flags is not None:
+                trace_id, parent_id = partes[1], partes[2]
+                amostrado = bool(flags & 1)
+
+    if amostrado is None:
+        amostrado = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    if not amostrado:
+        return None
+
+    span = Span(nome, trace_id or os.urandom(16).hex(), parent_id, atributos)
+    return _span_atual.set(span)
+
+
+def end_trace(token, atributos=None, erro=None):
+    """Fecha o span raiz aberto por start_trace"""
+    span = _span_atual.get()
+    _span_atual.reset(token)
+    if span is None:
+        return
+    if atributos:
+        span.atributos.update(atributos)
+    span.erro = erro
+    _finalizar(span)
+
+
+@contextmanager
+def span(nome, atributos=None):
+    """Abre um span filho do span atual; não faz nada fora de um trace amostrado"""
+    pai = _span_atual.get()
+    if pai is None:
+        yield None
+        return
+
+    atual = Span(nome, pai.trace_id, pai.span_id, atributos)
+    token = _span_atual.set(atual)
+    try:
+        yield atual
+    except Exception as e:
+        atual.erro = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        _span_atual.reset(token)
+        _finalizar(atual)
+
+
+def _finalizar(span):
+    global descartados
+
+    span.fim = time.time_ns()
+    _iniciar_exportador()
+    try:
+        _fila.put_nowait(span)
+    except queue.Full:
+        descartados += 1
+
+
+def _iniciar_exportador():
+    global _exportador
+
+    if _exportador is not None and _exportador.is_alive():
+        return
+    with _exportador_lock:
+        if _exportador is None or not _exportador.is_alive():
+            _exportador = threading.Thread(target=_exportar_continuamente, daemon=True)
+            _exportador.start()
+
+
+def _exportar_continuamente():
+    while True:
+        lote = [_fila.get()]
+        while len(lote) < TRACE_BATCH_SIZE:
+            try:
+                lote.append(_fila.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if OTLP_ENDPOINT:
+                _exportar_otlp(lote)
+            else:
+                _exportar_arquivo(lote)
+        except Exception:
+            # O lote é perdido, mas a thread exportadora continua
+            logger.exception('Erro ao exportar %d span(s)', len(lote))
+
+
+def _exportar_arquivo(lote):
+    with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+        for span in lote:
+            f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + '\n')
+
+
+def _otlp_valor(valor):
+    if isinstance(valor, bool):
+        return {'boolValue': valor}
+    if isinstance(valor, int):
+        return {'intValue': str(valor)}
+    if isinstance(valor, float):
+        return {'doubleValue': valor}
+    return {'stringValue': str(valor)}
+
+
+def _exportar_otlp(lote):
+    spans = []
+    for span in lote:
+        item = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.nome,
+            'kind': 1,
+            'startTimeUnixNano': str(span.inicio),
+            'endTimeUnixNano': str(span.fim),
+            'attributes': [
+                {'key': chave, 'value': _otlp_valor(valor)}
+                for chave, valor in span.atributos.items()
+            ],
+            'status': {'code': 2, 'message': span.erro} if span.erro else {'code': 1}
+        }
+        if span.parent_id:
+            item['parentSpanId'] = span.parent_id
+        spans.append(item)
+
+    payload = {
+        'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}
+            ]},
+            'scopeSpans': [{'scope': {'name': 'receita_digital'}, 'spans': spans}]
+        }]
+    }
+    requests.post(
+        OTLP_ENDPOINT.rstrip('/') + '/v1/traces',
+        json=payload,
+        headers={'Content-Type': 'application/json'},
+        timeout=5
+    )
+
+
+def init_app(app):
+    """Abre e fecha o span raiz de cada requisição"""
+
+    @app.before_request
+    def iniciar_trace():
+        g.trace_token = start_trace(
+            f'{request.method} {request.path}',
+            request.headers.get('traceparent'),
+            {'http.method': request.method, 'http.target': request.path}
+        )
+
+    @app.after_request
+    def identificar_trace(response):
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers['X-Trace-Id'] = trace_id
+            _span_atual.get().atributos['http.status_code'] = response.status_code
+        return response
+
+    @app.teardown_request
+    def encerrar_trace(exc):
+        token = g.pop('trace_token', None)
+        if token is None:
+            return
+        atributos = {'http.route': request.url_rule.rule} if request.url_rule else None
+        end_trace(token, atributos, erro=str(exc) if exc else None)
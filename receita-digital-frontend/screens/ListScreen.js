@@ -73,7 +73,7 @@ export default function ListScreen({ route, navigation }) {
     try {
       const token = await AsyncStorage.getItem('userToken');
       
-      const response = await fetch(`${API_URL}/receitas`, {
+      const response = await fetch(`${API_URL}/receitas?view=resumo`, {
         method: 'GET',
         headers: {
           'Authorization': `Bearer ${token}`,
@@ -113,7 +113,7 @@ export default function ListScreen({ route, navigation }) {
 
   const getItensPrescritos = (receita) => {
     const tipos = [];
-    if (receita.medicamentos && receita.medicamentos.length > 0) {
+    if (receita.total_medicamentos > 0 || (receita.medicamentos && receita.medicamentos.length > 0)) {
       tipos.push('MEDICAMENTOS');
     }
     if (receita.exames && receita.exames.length > 0) {